@@ -193,9 +193,10 @@ def orders():
         limit = 200
 
     sql = ("SELECT * FROM orders WHERE status = ? "
-           "AND substr(COALESCE(date_completed, email_date, date_received), 1, 10) >= ?")
+           "AND completed_date >= ?")
     werte = [status, ab or "0000-01-01"]
-    sql += " ORDER BY COALESCE(date_completed, email_date, date_received) DESC LIMIT ?"
+    sql += (" ORDER BY completed_date DESC, "
+            "COALESCE(date_completed, email_date, date_received) DESC LIMIT ?")
     werte.append(limit)
 
     with _db() as conn:
@@ -24,21 +24,35 @@ Porto — die eiserne Regel
     sondern nur einen Bestandsabgang plus einen historisch eingefrorenen
     Portowert. Der Versand-Überschuss (vereinnahmter Versand minus echtes
     Porto) entsteht dadurch automatisch als Gewinn und wird nicht gebucht.
+
+Festschreibung
+    Ein abgelaufenes Geschäftsjahr wird mit ``close_year`` abgeschlossen: seine
+    Werte liegen danach signiert in ``jahresabschluss``, Auswertungen lesen sie
+    von dort, und Trigger lassen in diesem Jahr nichts mehr zu. Von der
+    Kommandozeile::
+
+        python -m TCGInventory.bookkeeping abschluss 2026
+        python -m TCGInventory.bookkeeping pruefen
 """
 
 from __future__ import annotations
 
+import calendar
 import csv
 import hashlib
+import hmac
 import io
+import json
 import os
-import re
 import sqlite3
-from datetime import datetime
+import tempfile
+import time
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Sequence, Tuple
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
 
 from . import DB_FILE
+from .schreiber import verbinde
 
 # ---------------------------------------------------------------------------
 # Kategorien (fest vorgegeben, erweiterbar)
@@ -64,6 +78,10 @@ KAT_PORTO = "Porto/Briefmarken"
 
 BELEGE_DIR = Path(__file__).resolve().parent / "data" / "belege"
 ALLOWED_RECEIPT_EXT = {".pdf", ".jpg", ".jpeg", ".png"}
+# Belege werden in Blöcken dieser Größe (Bytes) vom Upload auf die Platte kopiert.
+BELEG_BLOCK = 1 << 16
+# Größte Kantenlänge (Pixel) der Vorschaubilder in Listen.
+VORSCHAU_GROESSE = (240, 240)
 
 CSV_DELIMITER = ";"
 CSV_ENCODING = "utf-8-sig"
@@ -120,11 +138,31 @@ def de_date(value) -> str:
 
 
 def _connect(db_file: Optional[str] = None) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_file or DB_FILE)
+    conn = verbinde(db_file or DB_FILE)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+_FESTGESCHRIEBEN = ("Geschäftsjahr {jahr} ist abgeschlossen – Korrekturen bitte im "
+                    "laufenden Jahr buchen.")
+
+
+def _pruefe_offen(conn: sqlite3.Connection, *daten: Optional[str]) -> None:
+    """``ValueError``, wenn eines der Daten in ein abgeschlossenes Jahr fällt.
+
+    Die Trigger in ``setup_db.py`` erzwingen dasselbe; hier gibt es vorher
+    eine verständliche Meldung statt eines halb ausgeführten Vorgangs.
+    """
+    jahre = [str(d)[:4] for d in daten if d]
+    if not jahre:
+        return
+    row = conn.execute(
+        f"SELECT jahr FROM jahresabschluss WHERE jahr IN ({', '.join('?' for _ in jahre)}) "
+        f"LIMIT 1", jahre).fetchone()
+    if row:
+        raise ValueError(_FESTGESCHRIEBEN.format(jahr=row[0]))
+
+
 # ---------------------------------------------------------------------------
 # Buchen (append-only)
 # ---------------------------------------------------------------------------
@@ -143,13 +181,15 @@ def add_booking(
     """Neue Buchung anhängen und deren ``id`` zurückgeben.
 
     ``lfd_nr`` wird systemvergeben und ist fortlaufend und lückenlos (es gibt
-    keine Löschungen).
+    keine Löschungen). In ein abgeschlossenes Geschäftsjahr wird nicht mehr
+    gebucht.
     """
     if art not in ("einnahme", "ausgabe", "storno"):
         raise ValueError(f"Ungültige Buchungsart: {art}")
     with _connect(db_file) as conn:
         c = conn.cursor()
         c.execute("BEGIN IMMEDIATE")
+        _pruefe_offen(conn, buchungsdatum, zahlungseingang_am)
         next_nr = c.execute("SELECT COALESCE(MAX(lfd_nr), 0) + 1 FROM journal").fetchone()[0]
         c.execute(
             """
@@ -172,7 +212,8 @@ def storno_booking(buchung_id: int, grund: str = "", db_file: Optional[str] = No
 
     Die ursprüngliche Buchung bleibt unverändert; nur ihr Rückverweis
     ``storniert_durch`` wird einmalig nachgetragen. Ein Storno kann selbst nicht
-    storniert werden, eine Buchung nicht zweimal.
+    storniert werden, eine Buchung nicht zweimal — und keine aus einem
+    abgeschlossenen Geschäftsjahr (dort wird im laufenden Jahr gegengebucht).
     """
     with _connect(db_file) as conn:
         row = conn.execute("SELECT * FROM journal WHERE id = ?", (buchung_id,)).fetchone()
@@ -182,6 +223,7 @@ def storno_booking(buchung_id: int, grund: str = "", db_file: Optional[str] = No
             raise ValueError("Eine Stornobuchung kann nicht storniert werden")
         if row["storniert_durch"] is not None:
             raise ValueError("Buchung ist bereits storniert")
+        _pruefe_offen(conn, row["buchungsdatum"], row["zahlungseingang_am"])
 
     text = f"Storno zu Buchung #{row['lfd_nr']}"
     if grund:
@@ -232,44 +274,12 @@ def order_already_booked(order_id: int, db_file: Optional[str] = None) -> bool:
     return row is not None
 
 
-def _set_pruefgrund(order_id: int, grund: Optional[str], db_file: Optional[str] = None) -> None:
-    with _connect(db_file) as conn:
-        conn.execute("UPDATE orders SET buchung_pruefen = ? WHERE id = ?", (grund, order_id))
-        conn.commit()
-
+def _plane_uebernahme(o, items) -> Tuple[List[Tuple[str, str, str, int, str]], List[str]]:
+    """Die drei Übernahme-Buchungen einer Bestellung plus Prüfhinweise.
 
-def book_order(order_id: int, db_file: Optional[str] = None) -> List[int]:
-    """Eine versendete Bestellung übernehmen — erzeugt **genau drei** Buchungen:
-
-      * ``Warenverkauf`` (Einnahme)              = Gesamtwert − Versandkosten
-      * ``Vereinnahmte Versandkosten`` (Einnahme) = Versandkosten aus der Mail
-      * ``Cardmarket-Gebühren`` (Ausgabe)         = Gebühren aus der Mail
-
-    Das tatsächliche Porto wird hier **nicht** gebucht — es ist bereits beim
-    Kauf der Briefmarke als Ausgabe erfasst.
-
-    Buchungsdatum ist das **Versanddatum**; der steuerlich maßgebliche Zufluss
-    wird separat über die Auszahlung gesetzt. Auffälligkeiten (fehlende
-    Versandkosten, unstimmige Summen) landen in der Prüfliste — es wird nichts
-    stillschweigend korrigiert. Eine Bestellung kann nur einmal übernommen
-    werden (zusätzlich per UNIQUE-Index abgesichert).
+    Liefert ``(datum, art, kategorie, betrag_cent, beschreibung)`` je Buchung;
+    geschrieben wird hier nichts.
     """
-    with _connect(db_file) as conn:
-        o = conn.execute(
-            "SELECT id, order_number, buyer_name, email_date, date_received, "
-            "date_completed, amount_gesamt, amount_gesamtwert, amount_versand, "
-            "amount_gebuehren FROM orders WHERE id = ?",
-            (order_id,),
-        ).fetchone()
-        if not o:
-            raise ValueError("Bestellung nicht gefunden")
-        items = conn.execute(
-            "SELECT quantity, unit_price FROM order_items WHERE order_id = ?",
-            (order_id,),
-        ).fetchall()
-    if order_already_booked(order_id, db_file):
-        raise ValueError("Diese Bestellung wurde bereits übernommen")
-
     hinweise: List[str] = []
 
     versand_cent = to_cent(o["amount_versand"])
@@ -303,18 +313,112 @@ def book_order(order_id: int, db_file: Optional[str] = None) -> List[int]:
         )
 
     datum = str(o["date_completed"] or o["email_date"] or o["date_received"] or "")[:10]
-    ref = f"Bestellung {o['order_number'] or order_id} ({o['buyer_name'] or ''})".strip()
-
-    ids = [
-        add_booking(datum, "einnahme", KAT_WARENVERKAUF, waren_cent, ref,
-                    bestellung_id=order_id, db_file=db_file),
-        add_booking(datum, "einnahme", KAT_VERSANDEINNAHME, versand_cent, ref,
-                    bestellung_id=order_id, db_file=db_file),
-        add_booking(datum, "ausgabe", KAT_GEBUEHREN, gebuehren_cent, ref,
-                    bestellung_id=order_id, db_file=db_file),
-    ]
-    _set_pruefgrund(order_id, "; ".join(hinweise) if hinweise else None, db_file)
-    return ids
+    ref = f"Bestellung {o['order_number'] or o['id']} ({o['buyer_name'] or ''})".strip()
+    return [
+        (datum, "einnahme", KAT_WARENVERKAUF, waren_cent, ref),
+        (datum, "einnahme", KAT_VERSANDEINNAHME, versand_cent, ref),
+        (datum, "ausgabe", KAT_GEBUEHREN, gebuehren_cent, ref),
+    ], hinweise
+
+
+def book_orders(order_ids: Optional[Sequence[int]] = None,
+                db_file: Optional[str] = None) -> List[dict]:
+    """Mehrere Bestellungen in **einer** Transaktion übernehmen.
+
+    Ohne ``order_ids`` alle ``bookable_orders``. Je Bestellung entstehen die
+    drei Buchungen wie bei ``book_order``; die ``lfd_nr`` werden einmal
+    fortlaufend vergeben und alle Zeilen per ``executemany`` geschrieben.
+
+    Ergebnis je Bestellung (in Eingabereihenfolge): ``order_id``, ``ok``,
+    ``buchung_ids``, ``hinweise`` und bei Ablehnung ``fehler`` (nicht
+    gefunden, bereits übernommen, Versanddatum in einem abgeschlossenen
+    Geschäftsjahr). Abgelehnte Bestellungen halten die übrigen
+    nicht auf; schlägt das Schreiben selbst fehl, wird nichts gebucht.
+    """
+    with _connect(db_file) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if order_ids is None:
+            order_ids = [r["id"] for r in conn.execute(_BOOKABLE_SQL, (GESCHAEFTSBEGINN,))]
+        order_ids = list(dict.fromkeys(int(i) for i in order_ids))
+        if not order_ids:
+            conn.rollback()
+            return []
+        marken = ", ".join("?" for _ in order_ids)
+        orders = {o["id"]: o for o in conn.execute(
+            "SELECT id, order_number, buyer_name, email_date, date_received, "
+            "date_completed, amount_gesamt, amount_gesamtwert, amount_versand, "
+            f"amount_gebuehren FROM orders WHERE id IN ({marken})", order_ids)}
+        items: Dict[int, list] = {}
+        for it in conn.execute(
+            f"SELECT order_id, quantity, unit_price FROM order_items "
+            f"WHERE order_id IN ({marken})", order_ids,
+        ):
+            items.setdefault(it["order_id"], []).append(it)
+        gebucht = {r[0] for r in conn.execute(
+            f"SELECT DISTINCT bestellung_id FROM journal WHERE bestellung_id IN ({marken}) "
+            f"AND art <> 'storno' AND storniert_durch IS NULL AND kategorie IN (?, ?, ?)",
+            order_ids + [KAT_WARENVERKAUF, KAT_VERSANDEINNAHME, KAT_GEBUEHREN])}
+        abgeschlossen = {r[0] for r in conn.execute("SELECT jahr FROM jahresabschluss")}
+
+        next_nr = conn.execute("SELECT COALESCE(MAX(lfd_nr), 0) + 1 FROM journal").fetchone()[0]
+        erster_nr = next_nr
+        erfasst = datetime.now().isoformat()
+        zeilen, pruefgruende, ergebnisse = [], [], []
+        for oid in order_ids:
+            ergebnis = {"order_id": oid, "ok": False, "buchung_ids": [], "hinweise": []}
+            ergebnisse.append(ergebnis)
+            if oid not in orders:
+                ergebnis["fehler"] = "Bestellung nicht gefunden"
+                continue
+            if oid in gebucht:
+                ergebnis["fehler"] = "Diese Bestellung wurde bereits übernommen"
+                continue
+            buchungen, hinweise = _plane_uebernahme(orders[oid], items.get(oid, []))
+            if buchungen[0][0][:4] in abgeschlossen:
+                ergebnis["fehler"] = _FESTGESCHRIEBEN.format(jahr=buchungen[0][0][:4])
+                continue
+            ergebnis.update(ok=True, hinweise=hinweise, lfd_nr=[])
+            for datum, art, kategorie, cent, ref in buchungen:
+                zeilen.append((next_nr, erfasst, datum, art, kategorie, cent, ref, oid))
+                ergebnis["lfd_nr"].append(next_nr)
+                next_nr += 1
+            pruefgruende.append(("; ".join(hinweise) if hinweise else None, oid))
+
+        if zeilen:
+            conn.executemany(
+                "INSERT INTO journal (lfd_nr, erfasst_am, buchungsdatum, art, kategorie, "
+                "betrag_cent, beschreibung, bestellung_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                zeilen,
+            )
+            conn.executemany("UPDATE orders SET buchung_pruefen = ? WHERE id = ?", pruefgruende)
+            ids = dict(conn.execute(
+                "SELECT lfd_nr, id FROM journal WHERE lfd_nr >= ?", (erster_nr,)).fetchall())
+            for ergebnis in ergebnisse:
+                ergebnis["buchung_ids"] = [ids[nr] for nr in ergebnis.pop("lfd_nr", [])]
+        conn.commit()
+    return ergebnisse
+
+
+def book_order(order_id: int, db_file: Optional[str] = None) -> List[int]:
+    """Eine versendete Bestellung übernehmen — erzeugt **genau drei** Buchungen:
+
+      * ``Warenverkauf`` (Einnahme)              = Gesamtwert − Versandkosten
+      * ``Vereinnahmte Versandkosten`` (Einnahme) = Versandkosten aus der Mail
+      * ``Cardmarket-Gebühren`` (Ausgabe)         = Gebühren aus der Mail
+
+    Das tatsächliche Porto wird hier **nicht** gebucht — es ist bereits beim
+    Kauf der Briefmarke als Ausgabe erfasst.
+
+    Buchungsdatum ist das **Versanddatum**; der steuerlich maßgebliche Zufluss
+    wird separat über die Auszahlung gesetzt. Auffälligkeiten (fehlende
+    Versandkosten, unstimmige Summen) landen in der Prüfliste — es wird nichts
+    stillschweigend korrigiert. Eine Bestellung kann nur einmal übernommen
+    werden (zusätzlich per UNIQUE-Index abgesichert).
+    """
+    (ergebnis,) = book_orders([order_id], db_file)
+    if not ergebnis["ok"]:
+        raise ValueError(ergebnis["fehler"])
+    return ergebnis["buchung_ids"]
 
 
 def pruefliste(db_file: Optional[str] = None) -> List[dict]:
@@ -329,6 +433,24 @@ def pruefliste(db_file: Optional[str] = None) -> List[dict]:
     return [dict(r) for r in rows]
 
 
+#: Versendete, noch nicht übernommene Bestellungen ab ``?`` (Geschäftsbeginn).
+_BOOKABLE_SQL = """
+    SELECT o.id, o.order_number, o.buyer_name,
+           COALESCE(o.date_completed, o.email_date, o.date_received) AS datum,
+           o.amount_gesamt, o.amount_versand, o.amount_gebuehren,
+           o.amount_auszahlung
+    FROM orders o
+    WHERE o.status = 'sold'
+      AND o.completed_date >= ?
+      AND NOT EXISTS (SELECT 1 FROM journal j
+                      WHERE j.bestellung_id = o.id AND j.art <> 'storno'
+                        AND j.storniert_durch IS NULL
+                        AND j.kategorie IN ('Warenverkauf',
+                            'Vereinnahmte Versandkosten', 'Cardmarket-Gebühren'))
+    ORDER BY datum DESC
+"""
+
+
 def bookable_orders(db_file: Optional[str] = None) -> List[dict]:
     """Versendete Bestellungen ab Geschäftsbeginn, die noch nicht gebucht sind.
 
@@ -336,23 +458,7 @@ def bookable_orders(db_file: Optional[str] = None) -> List[dict]:
     sie stammen aus der Zeit vor der Gründung und gehören nicht in die EÜR.
     """
     with _connect(db_file) as conn:
-        rows = conn.execute(
-            """
-            SELECT o.id, o.order_number, o.buyer_name,
-                   COALESCE(o.date_completed, o.email_date, o.date_received) AS datum,
-                   o.amount_gesamt, o.amount_versand, o.amount_gebuehren,
-                   o.amount_auszahlung
-            FROM orders o
-            WHERE o.status = 'sold'
-              AND substr(COALESCE(o.date_completed, o.email_date, o.date_received), 1, 10) >= ?
-              AND NOT EXISTS (SELECT 1 FROM journal j
-                              WHERE j.bestellung_id = o.id AND j.art <> 'storno'
-                                AND j.storniert_durch IS NULL
-                                AND j.kategorie IN ('Warenverkauf',
-                                    'Vereinnahmte Versandkosten', 'Cardmarket-Gebühren'))
-            ORDER BY datum DESC
-            """, (GESCHAEFTSBEGINN,)
-        ).fetchall()
+        rows = conn.execute(_BOOKABLE_SQL, (GESCHAEFTSBEGINN,)).fetchall()
     return [dict(r) for r in rows]
 
 
@@ -364,7 +470,7 @@ def count_vor_geschaeftsbeginn(db_file: Optional[str] = None) -> int:
     with _connect(db_file) as conn:
         return conn.execute(
             "SELECT COUNT(*) FROM orders o WHERE o.status = 'sold' "
-            "AND substr(COALESCE(o.date_completed, o.email_date, o.date_received), 1, 10) < ? "
+            "AND o.completed_date < ? "
             "AND NOT EXISTS (SELECT 1 FROM journal j WHERE j.bestellung_id = o.id "
             "AND j.art <> 'storno' AND j.storniert_durch IS NULL)",
             (GESCHAEFTSBEGINN,)
@@ -374,40 +480,75 @@ def count_vor_geschaeftsbeginn(db_file: Optional[str] = None) -> int:
 # ---------------------------------------------------------------------------
 # Briefmarken: Stammdaten, Kauf (bucht), Verbrauch (bucht NIE)
 # ---------------------------------------------------------------------------
+_MARKENART_SQL = ("SELECT id, bezeichnung, nennwert_cent, aktiv, bestand_korrektur, "
+                  "gekauft, verbraucht FROM markenart")
+
+
+def _markenart(row) -> dict:
+    m = dict(row)
+    # Nie unter null: ein negativer Bestand waere physisch unmöglich und
+    # nur ein Zeichen für inkonsistente Daten.
+    m["bestand"] = max(0, m["bestand_korrektur"] + m["gekauft"] - m["verbraucht"])
+    m["warnung"] = m["aktiv"] == 1 and m["bestand"] < BESTAND_WARNUNG
+    return m
+
+
 def list_markenarten(only_active: bool = False, db_file: Optional[str] = None) -> List[dict]:
-    """Markenarten inkl. abgeleitetem Bestand.
+    """Markenarten inkl. Bestand.
 
     Bestand = Inventurkorrektur + gekaufte Stück (ohne stornierte Käufe)
-              − verbrauchte Stück.
+              − verbrauchte Stück. Gekauft und verbraucht sind Zähler in
+    ``markenart``, die Trigger bei Kauf, Verbrauch, Rücknahme und Storno
+    fortschreiben (siehe ``verify_markenbestand``).
     """
+    q = _MARKENART_SQL
+    if only_active:
+        q += " WHERE aktiv = 1"
+    q += " ORDER BY aktiv DESC, nennwert_cent"
     with _connect(db_file) as conn:
-        q = """
-            SELECT m.id, m.bezeichnung, m.nennwert_cent, m.aktiv, m.bestand_korrektur,
+        return [_markenart(r) for r in conn.execute(q).fetchall()]
+
+
+def get_markenart(markenart_id: int, db_file: Optional[str] = None) -> Optional[dict]:
+    with _connect(db_file) as conn:
+        row = conn.execute(_MARKENART_SQL + " WHERE id = ?", (int(markenart_id),)).fetchone()
+    return _markenart(row) if row else None
+
+
+def verify_markenbestand(repair: bool = False, db_file: Optional[str] = None) -> List[dict]:
+    """Bestandszähler gegen Käufe und Verbräuche nachrechnen.
+
+    Gibt die Markenarten mit abweichenden Zählern zurück (``soll``/``ist``
+    je ``gekauft`` und ``verbraucht``); mit ``repair`` werden sie korrigiert.
+    """
+    with _connect(db_file) as conn:
+        rows = conn.execute(
+            """
+            SELECT m.id, m.bezeichnung, m.gekauft, m.verbraucht,
                    COALESCE((SELECT SUM(k.stueckzahl) FROM markenkauf k
                              LEFT JOIN journal j ON j.lfd_nr = k.journal_lfd_nr
                              WHERE k.markenart_id = m.id
-                               AND (j.id IS NULL OR j.storniert_durch IS NULL)), 0) AS gekauft,
+                               AND (j.id IS NULL OR j.storniert_durch IS NULL)), 0)
+                       AS soll_gekauft,
                    COALESCE((SELECT SUM(v.stueckzahl) FROM markenverbrauch v
-                             WHERE v.markenart_id = m.id), 0) AS verbraucht
-            FROM markenart m
-        """
-        if only_active:
-            q += " WHERE m.aktiv = 1"
-        q += " ORDER BY m.aktiv DESC, m.nennwert_cent"
-        rows = [dict(r) for r in conn.execute(q).fetchall()]
-    for r in rows:
-        # Nie unter null: ein negativer Bestand waere physisch unmöglich und
-        # nur ein Zeichen für inkonsistente Daten.
-        r["bestand"] = max(0, r["bestand_korrektur"] + r["gekauft"] - r["verbraucht"])
-        r["warnung"] = r["aktiv"] == 1 and r["bestand"] < BESTAND_WARNUNG
-    return rows
-
-
-def get_markenart(markenart_id: int, db_file: Optional[str] = None) -> Optional[dict]:
-    for m in list_markenarten(db_file=db_file):
-        if m["id"] == int(markenart_id):
-            return m
-    return None
+                             WHERE v.markenart_id = m.id), 0) AS soll_verbraucht
+            FROM markenart m ORDER BY m.id
+            """
+        ).fetchall()
+        abweichungen = [
+            {"id": r["id"], "bezeichnung": r["bezeichnung"],
+             "soll": {"gekauft": r["soll_gekauft"], "verbraucht": r["soll_verbraucht"]},
+             "ist": {"gekauft": r["gekauft"], "verbraucht": r["verbraucht"]}}
+            for r in rows
+            if (r["gekauft"], r["verbraucht"]) != (r["soll_gekauft"], r["soll_verbraucht"])
+        ]
+        if repair and abweichungen:
+            conn.executemany(
+                "UPDATE markenart SET gekauft = ?, verbraucht = ? WHERE id = ?",
+                [(a["soll"]["gekauft"], a["soll"]["verbraucht"], a["id"]) for a in abweichungen],
+            )
+            conn.commit()
+    return abweichungen
 
 
 def add_markenart(bezeichnung: str, nennwert_cent: int, db_file: Optional[str] = None) -> int:
@@ -529,17 +670,21 @@ def consume_stamps(markenart_id: int, stueckzahl: int = 1,
     stueckzahl = int(stueckzahl)
     if stueckzahl <= 0:
         raise ValueError("Stückzahl muss größer als 0 sein.")
-    m = get_markenart(markenart_id, db_file)
-    if not m:
-        raise ValueError("Markenart nicht gefunden")
-    if m["bestand"] < stueckzahl:
-        raise ValueError(
-            f"Nicht genug Marken vom Typ {m['bezeichnung']} im Vorrat "
-            f"(vorhanden {m['bestand']}, gebraucht {stueckzahl}). "
-            f"Bitte zuerst welche kaufen oder 'Sofort gekauft' wählen.")
     datum = datum or datetime.now().strftime("%Y-%m-%d")
     with _connect(db_file) as conn:
+        # Prüfen und Abbuchen in einer Transaktion: zwei gleichzeitige
+        # Verbräuche können die letzte Marke nicht beide bekommen.
         c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        row = c.execute(_MARKENART_SQL + " WHERE id = ?", (int(markenart_id),)).fetchone()
+        if not row:
+            raise ValueError("Markenart nicht gefunden")
+        m = _markenart(row)
+        if m["bestand"] < stueckzahl:
+            raise ValueError(
+                f"Nicht genug Marken vom Typ {m['bezeichnung']} im Vorrat "
+                f"(vorhanden {m['bestand']}, gebraucht {stueckzahl}). "
+                f"Bitte zuerst welche kaufen oder 'Sofort gekauft' wählen.")
         c.execute(
             "INSERT INTO markenverbrauch (bestellung_id, markenart_id, stueckzahl, "
             "portowert_cent, datum, markenkauf_id) VALUES (?, ?, ?, ?, ?, ?)",
@@ -615,10 +760,12 @@ def list_stamp_purchases(db_file: Optional[str] = None, limit: int = 200) -> Lis
             """
             SELECT k.id, k.datum, k.stueckzahl, k.betrag_cent, k.journal_lfd_nr,
                    k.beleg_id, m.bezeichnung, m.nennwert_cent,
-                   (j.storniert_durch IS NOT NULL) AS storniert
+                   (j.storniert_durch IS NOT NULL) AS storniert,
+                   b.vorschau AS beleg_vorschau
             FROM markenkauf k
             JOIN markenart m ON m.id = k.markenart_id
             LEFT JOIN journal j ON j.lfd_nr = k.journal_lfd_nr
+            LEFT JOIN belege b ON b.id = k.beleg_id
             ORDER BY k.datum DESC, k.id DESC LIMIT ?
             """, (limit,)
         ).fetchall()
@@ -667,6 +814,7 @@ def assign_orders_to_auszahlung(auszahlung_id: int, order_ids: Sequence[int],
         if not row:
             raise ValueError("Auszahlung nicht gefunden")
         datum = row["datum"]
+        _pruefe_offen(conn, datum)
         placeholders = ",".join("?" for _ in order_ids)
         cur = conn.execute(
             f"UPDATE journal SET zahlungseingang_am = ?, auszahlung_id = ? "
@@ -694,18 +842,22 @@ def list_auszahlungen(db_file: Optional[str] = None) -> List[dict]:
     angezeigt, nie automatisch korrigiert."""
     with _connect(db_file) as conn:
         rows = [dict(r) for r in conn.execute(
-            "SELECT * FROM auszahlung ORDER BY datum DESC, id DESC").fetchall()]
-        for a in rows:
-            z = conn.execute(
-                "SELECT COALESCE(SUM(CASE WHEN art = 'einnahme' THEN betrag_cent "
-                "ELSE -betrag_cent END), 0) AS summe, "
-                "COUNT(DISTINCT bestellung_id) AS bestellungen "
-                "FROM journal WHERE auszahlung_id = ? AND art <> 'storno' "
-                "AND storniert_durch IS NULL", (a["id"],)
-            ).fetchone()
-            a["zugeordnet_cent"] = z["summe"]
-            a["bestellungen"] = z["bestellungen"]
-            a["differenz_cent"] = z["summe"] - a["betrag_cent"]
+            """
+            SELECT a.*, COALESCE(z.summe, 0) AS zugeordnet_cent,
+                   COALESCE(z.bestellungen, 0) AS bestellungen
+            FROM auszahlung a
+            LEFT JOIN (SELECT auszahlung_id,
+                              SUM(CASE WHEN art = 'einnahme' THEN betrag_cent
+                                       ELSE -betrag_cent END) AS summe,
+                              COUNT(DISTINCT bestellung_id) AS bestellungen
+                       FROM journal
+                       WHERE auszahlung_id IS NOT NULL AND art <> 'storno'
+                         AND storniert_durch IS NULL
+                       GROUP BY auszahlung_id) z ON z.auszahlung_id = a.id
+            ORDER BY a.datum DESC, a.id DESC
+            """).fetchall()]
+    for a in rows:
+        a["differenz_cent"] = a["zugeordnet_cent"] - a["betrag_cent"]
     return rows
 
 
@@ -721,7 +873,7 @@ def open_payment_orders(db_file: Optional[str] = None) -> List[dict]:
             FROM journal j JOIN orders o ON o.id = j.bestellung_id
             WHERE j.auszahlung_id IS NULL AND j.zahlungseingang_am IS NULL
               AND j.art <> 'storno' AND j.storniert_durch IS NULL
-              AND substr(COALESCE(o.date_completed, o.email_date, o.date_received), 1, 10) >= ?
+              AND o.completed_date >= ?
             GROUP BY o.id
             ORDER BY datum ASC
             """, (GESCHAEFTSBEGINN,)
@@ -729,39 +881,191 @@ def open_payment_orders(db_file: Optional[str] = None) -> List[dict]:
     return [dict(r) for r in rows]
 
 
+#: Zeitrahmen für die Suche nach einem Zuordnungsvorschlag (Sekunden).
+VORSCHLAG_ZEITLIMIT = 0.5
+#: Obergrenze für die Bitmasken der Suche (Bits, zusammen rund 32 MiB).
+VORSCHLAG_BITS = 1 << 28
+
+
+def suggest_payout_orders(betrag_cent: int, toleranz_cent: int = 0,
+                          orders: Optional[List[dict]] = None,
+                          zeitlimit: float = VORSCHLAG_ZEITLIMIT,
+                          db_file: Optional[str] = None) -> dict:
+    """Vorschlag, welche offenen Bestellungen eine Auszahlung ausmachen.
+
+    Teilsummensuche über die Netto-Beträge von ``open_payment_orders`` (oder
+    ``orders``): gesucht ist eine Auswahl, deren Summe ``betrag_cent`` trifft,
+    notfalls bis auf ``toleranz_cent``. Die erreichbaren Summen laufen als
+    Bitmaske (ein ``int``) mit, eine pro Bestellung — hunderte Bestellungen
+    sind damit eine Frage von Millisekunden. Bei gleichwertigen Lösungen
+    gewinnen die älteren Bestellungen (Cardmarket zahlt der Reihe nach aus).
+
+    Die Masken brauchen zusammen etwa Bestellungen × Betrag Bits. Liegt das
+    über ``VORSCHLAG_BITS`` oder reicht ``zeitlimit`` nicht, wird greedy nach
+    Alter aufgefüllt und ``vollstaendig`` ist ``False``. Es wird nur
+    vorgeschlagen, nie zugeordnet.
+    """
+    if orders is None:
+        orders = open_payment_orders(db_file)
+    ziel = int(betrag_cent)
+    grenze = ziel + max(0, int(toleranz_cent))
+    # Was allein schon über der Grenze liegt, kann nie dazugehören.
+    kandidaten = [o for o in orders if 0 < (o.get("netto_cent") or 0) <= grenze]
+    ergebnis = {"order_ids": [], "summe_cent": 0, "differenz_cent": -ziel,
+                "gefunden": False, "vollstaendig": True}
+    if ziel <= 0 or not kandidaten:
+        return ergebnis
+
+    maske = (1 << (grenze + 1)) - 1
+    stufen = [1]                      # stufen[i]: erreichbare Summen mit den ersten i
+    ende = time.monotonic() + zeitlimit
+    if len(kandidaten) * (grenze + 1) > VORSCHLAG_BITS:
+        ergebnis["vollstaendig"] = False
+    for o in kandidaten if ergebnis["vollstaendig"] else ():
+        if time.monotonic() > ende:
+            ergebnis["vollstaendig"] = False
+            break
+        stufen.append((stufen[-1] | (stufen[-1] << o["netto_cent"])) & maske)
+
+    if ergebnis["vollstaendig"]:
+        erreichbar = stufen[-1]
+        # Nächste erreichbare Summe zum Ziel innerhalb der Toleranz.
+        treffer = None
+        for abstand in range(0, max(0, int(toleranz_cent)) + 1):
+            for summe in (ziel - abstand, ziel + abstand):
+                if 0 < summe <= grenze and erreichbar >> summe & 1:
+                    treffer = summe
+                    break
+            if treffer is not None:
+                break
+        if treffer is None:
+            return ergebnis
+        # Rückwärts: eine Bestellung nur nehmen, wenn die Summe ohne sie nicht
+        # erreichbar ist — so bleiben die neueren draußen, wo es geht.
+        auswahl, rest = [], treffer
+        for i in range(len(kandidaten), 0, -1):
+            if not stufen[i - 1] >> rest & 1:
+                auswahl.append(kandidaten[i - 1])
+                rest -= kandidaten[i - 1]["netto_cent"]
+        auswahl.reverse()
+    else:
+        auswahl, summe = [], 0
+        for o in kandidaten:
+            if summe + o["netto_cent"] <= grenze:
+                auswahl.append(o)
+                summe += o["netto_cent"]
+
+    summe = sum(o["netto_cent"] for o in auswahl)
+    ergebnis.update(order_ids=[o["id"] for o in auswahl], summe_cent=summe,
+                    differenz_cent=summe - ziel,
+                    gefunden=abs(summe - ziel) <= max(0, int(toleranz_cent)))
+    return ergebnis
+
+
 # ---------------------------------------------------------------------------
 # Belege
 # ---------------------------------------------------------------------------
-def save_receipt(filename: str, data: bytes, mime: str = "",
+def save_receipt(filename: str, data: Union[bytes, BinaryIO], mime: str = "",
                  db_file: Optional[str] = None) -> int:
-    """Belegdatei unverändert speichern und mit SHA-256 registrieren."""
+    """Belegdatei unverändert speichern und mit SHA-256 registrieren.
+
+    ``data`` ist der Inhalt als ``bytes`` oder ein lesbarer Datenstrom (etwa
+    ``request.files[...].stream``). Er wird in Blöcken von ``BELEG_BLOCK``
+    auf die Platte kopiert und dabei gehasht, nie ganz in den Speicher
+    geladen. Abgelegt wird inhaltsadressiert unter ``<sha[:2]>/<sha><endung>``:
+    wer dieselbe Datei noch einmal hochlädt, bekommt eine eigene Zeile in
+    ``belege`` (eigener Name, eigenes Datum), teilt sich aber Datei und
+    Vorschaubild mit dem ersten Beleg.
+    """
     ext = Path(filename or "").suffix.lower()
     if ext not in ALLOWED_RECEIPT_EXT:
         raise ValueError("Nur PDF, JPG oder PNG erlaubt")
     BELEGE_DIR.mkdir(parents=True, exist_ok=True)
+    strom = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
 
-    digest = hashlib.sha256(data).hexdigest()
-    safe = re.sub(r"[^A-Za-z0-9._-]", "_", Path(filename).name)
-    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    target = BELEGE_DIR / f"{stamp}_{safe}"
-    counter = 1
-    while target.exists():          # niemals einen vorhandenen Beleg überschreiben
-        target = BELEGE_DIR / f"{stamp}_{counter}_{safe}"
-        counter += 1
-    target.write_bytes(data)        # unverändert, keine Re-Komprimierung
-
+    sha = hashlib.sha256()
+    groesse = 0
+    fd, temp = tempfile.mkstemp(dir=BELEGE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as ziel:
+            for block in iter(lambda: strom.read(BELEG_BLOCK), b""):
+                sha.update(block)
+                ziel.write(block)
+                groesse += len(block)
+        digest = sha.hexdigest()
+
+        with _connect(db_file) as conn:
+            vorhanden = conn.execute(
+                "SELECT gespeichert_als FROM belege WHERE sha256 = ? ORDER BY id LIMIT 1",
+                (digest,)).fetchone()
+        if vorhanden and (BELEGE_DIR / vorhanden["gespeichert_als"]).exists():
+            gespeichert_als = vorhanden["gespeichert_als"]     # auch Altbestand
+        else:
+            gespeichert_als = f"{digest[:2]}/{digest}{ext}"
+            pfad = BELEGE_DIR / gespeichert_als
+            if not pfad.exists():   # niemals einen vorhandenen Beleg überschreiben
+                pfad.parent.mkdir(exist_ok=True)
+                os.replace(temp, pfad)
+    finally:
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+    vorschau = _vorschau_erzeugen(BELEGE_DIR / gespeichert_als, digest)
     with _connect(db_file) as conn:
         c = conn.cursor()
         c.execute(
             "INSERT INTO belege (original_name, gespeichert_als, mime, groesse, sha256, "
-            "hochgeladen_am) VALUES (?, ?, ?, ?, ?, ?)",
-            (Path(filename).name, target.name, mime, len(data), digest,
-             datetime.now().isoformat()),
+            "hochgeladen_am, vorschau) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (Path(filename).name, gespeichert_als, mime, groesse, digest,
+             datetime.now().isoformat(), vorschau),
         )
         conn.commit()
         return c.lastrowid
 
 
+def _vorschau_erzeugen(quelle: Path, digest: str) -> Optional[str]:
+    """Vorschaubild (JPEG, höchstens ``VORSCHAU_GROESSE``) einmal je Inhalt.
+
+    Bilder werden verkleinert. Für PDFs bringt das Projekt keinen Renderer
+    mit; als Vorlage dient deshalb das erste eingebettete JPEG — bei
+    gescannten Belegen der Scan. Ohne Vorlage (oder ohne Pillow) gibt es
+    keine Vorschau, der Beleg bleibt trotzdem gespeichert.
+    """
+    name = f"vorschau/{digest}.jpg"
+    ziel = BELEGE_DIR / name
+    if ziel.exists():
+        return name
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        if quelle.suffix.lower() == ".pdf":
+            daten = quelle.read_bytes()
+            anfang = daten.find(b"\xff\xd8\xff")       # JPEG-Startmarke
+            if anfang < 0:
+                return None
+            bild = Image.open(io.BytesIO(daten[anfang:]))
+        else:
+            bild = Image.open(quelle)
+        with bild:
+            bild.draft("RGB", VORSCHAU_GROESSE)     # JPEG: gleich verkleinert lesen
+            if bild.mode in ("RGBA", "LA", "P"):
+                rgba = bild.convert("RGBA")
+                klein = Image.new("RGB", rgba.size, "white")
+                klein.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                klein = bild.convert("RGB")
+        klein.thumbnail(VORSCHAU_GROESSE)
+        ziel.parent.mkdir(exist_ok=True)
+        temp = ziel.with_suffix(".tmp")
+        klein.save(temp, "JPEG", quality=80, optimize=True)
+        os.replace(temp, ziel)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return name
+
+
 def get_receipt(beleg_id: int, db_file: Optional[str] = None) -> Optional[dict]:
     with _connect(db_file) as conn:
         row = conn.execute("SELECT * FROM belege WHERE id = ?", (beleg_id,)).fetchone()
@@ -769,156 +1073,266 @@ def get_receipt(beleg_id: int, db_file: Optional[str] = None) -> Optional[dict]:
         return None
     d = dict(row)
     d["pfad"] = BELEGE_DIR / d["gespeichert_als"]
+    d["vorschau_pfad"] = BELEGE_DIR / d["vorschau"] if d["vorschau"] else None
     return d
 
 
 # ---------------------------------------------------------------------------
 # Lesen / Auswertung
 # ---------------------------------------------------------------------------
+#: Journalzeile für Listen: mit Nummer der Stornobuchung (Self-Join) und dem
+#: Vorschaubild des Belegs.
+_BUCHUNGSZEILE_SQL = (
+    "SELECT j.*, s.lfd_nr AS storniert_durch_nr, b.vorschau AS beleg_vorschau "
+    "FROM journal j LEFT JOIN journal s ON s.id = j.storniert_durch "
+    "LEFT JOIN belege b ON b.id = j.beleg_id "
+)
+
+
 def list_bookings(db_file: Optional[str] = None, limit: int = 500,
                   von: str = "", bis: str = "", art: str = "",
-                  kategorie: str = "") -> List[dict]:
-    """Journal chronologisch (neueste zuerst), optional gefiltert."""
-    q = "SELECT * FROM journal WHERE 1=1"
+                  kategorie: str = "", vor_nr: Optional[int] = None) -> List[dict]:
+    """Journal chronologisch (neueste zuerst), optional gefiltert.
+
+    Geblättert wird über ``lfd_nr``: ``vor_nr`` liefert die Buchungen vor
+    dieser Nummer (die kleinste ``lfd_nr`` der vorigen Seite). Der Verweis auf
+    die Stornobuchung (``storniert_durch_nr``) kommt per Self-Join mit, das
+    Vorschaubild des Belegs (``beleg_vorschau``) aus ``belege``.
+    """
+    q = _BUCHUNGSZEILE_SQL + "WHERE 1=1"
     params: List = []
     if von:
-        q += " AND buchungsdatum >= ?"
+        q += " AND j.buchungsdatum >= ?"
         params.append(von)
     if bis:
-        q += " AND buchungsdatum <= ?"
+        q += " AND j.buchungsdatum <= ?"
         params.append(bis)
     if art:
-        q += " AND art = ?"
+        q += " AND j.art = ?"
         params.append(art)
     if kategorie:
-        q += " AND kategorie = ?"
+        q += " AND j.kategorie = ?"
         params.append(kategorie)
-    q += " ORDER BY lfd_nr DESC LIMIT ?"
+    if vor_nr is not None:
+        q += " AND j.lfd_nr < ?"
+        params.append(vor_nr)
+    q += " ORDER BY j.lfd_nr DESC LIMIT ?"
     params.append(limit)
     with _connect(db_file) as conn:
-        rows = conn.execute(q, params).fetchall()
-        # Verweis auf die Stornobuchung mitgeben (lfd_nr statt interner id).
-        storno_nr = {r["id"]: r["lfd_nr"] for r in conn.execute(
-            "SELECT id, lfd_nr FROM journal").fetchall()}
-    out = []
-    for r in rows:
-        d = dict(r)
-        d["storniert_durch_nr"] = storno_nr.get(d.get("storniert_durch"))
-        out.append(d)
-    return out
+        return [dict(r) for r in conn.execute(q, params).fetchall()]
 
 
-def journal_by_order(db_file: Optional[str] = None) -> dict:
+def journal_by_order(db_file: Optional[str] = None, von: str = "", bis: str = "",
+                     seite: int = 1, je_seite: int = 50,
+                     sonstige_limit: int = 200) -> dict:
     """Buchungen je Bestellung gruppiert, plus ``sonstige`` (ohne Bestellung).
 
     Kontrolle je Bestellung: ``Warenverkauf + Versand − Gebühren`` sollte der
     Cardmarket-Auszahlung (``amount_auszahlung``, Net sale price) entsprechen.
+
+    Summen und Kontrolle rechnet SQLite (``GROUP BY bestellung_id``), begrenzt
+    auf den Zeitraum (Bestelldatum ``von``/``bis``) und eine Seite; Einzel-
+    buchungen werden nur für die Bestellungen dieser Seite geladen.
+    ``sonstige`` sind die neuesten ``sonstige_limit`` Buchungen ohne
+    Bestellung im Zeitraum (nach Buchungsdatum).
     """
+    datum = "coalesce(o.completed_date, '')"
+    aktiv = "j.art <> 'storno' AND j.storniert_durch IS NULL AND j.kategorie"
+    filter_sql, params = "", []
+    if von:
+        filter_sql += f" AND {datum} >= ?"
+        params.append(von)
+    if bis:
+        filter_sql += f" AND {datum} <= ?"
+        params.append(bis)
+    seite = max(1, seite)
+
     with _connect(db_file) as conn:
-        rows = [dict(r) for r in conn.execute(
-            "SELECT * FROM journal ORDER BY lfd_nr").fetchall()]
-        omap = {r["id"]: dict(r) for r in conn.execute(
-            "SELECT id, order_number, buyer_name, amount_auszahlung, buchung_pruefen, "
-            "COALESCE(date_completed, email_date, date_received) AS datum "
-            "FROM orders").fetchall()}
-        verbrauch: Dict[int, int] = {}
-        for v in conn.execute(
-            "SELECT bestellung_id, SUM(portowert_cent * stueckzahl) AS porto "
-            "FROM markenverbrauch WHERE bestellung_id IS NOT NULL "
-            "GROUP BY bestellung_id"
-        ).fetchall():
-            verbrauch[v["bestellung_id"]] = v["porto"]
-
-    groups: Dict[int, dict] = {}
-    sonstige: List[dict] = []
-    for b in rows:
-        oid = b["bestellung_id"]
-        if oid is None:
-            sonstige.append(b)
-            continue
-        g = groups.get(oid)
-        if g is None:
-            om = omap.get(oid, {})
-            g = groups[oid] = {
-                "order_id": oid,
-                "order_number": om.get("order_number"),
-                "buyer_name": om.get("buyer_name"),
-                "datum": (om.get("datum") or "")[:10],
-                "pruefen": om.get("buchung_pruefen"),
-                "auszahlung_cent": to_cent(om.get("amount_auszahlung")),
-                "porto_cent": verbrauch.get(oid, 0),
-                "bookings": [],
-                "warenverkauf_cent": 0, "versand_cent": 0, "gebuehren_cent": 0,
-                "portokauf_cent": 0,
-            }
-        g["bookings"].append(b)
-        if b["art"] != "storno" and b["storniert_durch"] is None:
-            k = b["kategorie"]
-            if k == KAT_WARENVERKAUF:
-                g["warenverkauf_cent"] += b["betrag_cent"]
-            elif k == KAT_VERSANDEINNAHME:
-                g["versand_cent"] += b["betrag_cent"]
-            elif k == KAT_GEBUEHREN:
-                g["gebuehren_cent"] += b["betrag_cent"]
-            elif k == KAT_PORTO:
-                # Sofortkauf, der dieser Bestellung zugeordnet wurde.
-                g["portokauf_cent"] += b["betrag_cent"]
-
-    orders: List[dict] = []
-    for g in groups.values():
-        # Die Kontrolle gegen die Cardmarket-Auszahlung betrifft nur die drei
-        # Übernahme-Buchungen; ein Portokauf gehört nicht in diese Rechnung.
-        netto = g["warenverkauf_cent"] + g["versand_cent"] - g["gebuehren_cent"]
-        g["netto_cent"] = netto
-        g["einnahmen_cent"] = g["warenverkauf_cent"] + g["versand_cent"]
-        g["ausgaben_cent"] = g["gebuehren_cent"] + g["portokauf_cent"]
-        # Ergebnis nach tatsächlichem Portoaufwand (verbrauchte Marken).
-        g["ergebnis_cent"] = netto - g["porto_cent"]
-        aus = g["auszahlung_cent"]
-        g["has_auszahlung"] = aus > 0
-        g["reconcile_diff_cent"] = netto - aus
-        g["reconcile_ok"] = (not g["has_auszahlung"]) or abs(netto - aus) <= 1
-        orders.append(g)
-    orders.sort(key=lambda x: (x["datum"] or "", x["order_id"]), reverse=True)
-    return {"orders": orders, "sonstige": sonstige}
-
-
-def _effective_date(row) -> Optional[str]:
-    """Stichtag für die EÜR (Zufluss-/Abflussprinzip).
-
-    Einnahmen zählen am Tag des Geldeingangs (``zahlungseingang_am`` aus der
-    zugeordneten Auszahlung), Ausgaben am eingetragenen Buchungsdatum.
-    """
-    if row["art"] == "einnahme":
-        return row["zahlungseingang_am"]
-    return row["buchungsdatum"]
+        rows = conn.execute(
+            f"""
+            WITH seite AS (
+                SELECT j.bestellung_id AS order_id, {datum} AS datum,
+                       SUM(CASE WHEN {aktiv} = ? THEN j.betrag_cent ELSE 0 END)
+                           AS warenverkauf_cent,
+                       SUM(CASE WHEN {aktiv} = ? THEN j.betrag_cent ELSE 0 END) AS versand_cent,
+                       SUM(CASE WHEN {aktiv} = ? THEN j.betrag_cent ELSE 0 END) AS gebuehren_cent,
+                       SUM(CASE WHEN {aktiv} = ? THEN j.betrag_cent ELSE 0 END) AS portokauf_cent,
+                       COUNT(*) OVER () AS gesamt
+                FROM journal j LEFT JOIN orders o ON o.id = j.bestellung_id
+                WHERE j.bestellung_id IS NOT NULL {filter_sql}
+                GROUP BY j.bestellung_id
+                ORDER BY datum DESC, order_id DESC
+                LIMIT ? OFFSET ?
+            ), netto AS (
+                SELECT s.*, o.order_number, o.buyer_name, o.buchung_pruefen AS pruefen,
+                       CAST(round(coalesce(o.amount_auszahlung, 0) * 100) AS INTEGER)
+                           AS auszahlung_cent,
+                       s.warenverkauf_cent + s.versand_cent - s.gebuehren_cent AS netto_cent,
+                       (SELECT coalesce(SUM(v.portowert_cent * v.stueckzahl), 0)
+                        FROM markenverbrauch v WHERE v.bestellung_id = s.order_id) AS porto_cent
+                FROM seite s LEFT JOIN orders o ON o.id = s.order_id
+            )
+            SELECT *,
+                   warenverkauf_cent + versand_cent AS einnahmen_cent,
+                   gebuehren_cent + portokauf_cent AS ausgaben_cent,
+                   netto_cent - porto_cent AS ergebnis_cent,
+                   auszahlung_cent > 0 AS has_auszahlung,
+                   netto_cent - auszahlung_cent AS reconcile_diff_cent,
+                   (auszahlung_cent <= 0 OR abs(netto_cent - auszahlung_cent) <= 1)
+                       AS reconcile_ok
+            FROM netto ORDER BY datum DESC, order_id DESC
+            """,
+            [KAT_WARENVERKAUF, KAT_VERSANDEINNAHME, KAT_GEBUEHREN, KAT_PORTO,
+             *params, je_seite, (seite - 1) * je_seite],
+        ).fetchall()
+
+        orders = []
+        for r in rows:
+            g = dict(r)
+            g["has_auszahlung"] = bool(g["has_auszahlung"])
+            g["reconcile_ok"] = bool(g["reconcile_ok"])
+            g["bookings"] = []
+            orders.append(g)
+        gruppen = {g["order_id"]: g for g in orders}
+        if gruppen:
+            marken = ", ".join("?" for _ in gruppen)
+            for b in conn.execute(
+                _BUCHUNGSZEILE_SQL
+                + f"WHERE j.bestellung_id IN ({marken}) ORDER BY j.lfd_nr",
+                list(gruppen),
+            ):
+                gruppen[b["bestellung_id"]]["bookings"].append(dict(b))
+
+        sonstige_sql, sonstige_params = "", []
+        if von:
+            sonstige_sql += " AND j.buchungsdatum >= ?"
+            sonstige_params.append(von)
+        if bis:
+            sonstige_sql += " AND j.buchungsdatum <= ?"
+            sonstige_params.append(bis)
+        sonstige = [dict(b) for b in conn.execute(
+            _BUCHUNGSZEILE_SQL
+            + f"WHERE j.bestellung_id IS NULL {sonstige_sql} "
+            "ORDER BY j.lfd_nr DESC LIMIT ?",
+            sonstige_params + [sonstige_limit],
+        )]
+
+    gesamt = orders[0]["gesamt"] if orders else 0
+    return {"orders": orders, "sonstige": sonstige, "gesamt": gesamt,
+            "seite": seite, "seiten": max(1, -(-gesamt // je_seite))}
+
+
+#: Stichtag für die EÜR (Zufluss-/Abflussprinzip): Einnahmen zählen am Tag des
+#: Geldeingangs (``zahlungseingang_am`` aus der zugeordneten Auszahlung),
+#: Ausgaben am eingetragenen Buchungsdatum; ``''`` = noch nicht zugeflossen.
+#: Muss wörtlich dem Ausdruck von ``idx_journal_stichtag`` in ``setup_db.py``
+#: entsprechen, sonst nutzt SQLite den Index nicht.
+STICHTAG_SQL = (
+    "coalesce(substr(CASE WHEN art = 'einnahme' THEN zahlungseingang_am "
+    "ELSE buchungsdatum END, 1, 10), '')"
+)
+
+
+def _volle_monate(start: str, end: str) -> Optional[Tuple[str, str, List[Tuple[str, str]]]]:
+    """Ganz im Zeitraum liegende Monate und die angebrochenen Ränder.
+
+    Liefert ``(erster, letzter, raender)`` mit Monaten als ``JJJJ-MM`` und den
+    Randstücken davor/danach als ``(von, bis)``; ``None``, wenn kein Monat ganz
+    hineinfällt oder die Grenzen keine ISO-Daten sind.
+    """
+    try:
+        von, bis = date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError:
+        return None
+    erster = von if von.day == 1 else (von.replace(day=1) + timedelta(days=32)).replace(day=1)
+    letzter = bis.replace(day=1)
+    if bis.day != calendar.monthrange(bis.year, bis.month)[1]:
+        letzter = (letzter - timedelta(days=1)).replace(day=1)
+    if erster > letzter:
+        return None
+    danach = (letzter + timedelta(days=32)).replace(day=1)
+    raender = []
+    if von < erster:
+        raender.append((start, (erster - timedelta(days=1)).isoformat()))
+    if danach <= bis:
+        raender.append((danach.isoformat(), end))
+    return erster.isoformat()[:7], letzter.isoformat()[:7], raender
+
+
+def _summen(conn: sqlite3.Connection, start: str, end: str,
+            nach_buchungsdatum: bool = False) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """``(art, kategorie) -> (cent, anzahl)`` der aktiven Buchungen im Zeitraum.
+
+    Volle Monate kommen aus ``journal_monatssumme``, nur die angebrochenen
+    Randmonate werden aus dem Journal summiert. Zeitbezug ist der EÜR-Stichtag,
+    mit ``nach_buchungsdatum`` das Buchungsdatum.
+    """
+    if nach_buchungsdatum:
+        cent, anzahl = "gebucht_cent", "gebucht_anzahl"
+        bedingung = "buchungsdatum BETWEEN ? AND ?"
+    else:
+        cent, anzahl = "summe_cent", "anzahl"
+        bedingung = f"{STICHTAG_SQL} BETWEEN ? AND ? AND {STICHTAG_SQL} <> ''"
+    teile: List[str] = []
+    params: List[str] = []
+    raender = [(start, end)]
+    monate = _volle_monate(start, end)
+    if monate:
+        erster, letzter, raender = monate
+        teile.append(f"SELECT art, kategorie, {cent} AS cent, {anzahl} AS anzahl "
+                     f"FROM journal_monatssumme WHERE monat BETWEEN ? AND ?")
+        params += [erster, letzter]
+    for von, bis in raender:
+        teile.append(f"SELECT art, kategorie, betrag_cent AS cent, 1 AS anzahl FROM journal "
+                     f"WHERE art <> 'storno' AND storniert_durch IS NULL AND {bedingung}")
+        params += [von, bis]
+    rows = conn.execute(
+        "SELECT art, kategorie, SUM(cent), SUM(anzahl) FROM ("
+        + " UNION ALL ".join(teile) + ") GROUP BY art, kategorie",
+        params,
+    ).fetchall()
+    return {(r[0], r[1]): (r[2], r[3]) for r in rows}
 
 
 def summary(start: str, end: str, db_file: Optional[str] = None) -> dict:
     """Summen je Kategorie im Zeitraum, plus noch nicht zugeflossene Einnahmen.
 
     Stornierte Buchungen und die Stornozeilen selbst werden herausgerechnet.
+    Ganz im Zeitraum liegende abgeschlossene Geschäftsjahre kommen aus ihrem
+    Jahresabschluss (``festgeschrieben``). Für den Rest liest die Auswertung
+    volle Monate aus ``journal_monatssumme``, nur die angebrochenen
+    Randmonate über ``idx_journal_stichtag`` aus dem Journal. Ist der Zeitraum
+    genau ein abgeschlossenes Jahr, gelten auch die offenen Einnahmen zum
+    Jahresende aus dem Abschluss.
     """
     with _connect(db_file) as conn:
-        rows = conn.execute("SELECT * FROM journal").fetchall()
+        abschluesse = [a for j, a in sorted(_abschluesse(conn).items())
+                       if start <= f"{j}-01-01" and f"{j}-12-31" <= end]
+        summen: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for a in abschluesse:
+            for k in a["kategorien"]:
+                cent, anzahl = summen.get((k["art"], k["kategorie"]), (0, 0))
+                summen[(k["art"], k["kategorie"])] = (cent + k["summe_cent"],
+                                                      anzahl + k["anzahl"])
+        for von, bis in _ohne_jahre(start, end, [a["jahr"] for a in abschluesse]):
+            for schluessel, (cent, anzahl) in _summen(conn, von, bis).items():
+                alt_cent, alt_anzahl = summen.get(schluessel, (0, 0))
+                summen[schluessel] = (alt_cent + cent, alt_anzahl + anzahl)
+        if len(abschluesse) == 1 and (start, end) == (f"{abschluesse[0]['jahr']}-01-01",
+                                                      f"{abschluesse[0]['jahr']}-12-31"):
+            offen = (abschluesse[0]["offen_einnahme_cent"], abschluesse[0]["offen_anzahl"])
+        else:
+            offen = conn.execute(
+                "SELECT COALESCE(SUM(summe_cent), 0), COALESCE(SUM(anzahl), 0) "
+                "FROM journal_monatssumme WHERE monat = ''"
+            ).fetchone()
 
     einnahmen: Dict[str, int] = {}
     ausgaben: Dict[str, int] = {}
-    offen_einnahme = 0
-    offen_count = 0
-
-    for r in rows:
-        if r["art"] == "storno" or r["storniert_durch"] is not None:
-            continue                      # Storno-Paare heben sich auf
-        eff = _effective_date(r)
-        if not eff:                       # Einnahme noch nicht zugeflossen
-            offen_count += 1
-            offen_einnahme += r["betrag_cent"]
-            continue
-        if not (start <= eff[:10] <= end):
-            continue
-        bucket = einnahmen if r["art"] == "einnahme" else ausgaben
-        bucket[r["kategorie"]] = bucket.get(r["kategorie"], 0) + r["betrag_cent"]
+    for (art, kategorie), (cent, anzahl) in summen.items():
+        if anzahl:
+            bucket = einnahmen if art == "einnahme" else ausgaben
+            bucket[kategorie] = cent
 
     sum_ein = sum(einnahmen.values())
     sum_aus = sum(ausgaben.values())
@@ -928,11 +1342,280 @@ def summary(start: str, end: str, db_file: Optional[str] = None) -> dict:
         "summe_einnahmen": sum_ein,
         "summe_ausgaben": sum_aus,
         "ueberschuss": sum_ein - sum_aus,
-        "offen_einnahme": offen_einnahme,
-        "offen_count": offen_count,
+        "offen_einnahme": offen[0],
+        "offen_count": offen[1],
+        "festgeschrieben": [{"jahr": a["jahr"], "abgeschlossen_am": a["abgeschlossen_am"]}
+                            for a in abschluesse],
     }
 
 
+def _ohne_jahre(start: str, end: str, jahre: Sequence[str]) -> List[Tuple[str, str]]:
+    """Teilzeiträume von ``start`` bis ``end`` ohne die (ganz enthaltenen) ``jahre``."""
+    teile, von = [], start
+    for jahr in sorted(jahre):
+        if von < f"{jahr}-01-01":
+            teile.append((von, f"{int(jahr) - 1}-12-31"))
+        von = f"{int(jahr) + 1}-01-01"
+    if von <= end:
+        teile.append((von, end))
+    return teile
+
+
+def jahresuebersicht(db_file: Optional[str] = None) -> List[dict]:
+    """Einnahmen, Ausgaben und Überschuss je Kalenderjahr (neueste zuerst).
+
+    Abgeschlossene Jahre kommen aus ihrem Jahresabschluss
+    (``festgeschrieben``), offene aus ``journal_monatssumme`` — zwölf Zeilen
+    je Jahr und Kategorie, unabhängig von der Zahl der Buchungen.
+    """
+    with _connect(db_file) as conn:
+        abschluesse = _abschluesse(conn)
+        rows = conn.execute(
+            "SELECT substr(monat, 1, 4) AS jahr, "
+            "  SUM(CASE WHEN art = 'einnahme' THEN summe_cent ELSE 0 END) AS einnahmen, "
+            "  SUM(CASE WHEN art = 'einnahme' THEN 0 ELSE summe_cent END) AS ausgaben "
+            "FROM journal_monatssumme WHERE monat <> '' "
+            "GROUP BY jahr HAVING SUM(anzahl) > 0 ORDER BY jahr DESC"
+        ).fetchall()
+    jahre = {r["jahr"]: {"jahr": r["jahr"], "einnahmen": r["einnahmen"],
+                         "ausgaben": r["ausgaben"], "festgeschrieben": False}
+             for r in rows if r["jahr"] not in abschluesse}
+    for jahr, a in abschluesse.items():
+        jahre[jahr] = {"jahr": jahr, "einnahmen": a["summe_einnahmen"],
+                       "ausgaben": a["summe_ausgaben"], "festgeschrieben": True,
+                       "abgeschlossen_am": a["abgeschlossen_am"]}
+    return [dict(j, ueberschuss=j["einnahmen"] - j["ausgaben"])
+            for _, j in sorted(jahre.items(), reverse=True)]
+
+
+def verify_monatssumme(repair: bool = False, db_file: Optional[str] = None) -> List[dict]:
+    """``journal_monatssumme`` gegen das Journal nachrechnen.
+
+    Gibt die abweichenden Schlüssel mit Soll- und Ist-Werten zurück (leer =
+    stimmig). Mit ``repair`` wird die Tabelle danach aus dem Journal neu
+    aufgebaut.
+    """
+    spalten = ("summe_cent", "anzahl", "gebucht_cent", "gebucht_anzahl")
+    aktiv = "FROM journal WHERE art <> 'storno' AND storniert_durch IS NULL"
+    with _connect(db_file) as conn:
+        soll: Dict[Tuple[str, str, str], Tuple[int, ...]] = {}
+        for r in conn.execute(
+            f"SELECT monat, art, kategorie, SUM(s), SUM(n), SUM(g), SUM(gn) FROM ("
+            f"  SELECT substr({STICHTAG_SQL}, 1, 7) AS monat, art, kategorie, "
+            f"         betrag_cent AS s, 1 AS n, 0 AS g, 0 AS gn {aktiv} "
+            f"  UNION ALL "
+            f"  SELECT substr(buchungsdatum, 1, 7), art, kategorie, 0, 0, betrag_cent, 1 "
+            f"  {aktiv}) "
+            f"GROUP BY monat, art, kategorie"
+        ):
+            soll[tuple(r[:3])] = tuple(r[3:])
+        ist = {tuple(r[:3]): tuple(r[3:]) for r in conn.execute(
+            "SELECT monat, art, kategorie, summe_cent, anzahl, gebucht_cent, gebucht_anzahl "
+            "FROM journal_monatssumme")}
+
+        null = (0,) * len(spalten)
+        abweichungen = []
+        for schluessel in sorted(set(soll) | set(ist)):
+            s, i = soll.get(schluessel, null), ist.get(schluessel, null)
+            if s != i:
+                abweichungen.append({
+                    "monat": schluessel[0], "art": schluessel[1], "kategorie": schluessel[2],
+                    "soll": dict(zip(spalten, s)), "ist": dict(zip(spalten, i)),
+                })
+        if repair and abweichungen:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM journal_monatssumme")
+            conn.executemany(
+                "INSERT INTO journal_monatssumme (monat, art, kategorie, summe_cent, "
+                "anzahl, gebucht_cent, gebucht_anzahl) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [k + v for k, v in soll.items()],
+            )
+            conn.commit()
+    return abweichungen
+
+
+# ---------------------------------------------------------------------------
+# Jahresabschluss (Festschreibung)
+# ---------------------------------------------------------------------------
+#: Schlüssel für die HMAC-Signatur der Jahresabschlüsse (``TCG_ABSCHLUSS_SCHLUESSEL``).
+#: Ohne Schlüssel wird nur eine SHA-256-Prüfsumme abgelegt: sie erkennt
+#: beschädigte, aber keine absichtlich neu berechneten Abschlüsse.
+ABSCHLUSS_SCHLUESSEL = os.environ.get("TCG_ABSCHLUSS_SCHLUESSEL", "")
+
+
+def _signatur(inhalt: str, verfahren: str) -> str:
+    if verfahren == "hmac-sha256":
+        return hmac.new(ABSCHLUSS_SCHLUESSEL.encode(), inhalt.encode(),
+                        hashlib.sha256).hexdigest()
+    return hashlib.sha256(inhalt.encode()).hexdigest()
+
+
+def _jahreswerte(conn: sqlite3.Connection, jahr: str) -> dict:
+    """Die festzuschreibenden Werte eines Geschäftsjahres, aus den Rohdaten.
+
+    Bewusst nicht aus ``journal_monatssumme``: Abschluss und Prüfung sollen
+    nicht von derselben Zwischensumme abhängen, die sie absichern.
+    """
+    start, ende = f"{jahr}-01-01", f"{jahr}-12-31"
+    aktiv = "art <> 'storno' AND storniert_durch IS NULL"
+    kategorien = [
+        {"art": r[0], "kategorie": r[1], "summe_cent": r[2], "anzahl": r[3]}
+        for r in conn.execute(
+            f"SELECT art, kategorie, SUM(betrag_cent), COUNT(*) FROM journal "
+            f"WHERE {aktiv} AND {STICHTAG_SQL} BETWEEN ? AND ? "
+            f"GROUP BY art, kategorie ORDER BY art, kategorie", (start, ende))
+    ]
+    # Zum Jahresende gebucht, aber erst danach (oder noch gar nicht) zugeflossen.
+    offen = conn.execute(
+        f"SELECT COALESCE(SUM(betrag_cent), 0), COUNT(*) FROM journal "
+        f"WHERE {aktiv} AND art = 'einnahme' AND buchungsdatum <= ? "
+        f"AND (zahlungseingang_am IS NULL OR substr(zahlungseingang_am, 1, 10) > ?)",
+        (ende, ende)).fetchone()
+    nummern = conn.execute(
+        "SELECT MIN(lfd_nr), MAX(lfd_nr), COUNT(*) FROM journal "
+        "WHERE buchungsdatum BETWEEN ? AND ?", (start, ende)).fetchone()
+    marken = []
+    for r in conn.execute(
+        """
+        SELECT m.id, m.bezeichnung, m.nennwert_cent, m.bestand_korrektur,
+               COALESCE((SELECT SUM(k.stueckzahl) FROM markenkauf k
+                         LEFT JOIN journal j ON j.lfd_nr = k.journal_lfd_nr
+                         WHERE k.markenart_id = m.id AND k.datum <= ?
+                           AND (j.id IS NULL OR j.storniert_durch IS NULL)), 0) AS gekauft,
+               COALESCE((SELECT SUM(v.stueckzahl) FROM markenverbrauch v
+                         WHERE v.markenart_id = m.id AND v.datum <= ?), 0) AS verbraucht
+        FROM markenart m ORDER BY m.id
+        """, (ende, ende)
+    ):
+        if r["gekauft"] or r["verbraucht"] or r["bestand_korrektur"]:
+            bestand = max(0, r["bestand_korrektur"] + r["gekauft"] - r["verbraucht"])
+            marken.append({"markenart_id": r["id"], "bezeichnung": r["bezeichnung"],
+                           "gekauft": r["gekauft"], "verbraucht": r["verbraucht"],
+                           "bestand": bestand, "wert_cent": bestand * r["nennwert_cent"]})
+    einnahmen = sum(k["summe_cent"] for k in kategorien if k["art"] == "einnahme")
+    ausgaben = sum(k["summe_cent"] for k in kategorien if k["art"] != "einnahme")
+    return {
+        "jahr": jahr,
+        "kategorien": kategorien,
+        "summe_einnahmen": einnahmen,
+        "summe_ausgaben": ausgaben,
+        "ueberschuss": einnahmen - ausgaben,
+        "offen_einnahme_cent": offen[0],
+        "offen_anzahl": offen[1],
+        "marken": marken,
+        "lfd_nr": {"erste": nummern[0], "letzte": nummern[1], "anzahl": nummern[2]},
+    }
+
+
+def _abschluesse(conn: sqlite3.Connection) -> Dict[str, dict]:
+    """Alle Jahresabschlüsse: ``jahr -> festgeschriebene Werte`` (plus Kopfdaten)."""
+    return {r["jahr"]: dict(json.loads(r["inhalt"]), abgeschlossen_am=r["abgeschlossen_am"],
+                            verfahren=r["verfahren"], signatur=r["signatur"])
+            for r in conn.execute("SELECT * FROM jahresabschluss ORDER BY jahr")}
+
+
+def list_jahresabschluesse(db_file: Optional[str] = None) -> List[dict]:
+    """Die Jahresabschlüsse, ältester zuerst."""
+    with _connect(db_file) as conn:
+        return list(_abschluesse(conn).values())
+
+
+def close_year(jahr, db_file: Optional[str] = None) -> dict:
+    """Ein abgelaufenes Geschäftsjahr abschließen (festschreiben).
+
+    Eingefroren werden die EÜR-Summen je Kategorie, die zum Jahresende noch
+    nicht zugeflossenen Einnahmen, der Markenbestand zum 31.12. und der
+    ``lfd_nr``-Bereich der Buchungen des Jahres. Der Abschluss ist signiert
+    (siehe ``ABSCHLUSS_SCHLUESSEL``) und verweist auf die Signatur des
+    Vorjahres; danach lassen Trigger keine Buchung, kein Storno und keinen
+    Zufluss in diesem Jahr mehr zu. Abgeschlossen wird der Reihe nach und erst,
+    wenn alle versendeten Bestellungen des Jahres übernommen sind.
+    """
+    jahr = str(jahr).strip()
+    if not (len(jahr) == 4 and jahr.isdigit()):
+        raise ValueError("Bitte das Jahr vierstellig angeben.")
+    if int(jahr) >= date.today().year:
+        raise ValueError(f"Das Geschäftsjahr {jahr} ist noch nicht abgelaufen.")
+    with _connect(db_file) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        letzter = conn.execute(
+            "SELECT jahr, signatur FROM jahresabschluss ORDER BY jahr DESC LIMIT 1").fetchone()
+        if letzter and letzter["jahr"] == jahr:
+            raise ValueError(f"Das Geschäftsjahr {jahr} ist bereits abgeschlossen.")
+        if letzter and letzter["jahr"] > jahr:
+            raise ValueError(f"Jahre werden der Reihe nach abgeschlossen – "
+                             f"{letzter['jahr']} ist schon abgeschlossen.")
+        frueher = [r[0] for r in conn.execute(
+            "SELECT DISTINCT substr(buchungsdatum, 1, 4) FROM journal WHERE buchungsdatum < ? "
+            "AND substr(buchungsdatum, 1, 4) NOT IN (SELECT jahr FROM jahresabschluss) "
+            "ORDER BY 1", (f"{jahr}-01-01",))]
+        if frueher:
+            raise ValueError(f"Zuerst {', '.join(frueher)} abschließen.")
+        fehlend = conn.execute(
+            f"SELECT COUNT(*) FROM ({_BOOKABLE_SQL}) WHERE substr(datum, 1, 4) = ?",
+            (GESCHAEFTSBEGINN, jahr)).fetchone()[0]
+        if fehlend:
+            raise ValueError(f"{fehlend} versendete Bestellung(en) aus {jahr} sind noch "
+                             f"nicht übernommen.")
+
+        werte = _jahreswerte(conn, jahr)
+        werte["vorgaenger"] = letzter["signatur"] if letzter else ""
+        inhalt = json.dumps(werte, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        verfahren = "hmac-sha256" if ABSCHLUSS_SCHLUESSEL else "sha256"
+        kopf = {"abgeschlossen_am": datetime.now().isoformat(timespec="seconds"),
+                "verfahren": verfahren, "signatur": _signatur(inhalt, verfahren)}
+        conn.execute(
+            "INSERT INTO jahresabschluss (jahr, abgeschlossen_am, inhalt, verfahren, signatur) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (jahr, kopf["abgeschlossen_am"], inhalt, verfahren, kopf["signatur"]),
+        )
+        conn.commit()
+    return dict(werte, **kopf)
+
+
+def verify_jahresabschluss(jahr: Optional[str] = None,
+                           db_file: Optional[str] = None) -> List[dict]:
+    """Jahresabschlüsse prüfen: Signatur, Kette und Nachrechnung.
+
+    Für jedes (oder nur das angegebene) abgeschlossene Jahr werden die Werte
+    aus den Rohdaten neu berechnet und mit dem Abschluss verglichen. Gibt die
+    Abweichungen je ``feld`` mit ``soll`` (nachgerechnet) und ``ist``
+    (festgeschrieben) zurück; leer = stimmig. Repariert wird nichts — ein
+    Abschluss bleibt, wie er ist. Beim Markenbestand zählen nur die datierten
+    Käufe und Verbräuche; die undatierte Inventurkorrektur kann sich ändern.
+    """
+    abweichungen: List[dict] = []
+    with _connect(db_file) as conn:
+        vorgaenger = ""
+        for r in conn.execute("SELECT * FROM jahresabschluss ORDER BY jahr").fetchall():
+            gespeichert = json.loads(r["inhalt"])
+            pruefen = jahr is None or r["jahr"] == str(jahr)
+            if pruefen:
+                if r["verfahren"] == "hmac-sha256" and not ABSCHLUSS_SCHLUESSEL:
+                    abweichungen.append({"jahr": r["jahr"], "feld": "signatur",
+                                         "soll": "TCG_ABSCHLUSS_SCHLUESSEL fehlt",
+                                         "ist": r["signatur"]})
+                elif _signatur(r["inhalt"], r["verfahren"]) != r["signatur"]:
+                    abweichungen.append({"jahr": r["jahr"], "feld": "signatur",
+                                         "soll": _signatur(r["inhalt"], r["verfahren"]),
+                                         "ist": r["signatur"]})
+                if gespeichert.get("vorgaenger") != vorgaenger:
+                    abweichungen.append({"jahr": r["jahr"], "feld": "vorgaenger",
+                                         "soll": vorgaenger,
+                                         "ist": gespeichert.get("vorgaenger")})
+                neu = _jahreswerte(conn, r["jahr"])
+                for werte in (neu, gespeichert):
+                    werte["marken"] = [{k: m[k] for k in ("markenart_id", "gekauft",
+                                                           "verbraucht")}
+                                       for m in werte.get("marken", [])]
+                for feld, soll in neu.items():
+                    if gespeichert.get(feld) != soll:
+                        abweichungen.append({"jahr": r["jahr"], "feld": feld,
+                                             "soll": soll, "ist": gespeichert.get(feld)})
+            vorgaenger = r["signatur"]
+    return abweichungen
+
+
 def versand_marge(start: str, end: str, db_file: Optional[str] = None) -> dict:
     """Betriebswirtschaftliche Auswertung (**keine** EÜR-Größe).
 
@@ -942,12 +1625,8 @@ def versand_marge(start: str, end: str, db_file: Optional[str] = None) -> dict:
     nachrichtlich gegenübergestellt.
     """
     with _connect(db_file) as conn:
-        ein = conn.execute(
-            "SELECT COALESCE(SUM(betrag_cent), 0) AS s, COUNT(*) AS n FROM journal "
-            "WHERE kategorie = ? AND art = 'einnahme' AND storniert_durch IS NULL "
-            "AND buchungsdatum BETWEEN ? AND ?",
-            (KAT_VERSANDEINNAHME, start, end),
-        ).fetchone()
+        ein_cent, ein_anzahl = _summen(conn, start, end, nach_buchungsdatum=True).get(
+            ("einnahme", KAT_VERSANDEINNAHME), (0, 0))
         verb = conn.execute(
             "SELECT COALESCE(SUM(portowert_cent * stueckzahl), 0) AS s, "
             "COUNT(DISTINCT COALESCE(bestellung_id, -id)) AS n "
@@ -955,9 +1634,9 @@ def versand_marge(start: str, end: str, db_file: Optional[str] = None) -> dict:
             (start, end),
         ).fetchone()
 
-    vereinnahmt = ein["s"]
+    vereinnahmt = ein_cent
     porto = verb["s"]
-    sendungen = max(ein["n"], verb["n"])
+    sendungen = max(ein_anzahl, verb["n"])
     return {
         "vereinnahmt_cent": vereinnahmt,
         "porto_cent": porto,
@@ -986,4 +1665,42 @@ def summary_csv(result: dict, start: str, end: str) -> bytes:
         w.writerow([])
         w.writerow(["", "Noch nicht zugeflossen (Einnahmen)",
                     cent_to_de(result["offen_einnahme"])])
+    for a in result.get("festgeschrieben", []):
+        w.writerow([])
+        w.writerow(["", f"Geschäftsjahr {a['jahr']} festgeschrieben am",
+                    de_date(a["abgeschlossen_am"])])
     return buf.getvalue().encode(CSV_ENCODING)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Jahresabschluss der Buchhaltung.")
+    befehle = parser.add_subparsers(dest="befehl", required=True)
+    befehle.add_parser("abschluss", help="Geschäftsjahr festschreiben").add_argument("jahr")
+    befehle.add_parser("pruefen", help="Abschlüsse nachrechnen und vergleichen").add_argument(
+        "jahr", nargs="?")
+    argumente = parser.parse_args()
+
+    from .setup_db import initialize_database
+    initialize_database()
+    if argumente.befehl == "abschluss":
+        try:
+            ergebnis = close_year(argumente.jahr)
+        except ValueError as exc:
+            sys.exit(str(exc))
+        nr = ergebnis["lfd_nr"]
+        print(f"{argumente.jahr} abgeschlossen: "
+              f"Überschuss {cent_to_de(ergebnis['ueberschuss'])} €, "
+              + (f"Buchungen #{nr['erste']}–#{nr['letzte']}" if nr["anzahl"]
+                 else "keine Buchungen")
+              + f", {ergebnis['verfahren']} {ergebnis['signatur'][:16]}…")
+    else:
+        abweichungen = verify_jahresabschluss(argumente.jahr)
+        for a in abweichungen:
+            print(f"{a['jahr']} {a['feld']}: festgeschrieben {a['ist']!r}, "
+                  f"nachgerechnet {a['soll']!r}")
+        print("Jahresabschlüsse stimmig." if not abweichungen
+              else f"{len(abweichungen)} Abweichung(en).")
+        sys.exit(1 if abweichungen else 0)
@@ -20,6 +20,13 @@ Datenbank unangetastet nutzbar.
 Nicht importiert werden Karten mit ``digital: true`` (nur Arena/MTGO, physisch
 nicht existent). Die Bildadresse wird **nicht** gespeichert, sondern bei Bedarf
 aus der Scryfall-ID abgeleitet (siehe ``card_scanner.image_url_for``).
+
+Optional lässt sich statt ``default_cards`` die Bulkdatei ``all_cards`` mit
+jeder Sprachfassung einlesen (``mehrsprachig=True`` bzw. ``--alle-sprachen``).
+Name, Set, Nummer und Cardmarket-ID sind je Ausgabe für alle Sprachen gleich;
+sie stehen deshalb nur einmal in ``drucke``, je Sprache bleibt in ``sprachen``
+nur eine kleine Zeile (Scryfall-ID, Sprache). Die Sicht ``cards`` setzt beides
+wieder zusammen, sodass alle Abfragen unverändert funktionieren.
 """
 
 from __future__ import annotations
@@ -28,6 +35,7 @@ import json
 import os
 import sqlite3
 import sys
+import time
 from pathlib import Path
 from typing import Callable, Dict, Iterable, Iterator, Optional, TextIO, Tuple
 
@@ -38,6 +46,8 @@ DB_PATH = DATA_DIR / "default-cards.db"
 #: Welche Bulkdatei verwendet wird. ``default_cards`` enthält jede Ausgabe
 #: einmal, bevorzugt auf Englisch.
 BULK_TYP = "default_cards"
+#: Jede Ausgabe in jeder Sprache – rund 2 GB entpackt, siehe ``messe_aufbau``.
+BULK_TYP_ALLE = "all_cards"
 BULK_INDEX_URL = "https://api.scryfall.com/bulk-data"
 
 #: Scryfall bittet um eine aussagekräftige Kennung.
@@ -180,9 +190,106 @@ def _lege_tabelle_an(conn: sqlite3.Connection) -> None:
     )
 
 
+def _lege_mehrsprachige_tabellen_an(conn: sqlite3.Connection) -> None:
+    """Gemeinsamer Druckkern plus eine kleine Zeile je Sprachfassung."""
+    # Sammeltabelle für den Datenstrom. Sie liegt als TEMP-Tabelle in einer
+    # eigenen Datei und wächst damit nicht in die fertige Datenbank hinein.
+    conn.execute("PRAGMA temp_store = FILE")
+    conn.execute(
+        """
+        CREATE TEMP TABLE roh (
+            id TEXT,
+            name TEXT,
+            set_code TEXT,
+            set_name TEXT,
+            lang TEXT,
+            collector_number TEXT,
+            cardmarket_id TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE drucke (
+            druck INTEGER PRIMARY KEY,
+            name TEXT,
+            set_code TEXT,
+            set_name TEXT,
+            collector_number TEXT,
+            cardmarket_id TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE sprachen (
+            id TEXT PRIMARY KEY,
+            druck INTEGER NOT NULL,
+            lang TEXT
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE VIEW cards AS
+        SELECT s.id, d.name, d.set_code, d.set_name, s.lang,
+               d.collector_number, d.cardmarket_id
+        FROM sprachen s JOIN drucke d ON d.druck = s.druck
+        """
+    )
+
+
+def _verteile_auf_drucke(conn: sqlite3.Connection) -> None:
+    """Sammeltabelle in Druckkern und Sprachzeilen aufteilen.
+
+    Das Zusammenfassen übernimmt SQLite über ``GROUP BY`` — der Speicherbedarf
+    hängt damit am Seitencache, nicht an der Zahl der Karten. Fehlt einer
+    Sprachfassung die Cardmarket-ID, wird die der anderen Sprachen übernommen.
+    """
+    conn.execute(
+        """
+        INSERT INTO drucke (name, set_code, set_name, collector_number, cardmarket_id)
+        SELECT MIN(name), set_code, MIN(set_name), collector_number,
+               MAX(cardmarket_id)
+        FROM roh
+        GROUP BY set_code, collector_number
+        """
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX idx_druck_identity ON drucke(set_code, collector_number)"
+    )
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO sprachen (id, druck, lang)
+        SELECT r.id, d.druck, r.lang
+        FROM roh r
+        JOIN drucke d ON d.set_code IS r.set_code
+                     AND d.collector_number IS r.collector_number
+        """
+    )
+    conn.execute("DROP TABLE roh")
+
+
+def _lege_mehrsprachige_indizes_an(conn: sqlite3.Connection) -> None:
+    """Gegenstück zu ``_lege_indizes_an`` für den Aufbau aus ``all_cards``.
+
+    Die Identitätssuche läuft über ``idx_druck_identity`` (Set, Nummer) und
+    ``idx_sprache`` (Druck, Sprache) — zusammen der Index auf
+    ``(set, number, lang)``.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_druck_name ON drucke(name)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_druck_name_gefaltet ON drucke(lower(name))"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_druck_set_name ON drucke(set_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sprache ON sprachen(druck, lang)")
+
+
 def _lege_indizes_an(conn: sqlite3.Connection) -> None:
     """Indizes erst nach dem Befüllen — das ist deutlich schneller."""
     conn.execute("CREATE INDEX IF NOT EXISTS idx_name ON cards(name)")
+    # Namenssuche ohne Groß-/Kleinschreibung (Bilder zum Bestellabgleich).
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_name_gefaltet ON cards(lower(name))")
     # Identitätssuche des Dragonshield-Imports (find_by_identity).
     conn.execute(
         "CREATE INDEX IF NOT EXISTS idx_identity ON cards(set_code, collector_number, lang)"
@@ -193,7 +300,9 @@ def _lege_indizes_an(conn: sqlite3.Connection) -> None:
 
 def schreibe_datenbank(karten: Iterable[Dict], db_path: Path,
                        fortschritt: Fortschritt = None,
-                       vor_tausch: Optional[Callable[[], None]] = None) -> int:
+                       vor_tausch: Optional[Callable[[], None]] = None,
+                       mehrsprachig: bool = False,
+                       stand: Optional[str] = None) -> int:
     """Karten in eine **neue** Datenbank schreiben und diese atomar einsetzen.
 
     Der Aufbau läuft in ``<ziel>.neu``; erst danach wird die Datei an ihren
@@ -204,6 +313,13 @@ def schreibe_datenbank(karten: Iterable[Dict], db_path: Path,
     hängt hier das Schließen ihrer zwischengespeicherten Verbindung ein: sonst
     läse sie anschließend weiter aus der alten Datei (und unter Windows
     scheiterte der Austausch an der offenen Datei).
+
+    Mit ``mehrsprachig=True`` entsteht das kompakte Schema aus ``drucke`` und
+    ``sprachen`` (für ``all_cards``); die Rückgabe zählt dann Sprachfassungen.
+
+    ``stand`` (``updated_at`` der Bulkdatei) landet noch in ``<ziel>.neu`` in
+    der Tabelle ``meta``: Leser öffnen die Datei ``immutable``, nach dem
+    Tausch darf sie sich nicht mehr ändern.
     """
     db_path = Path(db_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -218,10 +334,14 @@ def schreibe_datenbank(karten: Iterable[Dict], db_path: Path,
         # deshalb ist hier kein Journal nötig, was den Aufbau stark beschleunigt.
         conn.execute("PRAGMA journal_mode = OFF")
         conn.execute("PRAGMA synchronous = OFF")
-        _lege_tabelle_an(conn)
+        if mehrsprachig:
+            _lege_mehrsprachige_tabellen_an(conn)
+        else:
+            _lege_tabelle_an(conn)
 
         block = []
-        einfuegen = (f"INSERT OR REPLACE INTO cards ({', '.join(SPALTEN)}) "
+        ziel = "roh" if mehrsprachig else "cards"
+        einfuegen = (f"INSERT OR REPLACE INTO {ziel} ({', '.join(SPALTEN)}) "
                      f"VALUES ({', '.join('?' * len(SPALTEN))})")
         for card in karten:
             zeile = zeile_aus_karte(card)
@@ -241,9 +361,18 @@ def schreibe_datenbank(karten: Iterable[Dict], db_path: Path,
         if anzahl == 0:
             raise ValueError("Keine Karten gefunden – Datenbank wird nicht ersetzt.")
 
+        if mehrsprachig:
+            if fortschritt:
+                fortschritt(anzahl, "Sprachfassungen werden zusammengefasst …")
+            _verteile_auf_drucke(conn)
         if fortschritt:
             fortschritt(anzahl, "Indizes werden angelegt …")
-        _lege_indizes_an(conn)
+        if mehrsprachig:
+            _lege_mehrsprachige_indizes_an(conn)
+        else:
+            _lege_indizes_an(conn)
+        if stand is not None:
+            _merke_stand(conn, stand, BULK_TYP_ALLE if mehrsprachig else BULK_TYP)
         conn.commit()
     except BaseException:
         conn.close()
@@ -261,7 +390,8 @@ def schreibe_datenbank(karten: Iterable[Dict], db_path: Path,
 
 def import_cards(json_path: Path = JSON_PATH, db_path: Path = DB_PATH,
                  fortschritt: Fortschritt = None,
-                 vor_tausch: Optional[Callable[[], None]] = None) -> int:
+                 vor_tausch: Optional[Callable[[], None]] = None,
+                 mehrsprachig: bool = False) -> int:
     """Eine lokal vorliegende Bulkdatei streamend importieren.
 
     Erkennt ``.json``, ``.jsonl`` und die gepackten Varianten ``.gz``.
@@ -276,7 +406,50 @@ def import_cards(json_path: Path = JSON_PATH, db_path: Path = DB_PATH,
     oeffner = gzip.open if name.endswith(".gz") else open
     with oeffner(json_path, "rt", encoding="utf-8") as f:
         return schreibe_datenbank(iter_karten(f, jsonl), db_path, fortschritt,
-                                  vor_tausch)
+                                  vor_tausch, mehrsprachig)
+
+
+# ---------------------------------------------------------------------------
+# Messung: lohnt sich ``all_cards`` auf dem Pi?
+# ---------------------------------------------------------------------------
+def _spitzen_rss_mb() -> Optional[float]:
+    """Höchster Arbeitsspeicher des Prozesses in MB (``None`` ohne ``resource``)."""
+    try:
+        import resource
+    except ImportError:                     # Windows
+        return None
+    wert = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux meldet KB, macOS Bytes.
+    return round(wert / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def messe_aufbau(karten: Iterable[Dict], db_path: Path,
+                 mehrsprachig: bool = False,
+                 fortschritt: Fortschritt = None) -> Dict:
+    """Aufbau durchführen und Dauer, Größe und Speicherbedarf zurückgeben.
+
+    Grundlage für die Entscheidung, ob die rund 2 GB große ``all_cards``-Datei
+    auf dem Gerät tragbar ist: dieselbe Quelle einmal mit und einmal ohne
+    ``mehrsprachig`` einlesen und die Zahlen vergleichen.
+    """
+    db_path = Path(db_path)
+    beginn = time.perf_counter()
+    anzahl = schreibe_datenbank(karten, db_path, fortschritt,
+                                mehrsprachig=mehrsprachig)
+    dauer = time.perf_counter() - beginn
+    groesse = db_path.stat().st_size
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        tabelle = "drucke" if mehrsprachig else "cards"
+        drucke = conn.execute(f"SELECT COUNT(*) FROM {tabelle}").fetchone()[0]
+    return {
+        "anzahl": anzahl,
+        "drucke": drucke,
+        "sekunden": round(dauer, 2),
+        "karten_je_sekunde": round(anzahl / dauer) if dauer else anzahl,
+        "groesse_mb": round(groesse / 1024 / 1024, 1),
+        "bytes_je_karte": round(groesse / anzahl) if anzahl else 0,
+        "spitzen_rss_mb": _spitzen_rss_mb(),
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -300,43 +473,53 @@ def bulk_info(typ: str = BULK_TYP) -> Dict:
     raise RuntimeError(f"Bulkdatei '{typ}' nicht gefunden.")
 
 
-def _gespeicherter_stand(db_path: Path) -> Optional[str]:
+def _gespeicherter_stand(db_path: Path, typ: str = BULK_TYP) -> Optional[str]:
+    """Stand der vorhandenen Datenbank — nur wenn sie aus ``typ`` gebaut wurde.
+
+    Ältere Datenbanken ohne Eintrag ``bulk_typ`` stammen aus ``default_cards``.
+    """
     try:
         with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
-            zeile = conn.execute(
-                "SELECT wert FROM meta WHERE schluessel = 'updated_at'").fetchone()
-            return zeile[0] if zeile else None
+            werte = dict(conn.execute(
+                "SELECT schluessel, wert FROM meta "
+                "WHERE schluessel IN ('updated_at', 'bulk_typ')").fetchall())
     except sqlite3.Error:
         return None
+    if werte.get("bulk_typ", BULK_TYP) != typ:
+        return None
+    return werte.get("updated_at")
 
 
-def _merke_stand(db_path: Path, stand: str) -> None:
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("CREATE TABLE IF NOT EXISTS meta (schluessel TEXT PRIMARY KEY, wert TEXT)")
-        conn.execute("INSERT OR REPLACE INTO meta (schluessel, wert) VALUES ('updated_at', ?)",
-                     (stand,))
-        conn.commit()
+def _merke_stand(conn: sqlite3.Connection, stand: str, typ: str = BULK_TYP) -> None:
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (schluessel TEXT PRIMARY KEY, wert TEXT)")
+    conn.execute("INSERT OR REPLACE INTO meta (schluessel, wert) VALUES ('updated_at', ?)",
+                 (stand,))
+    conn.execute("INSERT OR REPLACE INTO meta (schluessel, wert) VALUES ('bulk_typ', ?)",
+                 (typ,))
 
 
 def aktualisiere_von_scryfall(db_path: Path = DB_PATH, fortschritt: Fortschritt = None,
                               erzwingen: bool = False,
-                              vor_tausch: Optional[Callable[[], None]] = None) -> Dict:
+                              vor_tausch: Optional[Callable[[], None]] = None,
+                              mehrsprachig: bool = False) -> Dict:
     """Bulkdatei direkt von Scryfall streamen und die Datenbank neu aufbauen.
 
     Die Datei wird nicht zwischengespeichert, sondern im Vorbeifließen
     verarbeitet. Hat sich seit dem letzten Lauf nichts geändert, wird ohne
-    Download abgebrochen (``erzwingen=True`` umgeht das).
+    Download abgebrochen (``erzwingen=True`` umgeht das). ``mehrsprachig``
+    lädt ``all_cards`` statt ``default_cards``.
     """
     import gzip
     import io
     import urllib.request
 
     db_path = Path(db_path)
+    typ = BULK_TYP_ALLE if mehrsprachig else BULK_TYP
     if fortschritt:
         fortschritt(0, "Frage Scryfall nach der aktuellen Bulkdatei …")
-    info = bulk_info()
+    info = bulk_info(typ)
     stand = info.get("updated_at", "")
-    vorher = _gespeicherter_stand(db_path)
+    vorher = _gespeicherter_stand(db_path, typ)
     if not erzwingen and vorher and vorher == stand and db_path.exists():
         if fortschritt:
             fortschritt(0, "Bereits aktuell – kein Download nötig.")
@@ -362,24 +545,54 @@ def aktualisiere_von_scryfall(db_path: Path = DB_PATH, fortschritt: Fortschritt
         roh = gzip.GzipFile(fileobj=antwort) if gepackt else antwort
         strom = io.TextIOWrapper(roh, encoding="utf-8")
         anzahl = schreibe_datenbank(iter_karten(strom, jsonl), db_path,
-                                    fortschritt, vor_tausch)
-
-    _merke_stand(db_path, stand)
+                                    fortschritt, vor_tausch, mehrsprachig, stand)
     return {"aktualisiert": True, "anzahl": anzahl, "stand": stand}
 
 
+def _messe_datei(pfad: Path) -> int:
+    """``--messen <datei>``: beide Schemata aus derselben Quelle bauen.
+
+    Die Datenbanken entstehen in einem temporären Verzeichnis; die produktive
+    Kartendatenbank bleibt unberührt. Der Spitzenwert des Arbeitsspeichers
+    gilt für den ganzen Prozess, der zweite Lauf zeigt also das Maximum beider.
+    """
+    import gzip
+    import tempfile
+
+    name = pfad.name.lower()
+    oeffner = gzip.open if name.endswith(".gz") else open
+    with tempfile.TemporaryDirectory() as verzeichnis:
+        for mehrsprachig in (False, True):
+            with oeffner(pfad, "rt", encoding="utf-8") as f:
+                werte = messe_aufbau(
+                    iter_karten(f, ".jsonl" in name),
+                    Path(verzeichnis) / f"messung-{int(mehrsprachig)}.db",
+                    mehrsprachig=mehrsprachig)
+            schema = "drucke+sprachen" if mehrsprachig else "cards"
+            print(f"{schema:16} {werte['anzahl']:>9} Karten  {werte['drucke']:>8} Drucke  "
+                  f"{werte['sekunden']:>8} s  {werte['karten_je_sekunde']:>7}/s  "
+                  f"{werte['groesse_mb']:>8} MB  {werte['bytes_je_karte']:>5} B/Karte  "
+                  f"RSS {werte['spitzen_rss_mb']} MB")
+    return 0
+
+
 def main(argv=None) -> int:
     argv = list(sys.argv[1:] if argv is None else argv)
     def zeige(_n, text):
         print(text)
+    mehrsprachig = "--alle-sprachen" in argv
     try:
+        if "--messen" in argv:
+            pfad = Path(argv[argv.index("--messen") + 1])
+            return _messe_datei(pfad)
         if "--datei" in argv:
             pfad = Path(argv[argv.index("--datei") + 1])
-            anzahl = import_cards(pfad, DB_PATH, zeige)
+            anzahl = import_cards(pfad, DB_PATH, zeige, mehrsprachig=mehrsprachig)
             print(f"{anzahl} Karten nach {DB_PATH} geschrieben.")
         else:
             ergebnis = aktualisiere_von_scryfall(
-                DB_PATH, zeige, erzwingen="--erzwingen" in argv)
+                DB_PATH, zeige, erzwingen="--erzwingen" in argv,
+                mehrsprachig=mehrsprachig)
             if not ergebnis["aktualisiert"]:
                 print("Kartendaten waren bereits aktuell.")
             else:
@@ -2,24 +2,116 @@
 
 from __future__ import annotations
 
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from pathlib import Path
-from queue import Queue
-from typing import Dict, Optional, List
+from queue import Empty, LifoQueue, Queue
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple
 
 import json
+import os
 import sqlite3
+import sys
+import threading
 
 import cv2
 from pyzbar.pyzbar import decode
 import requests
 
+from TCGInventory.scryfall_remote import get_resolver
+
 SCRYFALL_API_URL = "https://api.scryfall.com/cards/"
 DEFAULT_CARDS_PATH = Path(__file__).resolve().parent / "data" / "default-cards.json"
 DEFAULT_DB_PATH = Path(__file__).resolve().parent / "data" / "default-cards.db"
 
+#: Leseverbindungen zur Kartendatenbank. Die Datei wird nur atomar ersetzt und
+#: nie an Ort und Stelle beschrieben; sie wird deshalb schreibgeschützt und
+#: ``immutable`` geöffnet (keine Sperren, kein Prüfen auf fremde Änderungen).
+#: Größen über die Umgebung anpassbar, Voreinstellungen für den Pi (4 GB).
+POOL_GROESSE = int(os.environ.get("TCG_CARDDB_POOL", "4"))
+MMAP_MB = int(os.environ.get("TCG_CARDDB_MMAP_MB", "256"))
+CACHE_KB = int(os.environ.get("TCG_CARDDB_CACHE_KB", "8192"))
+#: Obergrenze der Arbeitsmenge im Speicher (Zeilen der Kartendatenbank);
+#: ``0`` schaltet sie ab. 60 000 Zeilen belegen auf dem Pi rund 15 MB.
+ARBEITSMENGE_MAX = int(os.environ.get("TCG_CARDDB_ARBEITSMENGE", "60000"))
+
 _CARDS_BY_ID: Dict[str, Dict] = {}
 _CARDS_BY_NAME: Dict[str, Dict] = {}
-_DB_CONN: sqlite3.Connection | None = None
+
+
+class _LesePool:
+    """Kleiner Vorrat schreibgeschützter Verbindungen für die Flask-Threads.
+
+    Jede Verbindung wird immer nur von einem Thread zugleich benutzt. Mehr als
+    ``groesse`` Abfragen gleichzeitig warten, bis eine Verbindung frei wird.
+    """
+
+    def __init__(self, pfad: Path, groesse: int = POOL_GROESSE,
+                 mmap_mb: int = MMAP_MB, cache_kb: int = CACHE_KB) -> None:
+        self.pfad = Path(pfad)
+        self.mmap_mb = mmap_mb
+        self.cache_kb = cache_kb
+        self._frei: LifoQueue[sqlite3.Connection] = LifoQueue()
+        self._plaetze = threading.BoundedSemaphore(max(1, groesse))
+        self._sperre = threading.Lock()
+        self._geoeffnet = 0
+        self._geschlossen = False
+
+    def oeffne(self) -> sqlite3.Connection:
+        """Eine neue Leseverbindung öffnen (``mode=ro&immutable=1``)."""
+        conn = sqlite3.connect(f"{self.pfad.as_uri()}?mode=ro&immutable=1",
+                               uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_mb * 1024 * 1024}")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_kb}")
+        with self._sperre:
+            self._geoeffnet += 1
+        return conn
+
+    @contextmanager
+    def verbindung(self) -> Iterator[sqlite3.Connection]:
+        """Eine Verbindung ausleihen und danach zurücklegen."""
+        self._plaetze.acquire()
+        try:
+            try:
+                conn = self._frei.get_nowait()
+            except Empty:
+                conn = self.oeffne()
+            try:
+                yield conn
+            finally:
+                with self._sperre:
+                    geschlossen = self._geschlossen
+                if geschlossen:
+                    conn.close()
+                else:
+                    self._frei.put(conn)
+        finally:
+            self._plaetze.release()
+
+    def schliessen(self) -> None:
+        """Freie Verbindungen schließen; ausgeliehene bei der Rückgabe."""
+        with self._sperre:
+            self._geschlossen = True
+        while True:
+            try:
+                conn = self._frei.get_nowait()
+            except Empty:
+                break
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    @property
+    def offen(self) -> int:
+        """Anzahl bisher geöffneter Verbindungen (für Messung und Tests)."""
+        with self._sperre:
+            return self._geoeffnet
+
+
+_DB_POOL: _LesePool | None = None
+_POOL_SPERRE = threading.Lock()
 
 #: Result type for ``fetch_card_info`` and queue entries
 CardInfo = Dict[str, str]
@@ -44,45 +136,290 @@ def image_url_for(card_id: str, groesse: str = "normal") -> str:
 
 
 def reset_card_database() -> None:
-    """Zwischengespeicherte Verbindung schließen.
+    """Zwischengespeicherte Verbindungen schließen.
 
-    Nach dem atomaren Austausch der Kartendatenbank zeigt eine offene
-    Verbindung noch auf die alte Datei; sie muss deshalb verworfen werden.
+    Nach dem atomaren Austausch der Kartendatenbank zeigen offene Verbindungen
+    noch auf die alte Datei (``immutable`` bemerkt den Tausch nicht); sie
+    müssen deshalb verworfen werden.
     """
-    global _DB_CONN
-    if _DB_CONN is not None:
-        try:
-            _DB_CONN.close()
-        except sqlite3.Error:
-            pass
-        _DB_CONN = None
+    global _DB_POOL, _ARBEITSMENGE
+    with _POOL_SPERRE:
+        pool, _DB_POOL = _DB_POOL, None
+    _ARBEITSMENGE = None
+    _BILDER.clear()
+    if pool is not None:
+        pool.schliessen()
 
 
 def _load_card_database() -> None:
-    """Open the local card database connection if available.
+    """Open the local card database pool if available.
 
     Es wird ausschließlich die aufbereitete SQLite-Datenbank genutzt. Die rohe
     Bulk-JSON wird bewusst nicht mehr geladen: sie würde vollständig in den
     Arbeitsspeicher gehen und den Pi zum Absturz bringen. Fehlt die Datenbank,
     kann sie über „Kartendaten aktualisieren" neu aufgebaut werden.
     """
-    global _DB_CONN
-    if _DB_CONN:
+    global _DB_POOL
+    if _DB_POOL:
         return
-    if DEFAULT_DB_PATH.exists():
-        # allow usage across threads when served via Flask
-        _DB_CONN = sqlite3.connect(DEFAULT_DB_PATH, check_same_thread=False)
-        _DB_CONN.row_factory = sqlite3.Row
-        try:
-            _DB_CONN.execute("SELECT 1 FROM cards LIMIT 1")
+    if not DEFAULT_DB_PATH.exists():
+        print(f"⚠️  Lokale Kartendatenbank {DEFAULT_DB_PATH} nicht gefunden – "
+              "bitte in der Weboberflaeche unter 'Kartendaten' aktualisieren.")
+        return
+    with _POOL_SPERRE:
+        if _DB_POOL:
             return
+        pool = _LesePool(DEFAULT_DB_PATH)
+        try:
+            with pool.verbindung() as conn:
+                conn.execute("SELECT 1 FROM cards LIMIT 1")
         except sqlite3.Error:
             # invalid or empty database file -> ignore
-            _DB_CONN.close()
-            _DB_CONN = None
-    else:
-        print(f"⚠️  Lokale Kartendatenbank {DEFAULT_DB_PATH} nicht gefunden – "
-              "bitte in der Weboberflaeche unter 'Kartendaten' aktualisieren.")
+            pool.schliessen()
+            return
+        _DB_POOL = pool
+
+
+def _abfrage(sql: str, parameter: tuple = ()) -> Optional[List[sqlite3.Row]]:
+    """Abfrage über eine geliehene Leseverbindung.
+
+    ``None`` bedeutet: keine Kartendatenbank vorhanden (anders als eine leere
+    Trefferliste).
+    """
+    _load_card_database()
+    pool = _DB_POOL
+    if pool is None:
+        return None
+    with pool.verbindung() as conn:
+        return conn.execute(sql, parameter).fetchall()
+
+# ---------------------------------------------------------------------------
+# Arbeitsmenge: die Sets des Bestands im Speicher
+# ---------------------------------------------------------------------------
+class _Druck:
+    """Eine Zeile der Kartendatenbank, so schmal wie möglich gehalten."""
+
+    __slots__ = ("id", "name", "set_code", "lang", "collector_number",
+                 "cardmarket_id")
+
+    def __init__(self, zeile: Tuple) -> None:
+        (self.id, self.name, self.set_code, self.lang, self.collector_number,
+         self.cardmarket_id) = zeile
+
+    def als_dict(self) -> Dict:
+        """Gleiche Form wie ``dict(sqlite3.Row)`` aus ``find_by_identity``."""
+        return {schluessel: getattr(self, schluessel) for schluessel in self.__slots__}
+
+
+class _Arbeitsmenge:
+    """Alle Drucke der Sets, die der Laden führt, im Arbeitsspeicher.
+
+    Geladen wird je Set jede Karte **und jeder Nachdruck ihres Namens** — nur
+    so ist die Liste je Name vollständig und ``fetch_variants`` kann ohne SQL
+    antworten. Für ein geladenes Set ist auch ein Fehlgriff verbindlich; für
+    alles andere liefern die Abfragen ``None`` und der Aufrufer fragt SQLite.
+    Zeilen, die mehrere Sets mitbringen, werden gezählt und nur einmal
+    gehalten. Passt ein Set nicht mehr unter ``max_zeilen``, werden die am
+    längsten nicht benutzten Sets verdrängt; ein Set, das allein zu groß ist,
+    bleibt draußen.
+    """
+
+    def __init__(self, max_zeilen: int = ARBEITSMENGE_MAX) -> None:
+        self.max_zeilen = max_zeilen
+        self.nach_nummer: Dict[Tuple[str, str], List[_Druck]] = {}
+        self.nach_name: Dict[str, List[_Druck]] = {}
+        #: Geladene Sets mit ihren Zeilen-IDs, zuletzt benutzte am Ende.
+        self.sets: OrderedDict[str, List[str]] = OrderedDict()
+        self.treffer = 0
+        self.fehlgriffe = 0
+        self.verdraengt = 0
+        self.zu_gross = 0
+        self._drucke: Dict[str, _Druck] = {}
+        self._nutzer: Dict[str, int] = {}
+        self._ausstehend: set[str] = set()
+        self._bytes = 0
+        self._sperre = threading.Lock()
+
+    def lade_sets(self, set_codes: Iterable[str]) -> None:
+        """Sets nachladen; für jedes werden bei Bedarf alte Sets verdrängt."""
+        with self._sperre:
+            geladen = set(self.sets)
+        for code in sorted({c.lower() for c in set_codes if c} - geladen):
+            rows = _abfrage(
+                "SELECT id, name, set_code, lang, collector_number, cardmarket_id "
+                "FROM cards WHERE name IN (SELECT name FROM cards WHERE set_code=?)",
+                (code,),
+            )
+            if rows is None:
+                return
+            with self._sperre:
+                if code in self.sets:
+                    continue
+                ids = list(dict.fromkeys(r[0] for r in rows))
+                if len(ids) > self.max_zeilen:
+                    self.zu_gross += 1
+                    continue
+                while self.sets and len(self._drucke) + sum(
+                        1 for i in ids if i not in self._drucke) > self.max_zeilen:
+                    _, alte = self.sets.popitem(last=False)
+                    self._gib_frei(alte)
+                    self.verdraengt += 1
+                for r in rows:
+                    if r[0] not in self._drucke:
+                        self._nimm_auf(_Druck(tuple(r)))
+                for i in ids:
+                    self._nutzer[i] = self._nutzer.get(i, 0) + 1
+                self.sets[code] = ids
+
+    def lade_im_hintergrund(self, set_code: str) -> None:
+        """``lade_sets([set_code])`` in einem eigenen Thread — die Anfrage wartet nicht."""
+        with self._sperre:
+            if set_code in self.sets or set_code in self._ausstehend:
+                return
+            self._ausstehend.add(set_code)
+
+        def laden() -> None:
+            try:
+                self.lade_sets([set_code])
+            finally:
+                with self._sperre:
+                    self._ausstehend.discard(set_code)
+
+        threading.Thread(target=laden, name="arbeitsmenge", daemon=True).start()
+
+    def _nimm_auf(self, druck: _Druck) -> None:
+        self._drucke[druck.id] = druck
+        self.nach_nummer.setdefault((druck.set_code, druck.collector_number), []).append(druck)
+        self.nach_name.setdefault((druck.name or "").lower(), []).append(druck)
+        self._bytes += self._groesse(druck)
+
+    def _gib_frei(self, ids: List[str]) -> None:
+        """Zeilen eines verdrängten Sets freigeben, die kein anderes Set mehr hält."""
+        weg = []
+        for i in ids:
+            self._nutzer[i] -= 1
+            if not self._nutzer[i]:
+                del self._nutzer[i]
+                weg.append(self._drucke.pop(i))
+        # Listen neu bauen statt darin zu löschen: Leser, die eine Liste
+        # gerade in der Hand haben, sehen sie unverändert.
+        for verzeichnis, schluessel in (
+                (self.nach_nummer, lambda d: (d.set_code, d.collector_number)),
+                (self.nach_name, lambda d: (d.name or "").lower())):
+            for k in {schluessel(d) for d in weg}:
+                rest = [d for d in verzeichnis[k] if d.id in self._drucke]
+                if rest:
+                    verzeichnis[k] = rest
+                else:
+                    del verzeichnis[k]
+        self._bytes -= sum(self._groesse(d) for d in weg)
+
+    @staticmethod
+    def _groesse(druck: _Druck) -> int:
+        return sys.getsizeof(druck) + sum(
+            sys.getsizeof(getattr(druck, f)) for f in _Druck.__slots__)
+
+    def identitaet(self, set_code: str, nummer: str) -> Optional[List[_Druck]]:
+        """Drucke zu ``(set_code, nummer)`` — ``None``, wenn unbekannt."""
+        with self._sperre:
+            drucke = self.nach_nummer.get((set_code, nummer))
+            if set_code in self.sets:
+                self.sets.move_to_end(set_code)
+            if drucke or set_code in self.sets:
+                self.treffer += 1
+                return drucke or []
+            self.fehlgriffe += 1
+            return None
+
+    def varianten(self, name: str) -> Optional[List[_Druck]]:
+        """Alle Drucke eines Namens — ``None``, wenn der Name nicht geladen ist."""
+        with self._sperre:
+            drucke = self.nach_name.get((name or "").lower())
+            if drucke is None:
+                self.fehlgriffe += 1
+            else:
+                self.treffer += 1
+            return drucke
+
+    def statistik(self) -> Dict[str, object]:
+        """Umfang und geschätzter Speicherbedarf (Zeilen plus Verzeichnisse)."""
+        with self._sperre:
+            verzeichnisse = (sys.getsizeof(self.nach_nummer) + sys.getsizeof(self.nach_name)
+                             + sys.getsizeof(self._drucke) + sys.getsizeof(self._nutzer)
+                             + 8 * 2 * len(self._drucke))     # zwei Listeneinträge je Zeile
+            return {
+                "sets": len(self.sets),
+                "zeilen": len(self._drucke),
+                "namen": len(self.nach_name),
+                "max_zeilen": self.max_zeilen,
+                "voll": bool(self.verdraengt or self.zu_gross),
+                "verdraengt": self.verdraengt,
+                "zu_gross": self.zu_gross,
+                "speicher_mb": round((self._bytes + verzeichnisse) / 1024 / 1024, 1),
+                "treffer": self.treffer,
+                "fehlgriffe": self.fehlgriffe,
+            }
+
+
+_ARBEITSMENGE: _Arbeitsmenge | None = None
+#: Gewünschte Sets: die des Bestands plus die zuletzt nachgeschlagenen. Bleibt
+#: über ``reset_card_database`` hinweg erhalten, damit nach einem Tausch der
+#: Kartendaten dieselbe Arbeitsmenge neu entsteht.
+_ARBEITSMENGE_SETS: set[str] = set()
+_ARBEITSMENGE_SPERRE = threading.Lock()
+
+
+def aktiviere_arbeitsmenge(set_codes: Iterable[str]) -> Dict[str, object]:
+    """Arbeitsmenge für die übergebenen Sets (in der Regel der Bestand) laden.
+
+    Danach beantworten ``find_by_identity``, ``fetch_variants`` und
+    ``fetch_card_info_by_name`` Anfragen zu diesen Sets ohne SQL. Rückgabe:
+    ``arbeitsmenge_statistik()``.
+    """
+    _ARBEITSMENGE_SETS.update(c.lower() for c in set_codes if c)
+    menge = _arbeitsmenge()
+    if menge is not None:
+        menge.lade_sets(_ARBEITSMENGE_SETS)
+    return arbeitsmenge_statistik()
+
+
+def arbeitsmenge_statistik() -> Dict[str, object]:
+    """Kennzahlen der Arbeitsmenge — leer, solange sie nicht aufgebaut ist."""
+    menge = _ARBEITSMENGE
+    return menge.statistik() if menge is not None else {}
+
+
+def _arbeitsmenge() -> Optional[_Arbeitsmenge]:
+    """Die aktive Arbeitsmenge, bei Bedarf (nach einem Tausch) neu aufgebaut."""
+    global _ARBEITSMENGE
+    if ARBEITSMENGE_MAX <= 0 or not _ARBEITSMENGE_SETS:
+        return None
+    menge = _ARBEITSMENGE
+    if menge is not None:
+        return menge
+    with _ARBEITSMENGE_SPERRE:
+        if _ARBEITSMENGE is None:
+            _load_card_database()
+            if _DB_POOL is None:
+                return None
+            neu = _Arbeitsmenge(ARBEITSMENGE_MAX)
+            neu.lade_sets(set(_ARBEITSMENGE_SETS))
+            _ARBEITSMENGE = neu
+        return _ARBEITSMENGE
+
+
+def _merke_set(set_code: str) -> None:
+    """Ein eben per SQL nachgeschlagenes Set in die Arbeitsmenge aufnehmen.
+
+    Das Laden läuft im Hintergrund; die laufende Anfrage hat ihr Ergebnis
+    schon aus SQLite.
+    """
+    menge = _ARBEITSMENGE
+    if menge is None or not set_code:
+        return
+    _ARBEITSMENGE_SETS.add(set_code)
+    menge.lade_im_hintergrund(set_code)
+
 
 def scan_image(path: str) -> Optional[str]:
     """Scan an image file for barcodes and return the first result as string."""
@@ -98,22 +435,20 @@ def scan_image(path: str) -> Optional[str]:
 
 def fetch_card_info(card_id: str) -> Optional[CardInfo]:
     """Retrieve card details from the local database or Scryfall."""
-    _load_card_database()
-    if _DB_CONN:
-        c = _DB_CONN.execute(
-            "SELECT name, set_code, lang, cardmarket_id, collector_number, id FROM cards WHERE id=?",
-            (card_id,),
-        )
-        row = c.fetchone()
-        if row:
-            return {
-                "name": row[0],
-                "set_code": row[1],
-                "language": row[2],
-                "cardmarket_id": row[3],
-                "collector_number": row[4],
-                "image_url": image_url_for(row[5]),
-            }
+    rows = _abfrage(
+        "SELECT name, set_code, lang, cardmarket_id, collector_number, id FROM cards WHERE id=?",
+        (card_id,),
+    )
+    if rows:
+        row = rows[0]
+        return {
+            "name": row[0],
+            "set_code": row[1],
+            "language": row[2],
+            "cardmarket_id": row[3],
+            "collector_number": row[4],
+            "image_url": image_url_for(row[5]),
+        }
     card = _CARDS_BY_ID.get(card_id)
     if card:
         return {
@@ -126,12 +461,12 @@ def fetch_card_info(card_id: str) -> Optional[CardInfo]:
         }
 
     try:
-        resp = requests.get(f"{SCRYFALL_API_URL}{card_id}", timeout=5)
-        resp.raise_for_status()
+        data = get_resolver().karte(card_id)
     except requests.RequestException as exc:
         print(f"❌ Fehler beim Abrufen der Kartendaten: {exc}")
         return None
-    data = resp.json()
+    if data is None:
+        return None
     return {
         "name": data.get("name"),
         "set_code": data.get("set"),
@@ -142,23 +477,44 @@ def fetch_card_info(card_id: str) -> Optional[CardInfo]:
 
 def fetch_card_info_by_name(name: str) -> Optional[CardInfo]:
     """Retrieve card details from the local database or Scryfall."""
-    _load_card_database()
-    if _DB_CONN:
-        c = _DB_CONN.execute(
-            "SELECT name, set_code, lang, cardmarket_id, collector_number, id FROM cards WHERE lower(name)=lower(?)",
+    info = _fetch_card_info_locally(name)
+    if info is not None:
+        return info
+
+    try:
+        data = get_resolver().karte_nach_name(name)
+    except requests.RequestException as exc:
+        print(f"❌ Fehler beim Abrufen der Kartendaten: {exc}")
+        return None
+    if data is None:
+        return None
+    return _info_aus_scryfall(data, name)
+
+
+def _fetch_card_info_locally(name: str) -> Optional[CardInfo]:
+    """Lokaler Teil von ``fetch_card_info_by_name`` (Arbeitsmenge, Datenbank)."""
+    menge = _arbeitsmenge()
+    drucke = menge.varianten(name) if menge is not None else None
+    if drucke:
+        d = drucke[0]
+        rows = [(d.name, d.set_code, d.lang, d.cardmarket_id, d.collector_number, d.id)]
+    else:
+        rows = _abfrage(
+            "SELECT name, set_code, lang, cardmarket_id, collector_number, id FROM cards "
+            "WHERE lower(name)=lower(?) LIMIT 1",
             (name,),
         )
-        row = c.fetchone()
-        if row:
-            return {
-                "name": row[0],
-                "set_code": row[1],
-                "language": row[2],
-                "cardmarket_id": row[3],
-                "collector_number": row[4],
-                "image_url": image_url_for(row[5]),
-                "scryfall_id": row[5],
-            }
+    if rows:
+        row = rows[0]
+        return {
+            "name": row[0],
+            "set_code": row[1],
+            "language": row[2],
+            "cardmarket_id": row[3],
+            "collector_number": row[4],
+            "image_url": image_url_for(row[5]),
+            "scryfall_id": row[5],
+        }
     card = _CARDS_BY_NAME.get(name.lower())
     if card:
         return {
@@ -170,16 +526,11 @@ def fetch_card_info_by_name(name: str) -> Optional[CardInfo]:
             "image_url": (card.get("image_uris") or {}).get("normal", ""),
             "scryfall_id": card.get("id", ""),
         }
+    return None
 
-    try:
-        resp = requests.get(
-            "https://api.scryfall.com/cards/named", params={"exact": name}, timeout=5
-        )
-        resp.raise_for_status()
-    except requests.RequestException as exc:
-        print(f"❌ Fehler beim Abrufen der Kartendaten: {exc}")
-        return None
-    data = resp.json()
+
+def _info_aus_scryfall(data: Dict, name: str) -> CardInfo:
+    """Eine Scryfall-Antwort in die Form von ``fetch_card_info_by_name`` bringen."""
     return {
         "name": data.get("name", name),
         "set_code": data.get("set", ""),
@@ -191,15 +542,106 @@ def fetch_card_info_by_name(name: str) -> Optional[CardInfo]:
     }
 
 
+def fetch_card_infos_by_name(names: Iterable[str]) -> Dict[str, Optional[CardInfo]]:
+    """``fetch_card_info_by_name`` für viele Namen auf einmal.
+
+    Lokal Gefundenes kostet keine Anfrage; alle übrigen Namen gehen gebündelt
+    über Scryfalls ``/cards/collection`` (75 je Aufruf) statt einzeln über
+    ``/cards/named``. Rückgabe: Name -> Kartendaten oder ``None``.
+    """
+    result: Dict[str, Optional[CardInfo]] = {}
+    remote: List[str] = []
+    for name in names:
+        if name in result:
+            continue
+        info = _fetch_card_info_locally(name)
+        result[name] = info
+        if info is None:
+            remote.append(name)
+    if not remote:
+        return result
+    try:
+        found = get_resolver().namen_aufloesen(remote)
+    except requests.RequestException as exc:
+        print(f"❌ Fehler beim Abrufen der Kartendaten: {exc}")
+        return result
+    for name in remote:
+        data = found.get(name)
+        if data is not None:
+            result[name] = _info_aus_scryfall(data, name)
+    return result
+
+
+#: Bildadressen je Kartenname (klein geschrieben); ``None`` = kein Druck bekannt.
+#: Wird mit der Kartendatenbank verworfen.
+_BILDER: Dict[str, Optional[str]] = {}
+#: Obergrenze des Bildspeichers; danach wird er geleert und neu gefüllt.
+BILDER_MAX = 20000
+
+
+def image_urls_for_names(names: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Bildadressen für viele Kartennamen (Groß-/Kleinschreibung egal).
+
+    Ein Name ergibt die Scryfall-ID eines Drucks — bevorzugt Englisch —, die
+    Adresse folgt aus ``image_url_for``. Gesucht wird in einer Abfrage über den
+    Index auf ``lower(name)``, Ergebnisse bleiben im Prozess gespeichert.
+    Namen ohne Druck ergeben ``None``; ohne Kartendatenbank wird nichts
+    gespeichert.
+    """
+    result: Dict[str, Optional[str]] = {}
+    offen: List[str] = []
+    for name in names:
+        if not name or name in result:
+            continue
+        schluessel = name.lower()
+        if schluessel in _BILDER:
+            result[name] = _BILDER[schluessel]
+        else:
+            result[name] = None
+            offen.append(name)
+    if not offen:
+        return result
+
+    gefunden: Dict[str, str] = {}
+    for start in range(0, len(offen), 500):
+        block = offen[start:start + 500]
+        try:
+            rows = _abfrage(
+                f"WITH gesucht(name) AS (VALUES {', '.join('(?)' for _ in block)}) "
+                "SELECT gesucht.name, cards.id FROM gesucht "
+                "JOIN cards ON lower(cards.name) = lower(gesucht.name) "
+                "ORDER BY coalesce(cards.lang, '') <> 'en', cards.id",
+                tuple(block),
+            )
+        except sqlite3.Error as exc:
+            print(f"❌ Bildsuche in der Kartendatenbank fehlgeschlagen: {exc}")
+            return result
+        if rows is None:
+            return result
+        for name, kennung in rows:
+            gefunden.setdefault(name, kennung)
+
+    if len(_BILDER) + len(offen) > BILDER_MAX:
+        _BILDER.clear()
+    for name in offen:
+        url = image_url_for(gefunden[name]) if name in gefunden else None
+        result[name] = _BILDER[name.lower()] = url or None
+    return result
+
+
+def image_url_for_name(name: str) -> Optional[str]:
+    """``image_urls_for_names`` für einen einzelnen Namen."""
+    return image_urls_for_names([name]).get(name)
+
+
 def autocomplete_names(query: str) -> list[str]:
     """Return card name suggestions from the local database or Scryfall."""
-    _load_card_database()
-    if _DB_CONN:
-        c = _DB_CONN.execute(
-            "SELECT DISTINCT name FROM cards WHERE lower(name) LIKE ? ORDER BY name LIMIT 20",
-            (f"{query.lower()}%",),
-        )
-        return [row[0] for row in c.fetchall()]
+    rows = _abfrage(
+        "SELECT DISTINCT name FROM cards WHERE lower(name) LIKE ? ORDER BY name LIMIT 20",
+        (f"{query.lower()}%",),
+    )
+    if rows is not None:
+        return [row[0] for row in rows]
     if _CARDS_BY_NAME:
         query_l = query.lower()
         matches = [
@@ -211,17 +653,10 @@ def autocomplete_names(query: str) -> list[str]:
             return matches[:20]
 
     try:
-        resp = requests.get(
-            "https://api.scryfall.com/cards/autocomplete",
-            params={"q": query},
-            timeout=5,
-        )
-        resp.raise_for_status()
+        return get_resolver().autocomplete(query)
     except requests.RequestException as exc:
         print(f"❌ Fehler beim Abrufen der Kartenvorschläge: {exc}")
         return []
-    data = resp.json()
-    return data.get("data", [])
 
 def scan_and_queue(image_path: str) -> None:
     """Scan a card from an image and put its info into the queue."""
@@ -236,14 +671,22 @@ def scan_and_queue(image_path: str) -> None:
 
 def fetch_variants(name: str) -> List[CardInfo]:
     """Return all card variants matching the given name."""
-    _load_card_database()
     results: List[CardInfo] = []
-    if _DB_CONN:
-        c = _DB_CONN.execute(
-            "SELECT id, name, set_code, lang, collector_number, cardmarket_id FROM cards WHERE lower(name)=lower(?) ORDER BY set_code",
+    menge = _arbeitsmenge()
+    drucke = menge.varianten(name) if menge is not None else None
+    if drucke is not None:
+        rows = [(d.id, d.name, d.set_code, d.lang, d.collector_number, d.cardmarket_id)
+                for d in sorted(drucke, key=lambda d: (d.set_code or "",
+                                                       d.collector_number or "",
+                                                       d.lang or ""))]
+    else:
+        rows = _abfrage(
+            "SELECT id, name, set_code, lang, collector_number, cardmarket_id FROM cards WHERE lower(name)=lower(?) "
+            "ORDER BY set_code, collector_number, lang",
             (name,),
         )
-        for row in c.fetchall():
+    if rows is not None:
+        for row in rows:
             results.append(
                 {
                     "scryfall_id": row[0],
@@ -304,23 +747,23 @@ def _lookup_set_code_in_db(set_name: str, truncated: bool) -> Optional[str]:
     Returns a code only when it is unambiguous (exactly one matching set_code).
     Gracefully returns ``None`` if the column is missing (older DB build).
     """
-    if not _DB_CONN:
-        return None
     try:
         if truncated:
             stem = set_name.rstrip("… .").rstrip(".")
-            cur = _DB_CONN.execute(
+            rows = _abfrage(
                 "SELECT DISTINCT set_code FROM cards WHERE lower(set_name) LIKE lower(?)",
                 (stem + "%",),
             )
         else:
-            cur = _DB_CONN.execute(
+            rows = _abfrage(
                 "SELECT DISTINCT set_code FROM cards WHERE lower(set_name) = lower(?)",
                 (set_name,),
             )
-        codes = [r[0] for r in cur.fetchall() if r[0]]
     except sqlite3.Error:
         return None
+    if rows is None:
+        return None
+    codes = [r[0] for r in rows if r[0]]
     if len(codes) == 1:
         return codes[0]
     return None
@@ -357,6 +800,52 @@ def resolve_set_code(set_name: str | None) -> Tuple[Optional[str], str]:
     return None, ("low" if truncated else "none")
 
 
+def resolve_set_codes(
+    set_names: Iterable[str | None],
+) -> Dict[Optional[str], Tuple[Optional[str], str]]:
+    """Resolve many Cardmarket set names at once (same rules as ``resolve_set_code``).
+
+    Returns ``{set_name: (set_code, confidence)}`` for every distinct input.
+    Aliases are answered from memory, all remaining complete names are looked
+    up with a single query against the local Scryfall data; only truncated
+    names (rare, and never high confidence) take the per-name path.
+    """
+    result: Dict[Optional[str], Tuple[Optional[str], str]] = {}
+    lookup: List[str] = []
+    for set_name in dict.fromkeys(set_names):
+        if not set_name:
+            result[set_name] = (None, "none")
+            continue
+        key = set_name.strip().lower()
+        if "..." in key or "…" in key:
+            result[set_name] = resolve_set_code(set_name)
+        elif key in SET_NAME_ALIASES:
+            result[set_name] = (SET_NAME_ALIASES[key], "high")
+        else:
+            lookup.append(set_name)
+    if not lookup:
+        return result
+
+    codes: Dict[str, set] = defaultdict(set)
+    try:
+        values = ", ".join("(?)" for _ in lookup)
+        rows = _abfrage(
+            f"WITH wanted(name) AS (VALUES {values}) "
+            "SELECT DISTINCT wanted.name, cards.set_code FROM wanted "
+            "JOIN cards ON lower(cards.set_name) = lower(wanted.name)",
+            tuple(lookup),
+        )
+    except sqlite3.Error:
+        rows = None
+    for name, code in rows or ():
+        if code:
+            codes[name].add(code)
+    for set_name in lookup:
+        found = codes.get(set_name, ())
+        result[set_name] = (next(iter(found)), "high") if len(found) == 1 else (None, "none")
+    return result
+
+
 def _choose_by_language(rows: List[Dict], language: str | None) -> Dict:
     """Pick the best row for a language: exact match, else English, else the
     first (deterministic). Rows must expose a ``lang`` key.
@@ -385,22 +874,33 @@ def find_by_identity(
     collector_number)`` match at all — the caller routes those to Needs-Review
     instead of importing with a missing identity.
 
-    Note: the local ``default-cards`` database may only contain one printing per
-    card (usually English). When the exact language is absent we fall back to the
-    English printing for the canonical IDs/name/image; the card's own language is
-    still taken from the import (kept by the caller), so no identity is guessed.
+    Note: a database built from ``default_cards`` may only contain one printing
+    per card (usually English). When the exact language is absent we fall back to
+    the English printing for the canonical IDs/name/image; the card's own language
+    is still taken from the import (kept by the caller), so no identity is
+    guessed. A database built from ``all_cards`` (``build_card_db
+    --alle-sprachen``) holds every language, so the exact printing is found.
     """
     if not set_code or not collector_number:
         return None
-    _load_card_database()
 
-    if _DB_CONN:
-        c = _DB_CONN.execute(
+    menge = _arbeitsmenge()
+    drucke = (menge.identitaet(set_code.lower(), str(collector_number))
+              if menge is not None else None)
+    if drucke is not None:
+        found = [d.als_dict() for d in drucke]
+    else:
+        # Scryfall stores set codes in lower case; comparing the plain column
+        # keeps the (set_code, collector_number, lang) index usable.
+        found = _abfrage(
             "SELECT id, name, set_code, lang, cardmarket_id, collector_number "
-            "FROM cards WHERE lower(set_code)=lower(?) AND collector_number=?",
-            (set_code, str(collector_number)),
+            "FROM cards WHERE set_code=? AND collector_number=?",
+            (set_code.lower(), str(collector_number)),
         )
-        rows = [dict(r) for r in c.fetchall()]
+        if found:
+            _merke_set(set_code.lower())
+    if found is not None:
+        rows = [dict(r) for r in found]
         if not rows:
             return None
         row = _choose_by_language(rows, language)
@@ -441,3 +941,71 @@ def find_by_identity(
         "collector_number": row["collector_number"],
         "image_url": row["image_url"],
     }
+
+
+# ---------------------------------------------------------------------------
+# Messung: Abfragedauer und Speicherbedarf der Leseverbindungen
+# ---------------------------------------------------------------------------
+def _rss_mb() -> Optional[float]:
+    """Aktueller Arbeitsspeicher des Prozesses in MB (nur Linux, sonst ``None``)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            seiten = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(seiten * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+
+
+def messe_abfragen(anzahl: int = 2000, threads: int = 1) -> Dict[str, object]:
+    """Identitätssuchen gegen die lokale Kartendatenbank zeitlich messen.
+
+    Gezogen werden ``anzahl`` echte ``(set_code, collector_number, lang)`` aus
+    der Datenbank; jeder der ``threads`` Threads schlägt sie alle nach. Die
+    Werte (Median/95. Perzentil in Mikrosekunden, RSS vorher/nachher) dienen
+    dem Einstellen von ``TCG_CARDDB_MMAP_MB``, ``TCG_CARDDB_CACHE_KB`` und
+    ``TCG_CARDDB_POOL`` auf dem Gerät.
+    """
+    import time
+
+    rss_vorher = _rss_mb()
+    stichprobe = _abfrage(
+        "SELECT set_code, collector_number, lang FROM cards "
+        "ORDER BY random() LIMIT ?", (anzahl,))
+    if not stichprobe:
+        raise RuntimeError("Keine Kartendatenbank zum Messen vorhanden.")
+    dauern: List[float] = []
+    sperre = threading.Lock()
+
+    def lauf() -> None:
+        eigene = []
+        for set_code, nummer, lang in stichprobe:
+            beginn = time.perf_counter()
+            find_by_identity(set_code, nummer, lang)
+            eigene.append(time.perf_counter() - beginn)
+        with sperre:
+            dauern.extend(eigene)
+
+    beginn = time.perf_counter()
+    arbeiter = [threading.Thread(target=lauf) for _ in range(max(1, threads))]
+    for t in arbeiter:
+        t.start()
+    for t in arbeiter:
+        t.join()
+    gesamt = time.perf_counter() - beginn
+    dauern.sort()
+    return {
+        "abfragen": len(dauern),
+        "threads": len(arbeiter),
+        "median_us": round(dauern[len(dauern) // 2] * 1e6, 1),
+        "p95_us": round(dauern[int(len(dauern) * 0.95) - 1] * 1e6, 1),
+        "abfragen_je_sekunde": round(len(dauern) / gesamt) if gesamt else 0,
+        "verbindungen": _DB_POOL.offen if _DB_POOL else 0,
+        "rss_vorher_mb": rss_vorher,
+        "rss_nachher_mb": _rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    _threads = int(sys.argv[sys.argv.index("--threads") + 1]) if "--threads" in sys.argv else 1
+    for _schluessel, _wert in messe_abfragen(threads=_threads).items():
+        print(f"{_schluessel:20} {_wert}")
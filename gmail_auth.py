@@ -3,6 +3,7 @@
 import os
 import base64
 import pickle
+import weakref
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 from pathlib import Path
@@ -80,13 +81,107 @@ def get_gmail_service():
         return None
 
 
-def fetch_cardmarket_emails(service, processed_message_ids=None):
+#: Search for Cardmarket shipping emails (German and English variants) that
+#: have not been labelled as processed yet.
+CARDMARKET_QUERY = ('from:noreply@cardmarket.com (subject:"Bitte versenden" OR '
+                    'subject:"Please ship") -label:processed-tcg')
+
+#: Requests per Gmail batch call. The API accepts up to 100; Google recommends
+#: staying at 50 or below to avoid per-user rate limiting.
+BATCH_SIZE = 50
+
+#: Safety cap for one sync run (``messages.list`` pages through 500 at a time).
+MAX_MESSAGES = 2000
+
+#: Cardmarket sender and subjects, for filtering messages reported by
+#: ``history.list`` (which, unlike ``messages.list``, takes no search query).
+CARDMARKET_SENDER = 'noreply@cardmarket.com'
+CARDMARKET_SUBJECTS = ('bitte versenden', 'please ship')
+
+#: Partial response for ``messages.get``: only what the parser and
+#: ``get_email_body``/``get_email_subject``/``get_email_date`` read.
+MESSAGE_FIELDS = ('id,threadId,historyId,internalDate,'
+                  'payload(mimeType,headers,body/data,'
+                  'parts(mimeType,body/data,parts(mimeType,body/data)))')
+
+
+def list_message_ids(service, query=CARDMARKET_QUERY, max_messages=MAX_MESSAGES):
+    """
+    List the IDs of all messages matching ``query``, following pagination.
+
+    Returns:
+        List of message IDs (newest first, as Gmail returns them)
+    """
+    ids = []
+    page_token = None
+    while len(ids) < max_messages:
+        kwargs = {'userId': 'me', 'q': query,
+                  'maxResults': min(500, max_messages - len(ids)),
+                  'fields': 'messages/id,nextPageToken'}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        results = service.users().messages().list(**kwargs).execute()
+        ids.extend(m['id'] for m in results.get('messages', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    return ids
+
+
+def get_messages(service, message_ids, batch_size=BATCH_SIZE, **get_kwargs):
+    """
+    Fetch messages in Gmail batch requests (``batch_size`` per HTTP call).
+
+    By default the full message is requested, limited to ``MESSAGE_FIELDS``;
+    ``get_kwargs`` override the ``messages.get`` parameters (e.g. a metadata
+    fetch). Messages that fail individually are reported and left out; the
+    order of ``message_ids`` is kept. Services without batch support (test
+    doubles) are queried one by one.
+
+    Returns:
+        List of message objects
+    """
+    get_kwargs = {'format': 'full', 'fields': MESSAGE_FIELDS, **get_kwargs}
+    fetched = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            print(f'Error fetching message {request_id}: {exception}')
+            return
+        fetched[request_id] = response
+
+    new_batch = getattr(service, 'new_batch_http_request', None)
+    for start in range(0, len(message_ids), batch_size):
+        chunk = message_ids[start:start + batch_size]
+        if new_batch is None:
+            for msg_id in chunk:
+                try:
+                    callback(msg_id, service.users().messages().get(
+                        userId='me', id=msg_id, **get_kwargs).execute(), None)
+                except HttpError as error:
+                    callback(msg_id, None, error)
+            continue
+        batch = new_batch(callback=callback)
+        for msg_id in chunk:
+            batch.add(service.users().messages().get(
+                userId='me', id=msg_id, **get_kwargs), request_id=msg_id)
+        try:
+            batch.execute()
+        except HttpError as error:
+            print(f'Error executing Gmail batch: {error}')
+    return [fetched[msg_id] for msg_id in message_ids if msg_id in fetched]
+
+
+def fetch_cardmarket_emails(service, processed_message_ids=None, known_ids_lookup=None):
     """
     Fetch unprocessed Cardmarket "Bitte versenden" emails.
     
     Args:
         service: Gmail API service object
         processed_message_ids: Set of already processed message IDs
+        known_ids_lookup: Optional callable that receives the listed message
+            IDs and returns those already stored as orders. They are skipped
+            before anything is downloaded.
         
     Returns:
         List of message objects with id, snippet, and payload
@@ -95,47 +190,143 @@ def fetch_cardmarket_emails(service, processed_message_ids=None):
         processed_message_ids = set()
     
     try:
-        # Query for Cardmarket shipping emails (German and English variants)
-        query = 'from:noreply@cardmarket.com (subject:"Bitte versenden" OR subject:"Please ship") -label:processed-tcg'
-        
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=100
-        ).execute()
-        
-        messages = results.get('messages', [])
+        message_ids = [msg_id for msg_id in list_message_ids(service)
+                       if msg_id not in processed_message_ids]
+        if message_ids and known_ids_lookup is not None:
+            known = known_ids_lookup(message_ids)
+            message_ids = [msg_id for msg_id in message_ids if msg_id not in known]
         
-        if not messages:
+        if not message_ids:
             return []
         
-        # Fetch full message details
-        full_messages = []
-        for msg in messages:
-            msg_id = msg['id']
-            
-            # Skip if already processed
-            if msg_id in processed_message_ids:
-                continue
-            
-            try:
-                message = service.users().messages().get(
-                    userId='me',
-                    id=msg_id,
-                    format='full'
-                ).execute()
-                full_messages.append(message)
-            except HttpError as error:
-                print(f'Error fetching message {msg_id}: {error}')
-                continue
-        
-        return full_messages
+        return get_messages(service, message_ids)
         
     except HttpError as error:
         print(f'An error occurred fetching emails: {error}')
         return []
 
 
+def get_history_id(service):
+    """
+    Return the mailbox's current ``historyId``.
+
+    Taken before a full search, it is the cursor from which ``history.list``
+    reports everything that arrives afterwards.
+
+    Returns:
+        historyId as string, or None if the profile could not be read
+    """
+    try:
+        profile = service.users().getProfile(userId='me', fields='historyId').execute()
+        return profile.get('historyId')
+    except HttpError as error:
+        print(f'Error reading Gmail history id: {error}')
+        return None
+
+
+def list_added_message_ids(service, start_history_id, max_messages=MAX_MESSAGES):
+    """
+    List the IDs of messages added since ``start_history_id``.
+
+    Returns:
+        Tuple of (message IDs, newest historyId). The historyId is None if
+        the listing stopped at ``max_messages`` with pages left: the cursor
+        must not move past messages that were never listed. Raises
+        ``HttpError`` — status 404 means the cursor is too old and a full
+        search is needed.
+    """
+    ids = []
+    seen = set()
+    history_id = start_history_id
+    page_token = None
+    while len(ids) < max_messages:
+        kwargs = {'userId': 'me', 'startHistoryId': start_history_id,
+                  'historyTypes': 'messageAdded', 'maxResults': 500,
+                  'fields': 'history/messagesAdded/message/id,historyId,nextPageToken'}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        results = service.users().history().list(**kwargs).execute()
+        history_id = results.get('historyId', history_id)
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                msg_id = added['message']['id']
+                if msg_id not in seen:
+                    seen.add(msg_id)
+                    ids.append(msg_id)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    if page_token:
+        return ids, None
+    return ids, history_id
+
+
+def is_cardmarket_order_email(message):
+    """
+    Check sender, subject and labels the way ``CARDMARKET_QUERY`` does.
+
+    Works on metadata-only messages (headers and ``labelIds``).
+    """
+    labels = set(message.get('labelIds', []))
+    if labels & {'SPAM', 'TRASH'}:
+        return False
+    headers = {h['name'].lower(): h['value']
+               for h in message.get('payload', {}).get('headers', [])}
+    if CARDMARKET_SENDER not in headers.get('from', '').lower():
+        return False
+    subject = headers.get('subject', '').lower()
+    return any(s in subject for s in CARDMARKET_SUBJECTS)
+
+
+def fetch_new_cardmarket_emails(service, start_history_id, processed_message_ids=None,
+                                known_ids_lookup=None):
+    """
+    Fetch Cardmarket emails that arrived since ``start_history_id``.
+
+    Polling costs a single ``history.list`` call while nothing new has
+    arrived. New messages are first fetched as metadata (sender, subject) and
+    only Cardmarket order mails are downloaded in full.
+
+    Returns:
+        Tuple of (messages, newest historyId), or None if the cursor has
+        expired (or more than ``MAX_MESSAGES`` messages arrived since) and the
+        caller has to fall back to ``fetch_cardmarket_emails``
+    """
+    if processed_message_ids is None:
+        processed_message_ids = set()
+
+    try:
+        message_ids, history_id = list_added_message_ids(service, start_history_id)
+    except HttpError as error:
+        if getattr(error.resp, 'status', None) == 404:
+            print('Gmail history cursor expired, running a full search')
+            return None
+        print(f'An error occurred reading Gmail history: {error}')
+        return [], start_history_id
+    if history_id is None:
+        print('Too many messages since the Gmail history cursor, running a full search')
+        return None
+
+    message_ids = [msg_id for msg_id in message_ids
+                   if msg_id not in processed_message_ids]
+    if message_ids and known_ids_lookup is not None:
+        known = known_ids_lookup(message_ids)
+        message_ids = [msg_id for msg_id in message_ids if msg_id not in known]
+    if not message_ids:
+        return [], history_id
+
+    headers = get_messages(service, message_ids, format='metadata',
+                           metadataHeaders=['From', 'Subject'],
+                           fields='id,labelIds,payload/headers')
+    wanted = [m['id'] for m in headers if is_cardmarket_order_email(m)]
+    messages = get_messages(service, wanted) if wanted else []
+    if len(headers) < len(message_ids) or len(messages) < len(wanted):
+        # Something could not be fetched: keep the old cursor so the next
+        # poll sees these messages again (already stored ones are skipped).
+        history_id = start_history_id
+    return messages, history_id
+
+
 def hole_nachricht(service, message_id):
     """Eine einzelne Mail anhand ihrer Gmail-ID holen.
 
@@ -161,47 +352,71 @@ def hole_nachricht(service, message_id):
         return None
 
 
-def mark_message_processed(service, message_id):
+#: Label that marks imported Cardmarket mails (excluded by ``CARDMARKET_QUERY``).
+PROCESSED_LABEL = 'processed-tcg'
+
+#: ``messages.batchModify`` accepts up to 1000 message IDs per call.
+MODIFY_BATCH_SIZE = 1000
+
+# Label IDs resolved per service instance: {service: {label name: label id}}
+_label_ids = weakref.WeakKeyDictionary()
+
+
+def mark_messages_processed(service, message_ids):
     """
-    Mark a Gmail message as processed by adding a custom label.
-    
+    Mark Gmail messages as processed by adding the processed label.
+
+    All messages are labelled with ``messages.batchModify`` (up to 1000 per
+    call) instead of one ``modify`` per message. Labelling is idempotent, so
+    a failed call can simply be repeated with the same IDs.
+
     Args:
         service: Gmail API service object
-        message_id: ID of the message to mark
-        
+        message_ids: IDs of the messages to mark
+
     Returns:
-        True if successful, False otherwise
+        True if all messages were marked, False otherwise
     """
+    message_ids = list(dict.fromkeys(message_ids))
+    if not message_ids:
+        return True
     try:
-        # Get or create the processed-tcg label
-        label_id = get_or_create_label(service, 'processed-tcg')
-        
-        if not label_id:
-            # Fallback: just mark as read
-            service.users().messages().modify(
+        label_id = get_or_create_label(service, PROCESSED_LABEL)
+        # Fallback without label: just mark as read
+        body = ({'addLabelIds': [label_id]} if label_id
+                else {'removeLabelIds': ['UNREAD']})
+        for start in range(0, len(message_ids), MODIFY_BATCH_SIZE):
+            service.users().messages().batchModify(
                 userId='me',
-                id=message_id,
-                body={'removeLabelIds': ['UNREAD']}
+                body={'ids': message_ids[start:start + MODIFY_BATCH_SIZE], **body}
             ).execute()
-            return True
-        
-        # Add the label
-        service.users().messages().modify(
-            userId='me',
-            id=message_id,
-            body={'addLabelIds': [label_id]}
-        ).execute()
-        
         return True
-        
+
     except HttpError as error:
-        print(f'Error marking message as processed: {error}')
+        print(f'Error marking messages as processed: {error}')
         return False
 
 
+def mark_message_processed(service, message_id):
+    """
+    Mark a single Gmail message as processed by adding the processed label.
+
+    Args:
+        service: Gmail API service object
+        message_id: ID of the message to mark
+
+    Returns:
+        True if successful, False otherwise
+    """
+    return mark_messages_processed(service, [message_id])
+
+
 def get_or_create_label(service, label_name):
     """
     Get or create a Gmail label.
+
+    The ID is resolved once per service instance and cached, so labelling
+    many messages costs no further ``labels.list`` calls.
     
     Args:
         service: Gmail API service object
@@ -210,14 +425,23 @@ def get_or_create_label(service, label_name):
     Returns:
         Label ID or None if failed
     """
+    try:
+        cached = _label_ids.setdefault(service, {})
+    except TypeError:
+        cached = {}
+    if label_name in cached:
+        return cached[label_name]
+
     try:
         # List all labels
-        results = service.users().labels().list(userId='me').execute()
+        results = service.users().labels().list(
+            userId='me', fields='labels(id,name)').execute()
         labels = results.get('labels', [])
         
         # Check if label exists
         for label in labels:
             if label['name'] == label_name:
+                cached[label_name] = label['id']
                 return label['id']
         
         # Create label if it doesn't exist
@@ -232,6 +456,7 @@ def get_or_create_label(service, label_name):
             body=label_object
         ).execute()
         
+        cached[label_name] = created_label['id']
         return created_label['id']
         
     except HttpError as error:
@@ -6,6 +6,7 @@ from tabulate import tabulate
 import csv
 
 from . import DB_FILE
+from .schreiber import schreibe
 
 __all__ = [
     "add_card",
@@ -74,15 +75,8 @@ def log_audit(card_id: int, user: str, action: str, field_name: str = None,
               old_value: str = None, new_value: str = None, cursor: sqlite3.Cursor = None) -> None:
     """Log an audit entry for a card change."""
     if cursor is None:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO audit_log (card_id, user, action, field_name, old_value, new_value, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (card_id, user, action, field_name, old_value, new_value, datetime.now().isoformat())
-            )
+        schreibe(lambda conn: log_audit(card_id, user, action, field_name,
+                                        old_value, new_value, conn.cursor()), DB_FILE)
     else:
         cursor.execute(
             """
@@ -135,7 +129,7 @@ def add_card(
                 f"ℹ️ Kein freier Lagerplatz für {target}. Karte wird ohne Lagerplatz gespeichert."
             )
 
-    with sqlite3.connect(DB_FILE) as conn:
+    def einfuegen(conn):
         cursor = conn.cursor()
 
         # Lagerplatz als belegt markieren
@@ -176,6 +170,8 @@ def add_card(
             ),
         )
 
+    schreibe(einfuegen, DB_FILE)
+
     message = f"✅ {'Karte' if item_type == 'card' else 'Display-Item'} '{name}' erfolgreich hinzugefügt"
     if storage_code:
         message += f" und auf '{storage_code}' abgelegt."
@@ -249,7 +245,7 @@ def add_or_increment_card(
             set_code, collector_number, language, foil, folder_id
         )
         if existing is not None:
-            with sqlite3.connect(DB_FILE) as conn:
+            def erhoehen(conn):
                 cursor = conn.cursor()
                 cursor.execute("SELECT quantity FROM cards WHERE id = ?", (existing,))
                 old_qty = cursor.fetchone()[0] or 0
@@ -258,7 +254,9 @@ def add_or_increment_card(
                     "UPDATE cards SET quantity = ? WHERE id = ?", (new_qty, existing)
                 )
                 log_audit(existing, user, "update", "quantity", str(old_qty), str(new_qty), cursor)
-                conn.commit()
+                return old_qty, new_qty
+
+            old_qty, new_qty = schreibe(erhoehen, DB_FILE)
             print(f"➕ Menge von '{name}' erhöht: {old_qty} → {new_qty}.")
             return True
 
@@ -410,7 +408,7 @@ def update_card(card_id, user="system", **kwargs):
         print("⚠️ Keine Felder zum Aktualisieren angegeben.")
         return
 
-    with sqlite3.connect(DB_FILE) as conn:
+    def aendern(conn):
         cursor = conn.cursor()
         
         # Get current values for audit logging
@@ -419,7 +417,7 @@ def update_card(card_id, user="system", **kwargs):
         
         if old_row is None:
             print(f"⚠️ Keine Karte mit ID {card_id} gefunden.")
-            return
+            return False
 
         fields = []
         values = []
@@ -437,7 +435,11 @@ def update_card(card_id, user="system", **kwargs):
 
         query = f"UPDATE cards SET {', '.join(fields)} WHERE id = ?"
         cursor.execute(query, values)
-        
+        return True
+
+    if not schreibe(aendern, DB_FILE):
+        return
+
     # Note: reaching quantity 0 no longer archives the card. Archiving was
     # removed (CLAUDE.md — no archiving); a sold-out card is removed via
     # ``sell_card`` and its slot freed. A manual edit to 0 leaves the row for
@@ -446,7 +448,7 @@ def update_card(card_id, user="system", **kwargs):
 
 # ❌ Funktion: Karte löschen
 def delete_card(card_id):
-    with sqlite3.connect(DB_FILE) as conn:
+    def loeschen(conn):
         cursor = conn.cursor()
 
         # Lagerplatz freigeben
@@ -466,6 +468,8 @@ def delete_card(card_id):
         else:
             print(f"⚠️ Keine Karte mit ID {card_id} gefunden.")
 
+    schreibe(loeschen, DB_FILE)
+
 
 def _free_slot_if_unused(cursor: sqlite3.Cursor, storage_code: str, keep_card_id: int) -> None:
     """Mark a storage slot as free, but only if no *other* card still sits on it.
@@ -497,7 +501,7 @@ def sell_card(card_id: int, user="system") -> bool:
     audit log (including the name), and the sales history lives in the orders
     data — deleting the inventory row does not lose it.
     """
-    with sqlite3.connect(DB_FILE) as conn:
+    def verkaufen(conn):
         cursor = conn.cursor()
         cursor.execute("SELECT quantity, storage_code, name FROM cards WHERE id = ?", (card_id,))
         row = cursor.fetchone()
@@ -515,7 +519,6 @@ def sell_card(card_id: int, user="system") -> bool:
                 (new_qty, card_id),
             )
             log_audit(card_id, user, 'sell', 'quantity', str(qty), str(new_qty), cursor)
-            conn.commit()
             print(f"🛒 Karte verkauft. {new_qty} verbleibend.")
             return True
         else:
@@ -525,10 +528,11 @@ def sell_card(card_id: int, user="system") -> bool:
             log_audit(card_id, user, 'sell-remove', 'name', name, 'verkauft', cursor)
             _free_slot_if_unused(cursor, storage_code, card_id)
             cursor.execute("DELETE FROM cards WHERE id = ?", (card_id,))
-            conn.commit()
             print("🛒 Karte verkauft, Zeile entfernt und Lagerplatz freigegeben.")
             return True
 
+    return schreibe(verkaufen, DB_FILE)
+
 
 def reconcile_slot_occupancy() -> int:
     """Recompute every storage slot's occupancy from the current cards.
@@ -0,0 +1,397 @@
+"""Mail sources for order ingestion.
+
+``OrderIngestionService.sync_orders`` reads its mails from a ``MailSource``:
+
+* ``GmailSource`` — the live mailbox (history cursor, batch fetching, labels),
+* ``ReplaySource`` — saved mails on disk: an mbox file, a Maildir or a
+  directory of ``.eml`` files.
+
+Both feed the same parse → archive → save path. That makes parser
+regressions and ingestion speed measurable without network access; see
+``benchmark`` and ``python -m TCGInventory.mail_sources --bench``.
+"""
+
+from __future__ import annotations
+
+import abc
+import hashlib
+import json
+import mailbox
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from TCGInventory.gmail_auth import (
+    fetch_cardmarket_emails,
+    fetch_new_cardmarket_emails,
+    get_email_body,
+    get_email_date,
+    get_email_subject,
+    get_history_id,
+    get_messages,
+    mark_messages_processed,
+)
+
+# Keys in ``sync_stand``: the Gmail history cursor, the IDs of processed
+# messages whose label could not be set yet and the IDs of fetched messages
+# that were not processed (both retried on the next run)
+HISTORY_CURSOR_KEY = "gmail_history_id"
+LABEL_BACKLOG_KEY = "gmail_unlabelled"
+RETRY_KEY = "gmail_retry"
+
+
+@dataclass
+class MailMessage:
+    """One order mail as the ingestion pipeline needs it."""
+
+    message_id: str
+    body: str
+    subject: str = ""
+    date: Optional[str] = None
+
+
+class MailSource(abc.ABC):
+    """Interface of a mail source.
+
+    A sync run calls ``open``, then ``fetch``, reports what it has processed
+    via ``mark_processed`` and ends with ``finish``.
+    """
+
+    #: Message shown when ``open`` fails.
+    error = "Mail source not available."
+
+    def open(self) -> bool:
+        """Connect; False if the source cannot be used right now."""
+        return True
+
+    @abc.abstractmethod
+    def fetch(self, known_ids_lookup: Optional[Callable] = None) -> List[MailMessage]:
+        """New order mails. ``known_ids_lookup`` returns IDs already stored."""
+
+    def mark_processed(self, message_ids: List[str]) -> None:
+        """Remember that these mails have been handled."""
+
+    def finish(self) -> None:
+        """Persist whatever the next run starts from."""
+
+
+class GmailSource(MailSource):
+    """The live Gmail mailbox.
+
+    Polls incrementally from the persisted history cursor (full search on the
+    first run or once the cursor has expired) and labels all processed
+    messages with one ``batchModify`` in ``finish``. Fetched messages that
+    were not processed (empty body, order not saved) are kept in
+    ``sync_stand`` and fetched again on the next run, since the cursor has
+    already moved past them.
+    """
+
+    error = "Gmail authentication failed. Check credentials."
+
+    def __init__(self, service_factory: Callable, load_value: Callable,
+                 save_value: Callable, processed_message_ids: Optional[Set[str]] = None):
+        """
+        Args:
+            service_factory: Returns a Gmail service object (or None)
+            load_value: ``key -> value`` reader for ``sync_stand``
+            save_value: ``(key, value)`` writer for ``sync_stand``
+            processed_message_ids: In-memory set of handled message IDs
+        """
+        self.service_factory = service_factory
+        self.load_value = load_value
+        self.save_value = save_value
+        self.processed_message_ids = (processed_message_ids
+                                      if processed_message_ids is not None else set())
+        self.service = None
+        self.new_cursor = None
+        self.to_label: List[str] = []
+        self.retry: List[str] = []
+        self.fetched: List[str] = []
+
+    def open(self) -> bool:
+        self.service = self.service_factory()
+        if not self.service:
+            return False
+        # Processed messages are labelled together at the end of the run,
+        # including those a previous run could not label.
+        self.to_label = self._load_ids(LABEL_BACKLOG_KEY)
+        self.retry = self._load_ids(RETRY_KEY)
+        return True
+
+    def _load_ids(self, key) -> List[str]:
+        stored = self.load_value(key)
+        try:
+            return list(json.loads(stored)) if stored else []
+        except ValueError:
+            return []
+
+    def fetch(self, known_ids_lookup=None):
+        # Incremental poll from the stored history cursor; without a cursor
+        # (first run) or once it has expired, run the full search and start a
+        # new cursor. Mails that already became an order are skipped before
+        # they are downloaded.
+        cursor = self.load_value(HISTORY_CURSOR_KEY)
+        result = None
+        if cursor:
+            result = fetch_new_cardmarket_emails(
+                self.service, cursor, self.processed_message_ids,
+                known_ids_lookup=known_ids_lookup)
+        if result is None:
+            self.new_cursor = get_history_id(self.service)
+            messages = fetch_cardmarket_emails(
+                self.service, self.processed_message_ids,
+                known_ids_lookup=known_ids_lookup)
+        else:
+            messages, self.new_cursor = result
+
+        fetched = {m['id'] for m in messages}
+        retry = [msg_id for msg_id in dict.fromkeys(self.retry)
+                 if msg_id not in fetched and msg_id not in self.processed_message_ids]
+        if retry and known_ids_lookup is not None:
+            known = known_ids_lookup(retry)
+            retry = [msg_id for msg_id in retry if msg_id not in known]
+        if retry:
+            messages = list(messages) + get_messages(self.service, retry)
+        # Retries that could not be fetched this time stay on the list.
+        self.fetched = [m['id'] for m in messages]
+        got = set(self.fetched)
+        self.fetched += [msg_id for msg_id in retry if msg_id not in got]
+        return [MailMessage(m['id'], get_email_body(m), get_email_subject(m),
+                            get_email_date(m)) for m in messages]
+
+    def mark_processed(self, message_ids):
+        self.to_label.extend(message_ids)
+        self.processed_message_ids.update(message_ids)
+
+    def finish(self):
+        """
+        Label processed messages in one ``batchModify`` call and store the cursor.
+
+        If labelling fails, the IDs are kept in ``sync_stand`` and retried on
+        the next run. Until then the orders table prevents a second import.
+        The same goes for fetched messages that were not processed.
+        """
+        to_label = list(dict.fromkeys(self.to_label))
+        if to_label:
+            if mark_messages_processed(self.service, to_label):
+                to_label = []
+            self.save_value(LABEL_BACKLOG_KEY, json.dumps(to_label))
+        retry = [msg_id for msg_id in self.fetched
+                 if msg_id not in self.processed_message_ids]
+        if retry or self.retry:
+            self.save_value(RETRY_KEY, json.dumps(retry))
+        if self.new_cursor:
+            self.save_value(HISTORY_CURSOR_KEY, str(self.new_cursor))
+
+
+class ReplaySource(MailSource):
+    """Saved mails on disk: an mbox file, a Maildir or a directory of ``.eml``."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.error = f"Mail source {self.path} not found."
+
+    def open(self) -> bool:
+        return self.path.exists()
+
+    def _raw_messages(self) -> Iterator[bytes]:
+        if self.path.is_file():
+            box = mailbox.mbox(str(self.path), create=False)
+        elif (self.path / "cur").is_dir():
+            box = mailbox.Maildir(str(self.path), create=False)
+        else:
+            for eml in sorted(self.path.rglob("*.eml")):
+                yield eml.read_bytes()
+            return
+        try:
+            for key in box.keys():
+                yield box.get_bytes(key)
+        finally:
+            box.close()
+
+    @staticmethod
+    def parse(raw: bytes) -> MailMessage:
+        """Turn a raw RFC 822 mail into a ``MailMessage``."""
+        msg = message_from_bytes(raw, policy=policy.default)
+        message_id = (msg.get("Message-ID") or "").strip().strip("<>")
+        if not message_id:
+            message_id = "replay-" + hashlib.sha1(raw).hexdigest()[:16]
+        part = msg.get_body(preferencelist=("plain", "html"))
+        body = part.get_content() if part is not None else ""
+        date = None
+        if msg.get("Date"):
+            try:
+                parsed = parsedate_to_datetime(str(msg["Date"]))
+                if parsed.tzinfo is not None:
+                    parsed = parsed.astimezone().replace(tzinfo=None)
+                date = parsed.isoformat()
+            except (TypeError, ValueError):
+                pass
+        return MailMessage(message_id, body, str(msg.get("Subject") or ""), date)
+
+    def fetch(self, known_ids_lookup=None):
+        messages = [self.parse(raw) for raw in self._raw_messages()]
+        if messages and known_ids_lookup is not None:
+            known = known_ids_lookup([m.message_id for m in messages])
+            messages = [m for m in messages if m.message_id not in known]
+        return messages
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+_CARDS = [
+    ("Force of Negation", "Modern Horizons", "R", "1,06"),
+    ("Lightning Bolt", "Magic 2010", "C", "1,20"),
+    ("Sothera, the Supervoid", "Edge of Eternities", "M", "3,98"),
+    ("Counterspell", "Dominaria Remastered", "U", "0,45"),
+    ("Thoughtseize", "Theros", "R", "9,80"),
+    ("Llanowar Elves", "Dominaria", "C", "0,10"),
+]
+
+
+def synthetic_mail(number: int, positions: int = 3, rng: Optional[random.Random] = None
+                   ) -> EmailMessage:
+    """A Cardmarket "Bitte versenden" mail in the format the parser expects."""
+    rng = rng or random.Random(number)
+    buyer = f"Kaeufer{number}"
+    lines = []
+    total = 0.0
+    for _ in range(positions):
+        name, set_name, rarity, price = rng.choice(_CARDS)
+        quantity = rng.randint(1, 3)
+        total += quantity * float(price.replace(",", "."))
+        lines.append(f"{quantity}x {name} ({set_name}) - {rarity} - Englisch - NM {price} EUR")
+
+    def euro(value):
+        return f"{value:.2f}".replace(".", ",")
+
+    body = (f"Bestellnummer: {number}\nKäufer: {buyer}\nStatus: Bezahlt\n\n"
+            f"Max Mustermann\nMusterweg {number % 100 + 1}\n12345 Musterstadt\nDeutschland\n\n"
+            + "\n".join(lines)
+            + f"\n\nGesamtwert: {euro(total)} EUR\nVersandkosten: 1,55 EUR\n"
+            f"Gebühren: {euro(total * 0.05)} EUR\nGesamtbetrag: {euro(total + 1.55)} EUR\n"
+            f"Auszahlungsbetrag: {euro(total * 0.95 + 1.55)} EUR\n")
+    msg = EmailMessage()
+    msg["From"] = "Cardmarket <noreply@cardmarket.com>"
+    msg["Subject"] = f"Bestellung {number} für {buyer}: Bitte versenden"
+    msg["Date"] = format_datetime(datetime(2026, 7, 1) + timedelta(minutes=number % 20000))
+    msg["Message-ID"] = f"<{number}@replay.invalid>"
+    msg.set_content(body)
+    return msg
+
+
+def write_mbox(path, count: int, positions: int = 3, seed: int = 1) -> Path:
+    """Write ``count`` synthetic order mails into an mbox file."""
+    rng = random.Random(seed)
+    box = mailbox.mbox(str(path))
+    box.lock()
+    try:
+        for number in range(1000000, 1000000 + count):
+            box.add(synthetic_mail(number, positions, rng))
+        box.flush()
+    finally:
+        box.unlock()
+        box.close()
+    return Path(path)
+
+
+def _percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def benchmark(count: int = 2000, positions: int = 3, source_path=None,
+              workdir=None) -> Dict:
+    """Replay mails into a scratch database and measure each stage.
+
+    Without ``source_path``, ``count`` synthetic mails are generated first.
+    The live database and mail archive are not touched: ``DB_FILE`` and the
+    archive directory point into ``workdir`` for the duration of the run.
+
+    Returns a dict with orders, seconds, orders_per_second, db_write_seconds
+    and per-stage totals and per-mail latencies (ms, p50/p95).
+    """
+    import TCGInventory
+    from TCGInventory import lager_manager, mailarchiv, order_service, setup_db
+
+    own_dir = workdir is None
+    work = Path(workdir or tempfile.mkdtemp(prefix="tcg-replay-"))
+    work.mkdir(parents=True, exist_ok=True)
+    modules = (TCGInventory, setup_db, order_service, lager_manager)
+    saved = [m.DB_FILE for m in modules], mailarchiv.ARCHIV_DIR
+    try:
+        db_path = str(work / "replay.db")
+        for module in modules:
+            module.DB_FILE = db_path
+        mailarchiv.ARCHIV_DIR = work / "mailarchiv"
+        setup_db.initialize_database()
+
+        if source_path is None:
+            source_path = write_mbox(work / "orders.mbox", count, positions)
+        service = order_service.OrderIngestionService()
+        start = time.perf_counter()
+        ok, message, imported = service.sync_orders(source=ReplaySource(source_path))
+        seconds = time.perf_counter() - start
+
+        stages = {}
+        for stage, values in service.last_run.items():
+            stages[stage] = {
+                "calls": len(values),
+                "total_s": round(sum(values), 4),
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 3),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 3),
+                "mean_ms": round(statistics.fmean(values) * 1000, 3) if values else 0.0,
+            }
+        save = sum(service.last_run.get("save", []))
+        match = sum(service.last_run.get("match", []))
+        return {
+            "ok": ok,
+            "message": message,
+            "orders": imported,
+            "seconds": round(seconds, 3),
+            "orders_per_second": round(imported / seconds, 1) if seconds else 0.0,
+            "db_write_seconds": round(save - match, 4),
+            "db_size_mb": round(Path(db_path).stat().st_size / 1e6, 2),
+            "stages": stages,
+        }
+    finally:
+        for module, value in zip(modules, saved[0]):
+            module.DB_FILE = value
+        mailarchiv.ARCHIV_DIR = saved[1]
+        if own_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Replay saved or synthetic order mails into a scratch database "
+                    "and report ingestion throughput per stage.")
+    parser.add_argument("source", nargs="?",
+                        help="mbox file, Maildir or .eml directory (default: synthetic mails)")
+    parser.add_argument("--bench", type=int, default=2000, metavar="N",
+                        help="number of synthetic mails (default: 2000)")
+    parser.add_argument("--positions", type=int, default=3,
+                        help="positions per synthetic mail (default: 3)")
+    args = parser.parse_args()
+
+    report = benchmark(args.bench, args.positions, source_path=args.source)
+    print(f"{report['orders']} orders in {report['seconds']} s "
+          f"= {report['orders_per_second']} orders/s "
+          f"(DB writes {report['db_write_seconds']} s, DB {report['db_size_mb']} MB)")
+    for stage, values in report["stages"].items():
+        print(f"  {stage:<8} {values['total_s']:>8.3f} s  p50 {values['p50_ms']:.3f} ms"
+              f"  p95 {values['p95_ms']:.3f} ms  ({values['calls']}x)")
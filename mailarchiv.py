@@ -0,0 +1,147 @@
+"""Archiv der Original-Bestellmails, komprimiert und inhaltsadressiert.
+
+Bisher wurde die Roh-Mail nach dem Einlesen verworfen; wer später etwas
+nachlesen wollte, musste jede Mail einzeln wieder bei Gmail holen. Jetzt legt
+``order_service`` den Text jeder eingelesenen Mail hier ab:
+
+* Je Monat (nach Maildatum) eine Datei ``JJJJ-MM.gz`` unter
+  ``data/mailarchiv/``. Jede Mail ist darin ein eigenes gzip-Glied; angehängt
+  wird nur am Ende, geändert wird nie.
+* Der Index steht in der Tabelle ``mailarchiv``: Message-ID, SHA-256 des
+  Textes, Datei, Versatz und Länge. Eine Mail lässt sich damit ohne
+  Entpacken der ganzen Datei lesen.
+* Gleicher Text, gleicher Hash: ein Text, der schon im Archiv liegt, wird
+  nicht ein zweites Mal geschrieben; der neue Indexeintrag zeigt auf dieselbe
+  Stelle.
+
+Das Archiv ist Ablage, keine Quelle für Buchungen — was daraus nachgetragen
+werden darf, regelt ``nachlesen``.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+#: Ablageort; über ``TCG_MAILARCHIV_DIR`` verlegbar.
+ARCHIV_DIR = Path(os.environ.get("TCG_MAILARCHIV_DIR")
+                  or Path(__file__).resolve().parent / "data" / "mailarchiv")
+
+#: Ein Schreiber je Prozess — sonst könnten sich zwei Anhänge überlappen.
+_SCHREIBSPERRE = threading.Lock()
+
+
+def _verzeichnis(verzeichnis: Optional[Path]) -> Path:
+    return Path(verzeichnis) if verzeichnis is not None else ARCHIV_DIR
+
+
+def _monat(email_date: Optional[str]) -> str:
+    try:
+        return datetime.fromisoformat(str(email_date)).strftime("%Y-%m")
+    except (TypeError, ValueError):
+        return datetime.now().strftime("%Y-%m")
+
+
+def lege_ab(conn: sqlite3.Connection, message_id: str, text: str,
+            betreff: Optional[str] = None, email_date: Optional[str] = None,
+            verzeichnis: Optional[Path] = None) -> bool:
+    """Eine Mail ins Archiv legen. ``False``, wenn sie schon drin ist.
+
+    Committet nicht selbst: das übernimmt der Aufrufer (Schreiber-Einheit
+    oder ``nachlesen``) mit seiner Transaktion.
+    """
+    if not message_id or not text:
+        return False
+    if conn.execute("SELECT 1 FROM mailarchiv WHERE message_id = ?",
+                    (message_id,)).fetchone():
+        return False
+
+    roh = text.encode("utf-8")
+    sha = hashlib.sha256(roh).hexdigest()
+    vorhanden = conn.execute(
+        "SELECT datei, versatz, laenge FROM mailarchiv WHERE sha256 = ? LIMIT 1",
+        (sha,)).fetchone()
+    if vorhanden:
+        datei, versatz, laenge = vorhanden
+    else:
+        ziel = _verzeichnis(verzeichnis)
+        datei = f"{_monat(email_date)}.gz"
+        glied = gzip.compress(roh, mtime=0)
+        with _SCHREIBSPERRE:
+            ziel.mkdir(parents=True, exist_ok=True)
+            with open(ziel / datei, "ab") as f:
+                versatz = f.seek(0, os.SEEK_END)
+                f.write(glied)
+                f.flush()
+                os.fsync(f.fileno())
+        laenge = len(glied)
+
+    conn.execute(
+        "INSERT INTO mailarchiv (message_id, sha256, datei, versatz, laenge, "
+        "betreff, email_date, abgelegt_am) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (message_id, sha, datei, versatz, laenge, betreff, email_date,
+         datetime.now().isoformat()))
+    return True
+
+
+def lies_viele(conn: sqlite3.Connection, message_ids: Iterable[str],
+               verzeichnis: Optional[Path] = None) -> Dict[str, Dict]:
+    """Archivierte Mails zu ``message_ids``: ID -> text, betreff, email_date.
+
+    Gelesen wird je Datei in Reihenfolge der Versätze, jede Datei wird nur
+    einmal geöffnet. Was nicht im Archiv liegt (oder nicht lesbar ist), fehlt
+    im Ergebnis.
+    """
+    ids = [m for m in dict.fromkeys(message_ids) if m]
+    eintraege = []
+    for start in range(0, len(ids), 500):
+        block = ids[start:start + 500]
+        platzhalter = ", ".join("?" * len(block))
+        eintraege.extend(conn.execute(
+            "SELECT message_id, datei, versatz, laenge, betreff, email_date "
+            f"FROM mailarchiv WHERE message_id IN ({platzhalter})", block))
+
+    je_datei = defaultdict(list)
+    for eintrag in eintraege:
+        je_datei[eintrag[1]].append(eintrag)
+
+    ergebnis: Dict[str, Dict] = {}
+    basis = _verzeichnis(verzeichnis)
+    for datei, zeilen in je_datei.items():
+        try:
+            with open(basis / datei, "rb") as f:
+                for message_id, _, versatz, laenge, betreff, email_date in sorted(
+                        zeilen, key=lambda z: z[2]):
+                    f.seek(versatz)
+                    try:
+                        text = gzip.decompress(f.read(laenge)).decode("utf-8")
+                    except (OSError, EOFError, UnicodeDecodeError) as exc:
+                        print(f"❌ Archivierte Mail {message_id} nicht lesbar: {exc}")
+                        continue
+                    ergebnis[message_id] = {"text": text, "betreff": betreff,
+                                            "email_date": email_date}
+        except OSError as exc:
+            print(f"❌ Mailarchiv {datei} nicht lesbar: {exc}")
+    return ergebnis
+
+
+def lies(conn: sqlite3.Connection, message_id: str,
+         verzeichnis: Optional[Path] = None) -> Optional[Dict]:
+    """Eine archivierte Mail (``None``, wenn sie nicht im Archiv liegt)."""
+    return lies_viele(conn, [message_id], verzeichnis).get(message_id)
+
+
+def statistik(conn: sqlite3.Connection) -> Dict:
+    """Umfang des Archivs: Mails, gespeicherte Texte, komprimierte Größe."""
+    mails, texte, groesse = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT sha256), "
+        "COALESCE((SELECT SUM(laenge) FROM (SELECT MIN(laenge) AS laenge "
+        "FROM mailarchiv GROUP BY sha256)), 0) FROM mailarchiv").fetchone()
+    return {"mails": mails, "texte": texte, "bytes": groesse}
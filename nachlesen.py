@@ -7,9 +7,15 @@ Bestellmail steht. Manche Bestellungen haben trotzdem keine Beträge:
   Beträge noch nicht erfasst.
 * Einzelne spätere Mails, aus denen nur ein Teil gelesen wurde.
 
-Die Roh-Mail wird nicht gespeichert, aber an jeder Bestellung steht die
-Gmail-Message-ID. Damit lässt sich die Mail erneut holen und erneut lesen —
-das ist kein Schätzen, sondern ein zweiter Blick in dieselbe Quelle.
+An jeder Bestellung steht die Gmail-Message-ID. Damit lässt sich die Mail
+erneut lesen — das ist kein Schätzen, sondern ein zweiter Blick in dieselbe
+Quelle. Gelesen wird zuerst aus dem lokalen Mailarchiv (``mailarchiv``), in
+dem ``order_service`` jede eingelesene Mail ablegt; nur was dort fehlt, wird
+bei Gmail geholt und dabei gleich archiviert.
+
+``lese_archiv_nach`` ist der Massenlauf ohne Netz: alle offenen Bestellungen,
+deren Mail im Archiv liegt, werden mit mehreren Prozessen neu geparst — etwa
+nachdem der Parser verbessert wurde.
 
 Zwei Regeln, die dieses Modul durchsetzt:
 
@@ -24,14 +30,17 @@ Was auch nach dem Nachlesen fehlt, wird gemeldet und bleibt leer.
 
 from __future__ import annotations
 
+import os
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+from TCGInventory import mailarchiv, schreiber
 from TCGInventory.email_parser import parse_order_email
-from TCGInventory.gmail_auth import (get_email_body, get_email_date,
-                                     get_email_subject, get_gmail_service,
-                                     hole_nachricht)
+from TCGInventory.gmail_auth import (BATCH_SIZE, get_email_body,
+                                     get_email_date, get_email_subject,
+                                     get_gmail_service, get_messages)
 
 #: Spalten, die nachgetragen werden dürfen, und ihr Schlüssel im Parser.
 BETRAGSFELDER = {
@@ -45,6 +54,17 @@ BETRAGSFELDER = {
 #: Diese Felder dürfen ebenfalls nachgetragen werden, wenn sie leer sind.
 TEXTFELDER = ("order_number",)
 
+#: Bestellungen je Lauf — genug für den ganzen Altbestand in einem Durchgang.
+#: Aus Gmail sind das höchstens zehn Batches, und die laufen nacheinander.
+GRENZE = 500
+
+#: Mails je Gmail-Batch.
+BLOCK = BATCH_SIZE
+
+#: Unterhalb dieser Menge parst ``lese_archiv_nach`` im eigenen Prozess —
+#: das Starten der Arbeitsprozesse kostet mehr, als es spart.
+PARALLEL_AB = 200
+
 
 @dataclass
 class Ergebnis:
@@ -73,16 +93,27 @@ def _fehlt(wert) -> bool:
     return False
 
 
-def offene_bestellungen(conn: sqlite3.Connection) -> List[sqlite3.Row]:
-    """Bestellungen, denen ein Betrag oder die Bestellnummer fehlt."""
+def _luecke_sql(spalte: str) -> str:
+    """SQL-Gegenstück zu ``_fehlt`` für eine Spalte."""
+    return (f"({spalte} IS NULL OR (typeof({spalte}) = 'text' "
+            f"AND trim({spalte}) IN ('', 'None', 'none')))")
+
+
+def offene_bestellungen(conn: sqlite3.Connection,
+                        grenze: Optional[int] = None) -> List[sqlite3.Row]:
+    """Bestellungen, denen ein Betrag oder die Bestellnummer fehlt.
+
+    Gefiltert wird in SQL — vollständige Bestellungen, also fast alle, werden
+    gar nicht erst gelesen.
+    """
     conn.row_factory = sqlite3.Row
-    spalten = ", ".join(BETRAGSFELDER) + ", " + ", ".join(TEXTFELDER)
-    zeilen = conn.execute(
-        f"SELECT id, email_message_id, buyer_name, {spalten} FROM orders "
-        "ORDER BY id"
-    ).fetchall()
-    return [z for z in zeilen
-            if any(_fehlt(z[s]) for s in list(BETRAGSFELDER) + list(TEXTFELDER))]
+    felder = list(BETRAGSFELDER) + list(TEXTFELDER)
+    bedingung = " OR ".join(_luecke_sql(s) for s in felder)
+    sql = (f"SELECT id, email_message_id, buyer_name, {', '.join(felder)} "
+           f"FROM orders WHERE {bedingung} ORDER BY id")
+    if grenze is not None:
+        return conn.execute(sql + " LIMIT ?", (grenze,)).fetchall()
+    return conn.execute(sql).fetchall()
 
 
 def _werte_aus_mail(nachricht) -> Optional[Dict]:
@@ -99,69 +130,271 @@ def _werte_aus_mail(nachricht) -> Optional[Dict]:
     return geparst
 
 
+def _werte_aus_archiv(eintrag: Tuple[str, str, Optional[str], Optional[str]]
+                      ) -> Tuple[str, Optional[Dict]]:
+    """Eine archivierte Mail parsen (läuft auch in einem Arbeitsprozess).
+
+    Zurück geht nur, was nachgetragen werden darf — das hält den Weg zurück
+    in den Hauptprozess kurz.
+    """
+    message_id, text, betreff, email_date = eintrag
+    geparst = parse_order_email(text, message_id, subject=betreff or "",
+                                email_date=email_date)
+    if not geparst:
+        return message_id, None
+    return message_id, {"amounts": geparst.get("amounts") or {},
+                        **{s: geparst.get(s) for s in TEXTFELDER}}
+
+
+def _ergaenzungen(zeile, geparst: Dict) -> Dict[str, object]:
+    """Was aus ``geparst`` in die leeren Felder von ``zeile`` gehört."""
+    betraege = geparst.get("amounts") or {}
+    neu: Dict[str, object] = {}
+    for spalte, schluessel in BETRAGSFELDER.items():
+        if _fehlt(zeile[spalte]) and betraege.get(schluessel) is not None:
+            neu[spalte] = betraege[schluessel]
+    for spalte in TEXTFELDER:
+        wert = (geparst.get(spalte) or "").strip()
+        if _fehlt(zeile[spalte]) and wert:
+            neu[spalte] = wert
+    return neu
+
+
+def _kennung(zeile) -> str:
+    return zeile["order_number"] or f"interne Nr. {zeile['id']}"
+
+
+def _uebernimm(conn: sqlite3.Connection, ergebnis: Ergebnis, zeile,
+               geparst: Dict, schreiben: bool) -> Dict[str, object]:
+    """Lücken einer Bestellung füllen (oder in der Vorschau nur vermerken).
+
+    Gibt die ergänzten Felder zurück, auch wenn nicht geschrieben wurde.
+    """
+    kennung = _kennung(zeile)
+    neu = _ergaenzungen(zeile, geparst)
+    if not neu:
+        ergebnis.unveraendert += 1
+        fehlend = [s for s in BETRAGSFELDER if _fehlt(zeile[s])]
+        ergebnis.meldungen.append(
+            f"{kennung}: in der Mail steht nichts zu "
+            f"{', '.join(fehlend) or 'den offenen Feldern'} — bleibt leer.")
+        return neu
+
+    ergebnis.ergaenzt += 1
+    ergebnis.details[zeile["id"]] = sorted(neu)
+    if schreiben:
+        _trage_ein(conn, zeile["id"], neu)
+    return neu
+
+
+def _trage_ein(conn: sqlite3.Connection, bestellung_id: int,
+               neu: Dict[str, object]) -> None:
+    zuweisung = ", ".join(f"{s} = ?" for s in neu)
+    conn.execute(f"UPDATE orders SET {zuweisung} WHERE id = ?",
+                 list(neu.values()) + [bestellung_id])
+
+
+def _hole_vorab(service, zeilen: List[sqlite3.Row]
+                ) -> Iterator[Tuple[List[sqlite3.Row], Dict[str, Dict]]]:
+    """Mails blockweise über Gmail-Batches holen, den nächsten Block im Voraus.
+
+    Während der Aufrufer einen Block parst, lädt ein Hintergrund-Thread schon
+    den nächsten. Den Gmail-Dienst benutzt immer nur dieser eine Thread.
+    Liefert je Block die Zeilen und die gefundenen Mails (ID -> Nachricht).
+    """
+    bloecke = [zeilen[i:i + BLOCK] for i in range(0, len(zeilen), BLOCK)]
+
+    def hole(block):
+        ids = [z["email_message_id"] for z in block if z["email_message_id"]]
+        return {n["id"]: n for n in get_messages(service, ids)}
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        naechster = pool.submit(hole, bloecke[0]) if bloecke else None
+        for nummer, block in enumerate(bloecke):
+            geholt = naechster.result()
+            if nummer + 1 < len(bloecke):
+                naechster = pool.submit(hole, bloecke[nummer + 1])
+            yield block, geholt
+
+
 def lese_nach(conn: sqlite3.Connection, service=None,
-              grenze: int = 50, schreiben: bool = False) -> Ergebnis:
+              grenze: int = GRENZE, schreiben: bool = False) -> Ergebnis:
     """Fehlende Angaben aus den Original-Mails nachtragen.
 
-    Ohne ``schreiben=True`` ist der Lauf eine reine Vorschau: es wird gelesen
-    und berichtet, aber nichts geändert. So lässt sich vorher ansehen, was
-    passieren würde.
+    Ohne ``schreiben=True`` ist der Lauf eine Vorschau: es wird gelesen und
+    berichtet, aber keine Bestellung geändert. So lässt sich vorher ansehen,
+    was passieren würde.
+
+    Archivierte Mails werden direkt gelesen; der Rest kommt in Gmail-Batches
+    zu je ``BLOCK`` Mails, und geparst wird, während der nächste Block lädt.
+    Bei Gmail geholte Mails landen im Archiv, auch in der Vorschau — das
+    Archiv ist eine Kopie der Quelle, keine Buchung. Abgelegt wird je Block
+    über den Schreiber (``schreiber.schreibe``), die Nachträge dagegen erst am
+    Ende in einer Transaktion: sie gelten ganz oder gar nicht, und ``conn``
+    hält während der Gmail-Abrufe keine Schreibsperre.
     """
     ergebnis = Ergebnis()
-    kandidaten = offene_bestellungen(conn)[:grenze]
+    kandidaten = offene_bestellungen(conn, grenze)
     if not kandidaten:
         ergebnis.meldungen.append("Keine Bestellung mit fehlenden Angaben.")
         return ergebnis
 
-    service = service or get_gmail_service()
-    if service is None:
-        ergebnis.meldungen.append(
-            "Keine Verbindung zu Gmail. Ohne Zugang lassen sich die "
-            "Original-Mails nicht lesen.")
-        return ergebnis
+    archiv = mailarchiv.lies_viele(conn, [z["email_message_id"] for z in kandidaten])
+    aus_gmail = [z for z in kandidaten if z["email_message_id"] not in archiv]
+    if aus_gmail:
+        service = service or get_gmail_service()
+        if service is None:
+            ergebnis.meldungen.append(
+                "Keine Verbindung zu Gmail. Ohne Zugang lassen sich die "
+                "Original-Mails nicht lesen.")
+            if not archiv:
+                return ergebnis
+            aus_gmail = []
 
-    for zeile in kandidaten:
+    nachtraege: Dict[int, Dict[str, object]] = {}
+
+    def pruefe(zeile, geparst) -> None:
         ergebnis.geprueft += 1
-        kennung = zeile["order_number"] or f"interne Nr. {zeile['id']}"
-        nachricht = hole_nachricht(service, zeile["email_message_id"])
-        if nachricht is None:
+        if not geparst:
             ergebnis.ohne_mail += 1
             ergebnis.meldungen.append(
-                f"{kennung}: Mail nicht mehr abrufbar — bleibt unverändert.")
-            continue
+                f"{_kennung(zeile)}: Mail gefunden, aber nicht lesbar — unverändert.")
+            return
+        neu = _uebernimm(conn, ergebnis, zeile, geparst, schreiben=False)
+        if neu:
+            nachtraege[zeile["id"]] = neu
 
-        geparst = _werte_aus_mail(nachricht)
-        if not geparst:
+    for zeile in kandidaten:
+        abgelegt = archiv.get(zeile["email_message_id"])
+        if abgelegt is not None:
+            _, geparst = _werte_aus_archiv((zeile["email_message_id"], abgelegt["text"],
+                                            abgelegt["betreff"], abgelegt["email_date"]))
+            pruefe(zeile, geparst)
+
+    for block, geholt in _hole_vorab(service, aus_gmail):
+        _archiviere(conn, geholt.values())
+        for zeile in block:
+            nachricht = geholt.get(zeile["email_message_id"])
+            if nachricht is None:
+                ergebnis.geprueft += 1
+                ergebnis.ohne_mail += 1
+                ergebnis.meldungen.append(
+                    f"{_kennung(zeile)}: Mail nicht mehr abrufbar — bleibt unverändert.")
+                continue
+            pruefe(zeile, _werte_aus_mail(nachricht))
+
+    if schreiben and nachtraege:
+        # Ein Commit am Ende: Nachträge eines Laufs gelten ganz oder gar nicht.
+        try:
+            for bestellung_id, neu in nachtraege.items():
+                _trage_ein(conn, bestellung_id, neu)
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+    return ergebnis
+
+
+def _datei(conn: sqlite3.Connection) -> str:
+    """Pfad der Hauptdatenbank von ``conn`` (leer bei ``:memory:``)."""
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def _archiviere(conn: sqlite3.Connection, nachrichten: Iterable[Dict]) -> None:
+    """Bei Gmail geholte Mails ablegen — beim nächsten Mal ohne Netz.
+
+    Ein Block ist eine Schreiber-Einheit: seine Zeilen sind committet, bevor
+    der nächste Block ankommt. Scheitert sie, fehlt nur dieser Block im
+    Archiv; das Nachlesen selbst läuft weiter.
+    """
+    eintraege = [(n.get("id", ""), get_email_body(n), get_email_subject(n),
+                  get_email_date(n)) for n in nachrichten]
+    eintraege = [e for e in eintraege if e[1]]
+    if not eintraege:
+        return
+
+    def ablegen(c: sqlite3.Connection) -> None:
+        for eintrag in eintraege:
+            mailarchiv.lege_ab(c, *eintrag)
+
+    try:
+        datei = _datei(conn)
+        if datei:
+            schreiber.schreibe(ablegen, datei)
+        else:
+            ablegen(conn)
+            conn.commit()
+    except (sqlite3.Error, OSError) as exc:
+        print(f"❌ {len(eintraege)} Mail(s) nicht archiviert: {exc}")
+
+
+def lese_archiv_nach(conn: sqlite3.Connection, schreiben: bool = False,
+                     prozesse: Optional[int] = None) -> Ergebnis:
+    """Alle offenen Bestellungen aus dem Mailarchiv neu parsen (ohne Gmail).
+
+    Es gelten dieselben Regeln wie bei ``lese_nach``: nur leere Felder werden
+    gefüllt, und ohne ``schreiben=True`` ist es eine Vorschau. Ab
+    ``PARALLEL_AB`` Mails wird auf ``prozesse`` Arbeitsprozesse verteilt
+    (Vorgabe: alle Kerne); Bestellungen ohne archivierte Mail zählen als
+    ``ohne_mail``.
+    """
+    ergebnis = Ergebnis()
+    kandidaten = offene_bestellungen(conn)
+    if not kandidaten:
+        ergebnis.meldungen.append("Keine Bestellung mit fehlenden Angaben.")
+        return ergebnis
+
+    archiv = mailarchiv.lies_viele(conn, [z["email_message_id"] for z in kandidaten])
+    eintraege = [(mid, e["text"], e["betreff"], e["email_date"])
+                 for mid, e in archiv.items()]
+    prozesse = prozesse or os.cpu_count() or 1
+    if prozesse > 1 and len(eintraege) >= PARALLEL_AB:
+        with ProcessPoolExecutor(max_workers=prozesse) as pool:
+            geparst = dict(pool.map(_werte_aus_archiv, eintraege,
+                                    chunksize=max(1, len(eintraege) // (prozesse * 4))))
+    else:
+        geparst = dict(map(_werte_aus_archiv, eintraege))
+
+    for zeile in kandidaten:
+        ergebnis.geprueft += 1
+        mid = zeile["email_message_id"]
+        if mid not in geparst:
             ergebnis.ohne_mail += 1
-            ergebnis.meldungen.append(
-                f"{kennung}: Mail gefunden, aber nicht lesbar — unverändert.")
             continue
-
-        betraege = geparst.get("amounts") or {}
-        neu: Dict[str, object] = {}
-        for spalte, schluessel in BETRAGSFELDER.items():
-            if _fehlt(zeile[spalte]) and betraege.get(schluessel) is not None:
-                neu[spalte] = betraege[schluessel]
-        for spalte in TEXTFELDER:
-            wert = (geparst.get(spalte) or "").strip()
-            if _fehlt(zeile[spalte]) and wert:
-                neu[spalte] = wert
-
-        if not neu:
-            ergebnis.unveraendert += 1
-            fehlend = [s for s in BETRAGSFELDER if _fehlt(zeile[s])]
+        if not geparst[mid]:
+            ergebnis.ohne_mail += 1
             ergebnis.meldungen.append(
-                f"{kennung}: in der Mail steht nichts zu "
-                f"{', '.join(fehlend) or 'den offenen Feldern'} — bleibt leer.")
+                f"{zeile['order_number'] or zeile['id']}: archivierte Mail nicht lesbar.")
             continue
+        _uebernimm(conn, ergebnis, zeile, geparst[mid], schreiben)
 
-        ergebnis.ergaenzt += 1
-        ergebnis.details[zeile["id"]] = sorted(neu)
-        if schreiben:
-            zuweisung = ", ".join(f"{s} = ?" for s in neu)
-            conn.execute(f"UPDATE orders SET {zuweisung} WHERE id = ?",
-                         list(neu.values()) + [zeile["id"]])
-
+    if ergebnis.ohne_mail:
+        ergebnis.meldungen.append(
+            f"{ergebnis.ohne_mail} Bestellung(en) ohne archivierte Mail — "
+            "dafür das Nachlesen über Gmail verwenden.")
     if schreiben:
         conn.commit()
     return ergebnis
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from TCGInventory import DB_FILE
+
+    parser = argparse.ArgumentParser(
+        description="Fehlende Beträge aus dem Mailarchiv nachtragen (ohne Gmail).")
+    parser.add_argument("--schreiben", action="store_true",
+                        help="Lücken wirklich füllen (sonst nur Vorschau)")
+    parser.add_argument("--prozesse", type=int, default=None,
+                        help="Arbeitsprozesse (Vorgabe: alle Kerne)")
+    argumente = parser.parse_args()
+
+    with sqlite3.connect(DB_FILE) as verbindung:
+        lauf = lese_archiv_nach(verbindung, schreiben=argumente.schreiben,
+                                prozesse=argumente.prozesse)
+    print(f"{lauf.geprueft} geprüft, {lauf.ergaenzt} ergänzt, "
+          f"{lauf.unveraendert} unverändert, {lauf.ohne_mail} ohne Mail"
+          + ("" if argumente.schreiben else " (Vorschau)"))
+    for meldung in lauf.meldungen:
+        print(meldung)
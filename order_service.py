@@ -1,27 +1,48 @@
 """Order ingestion service for processing Cardmarket emails."""
 
+import random
 import sqlite3
 import threading
 import time
-from datetime import datetime, time as dt_time
-from pathlib import Path
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
 from typing import Set
 
-from TCGInventory import DB_FILE
-from TCGInventory.gmail_auth import (
-    get_gmail_service,
-    fetch_cardmarket_emails,
-    mark_message_processed,
-    get_email_body,
-    get_email_subject,
-    get_email_date
+from TCGInventory import DB_FILE, mailarchiv
+from TCGInventory.schreiber import schreibe, verbinde
+from TCGInventory.gmail_auth import get_gmail_service
+from TCGInventory.mail_sources import (
+    GmailSource,
+    HISTORY_CURSOR_KEY,
+    LABEL_BACKLOG_KEY,
 )
 from TCGInventory.email_parser import parse_cardmarket_email, parse_order_email
-from TCGInventory.card_scanner import resolve_set_code
+from TCGInventory.card_scanner import image_urls_for_names, resolve_set_codes
 
 # Constants
 SECONDS_PER_MINUTE = 60
 
+#: Polling only happens within these hours (inclusive).
+OPERATING_START = dt_time(11, 0)
+OPERATING_END = dt_time(22, 0)
+#: Interval right after new orders arrived; idle runs stretch it by
+#: ``BACKOFF_FACTOR`` up to ``MAX_POLL_INTERVAL_MINUTES``.
+MIN_POLL_INTERVAL_MINUTES = 2
+MAX_POLL_INTERVAL_MINUTES = 60
+BACKOFF_FACTOR = 2
+#: Random spread (+/- fraction) applied to every wait.
+JITTER = 0.1
+
+#: SQLite's built-in ``lower()`` folds ASCII only; fold keys the same way so
+#: in-memory grouping agrees with ``lower(name)`` in SQL.
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _fold(text):
+    """Case-fold like SQLite's ``lower()`` (``None`` stays ``None``)."""
+    return text.translate(_ASCII_LOWER) if text is not None else None
+
 
 class OrderIngestionService:
     """Background service to poll Gmail for new Cardmarket orders."""
@@ -37,18 +58,28 @@ class OrderIngestionService:
         self.running = False
         self.thread = None
         self.processed_message_ids: Set[str] = set()
+        # Per-stage durations (seconds) of the last sync run, for benchmarks
+        self.last_run = defaultdict(list)
         self._enabled = True
+        # Adaptive schedule: current interval, last/next run, wake-up event
+        self._interval = self.poll_interval
+        self._random = random.Random()
+        self._wake = threading.Event()
+        self._sync_lock = threading.Lock()
+        self.last_run_at = None
+        self.last_run_seconds = None
+        self.last_new_orders = 0
+        self.next_run_at = None
         
-    def is_within_operating_hours(self):
-        """Check if current time is within 11:00-22:00."""
-        now = datetime.now().time()
-        start_time = dt_time(11, 0)
-        end_time = dt_time(22, 0)
-        return start_time <= now <= end_time
+    def is_within_operating_hours(self, now=None):
+        """Check if the given (default: current) time is within 11:00-22:00."""
+        now = (now or datetime.now()).time()
+        return OPERATING_START <= now <= OPERATING_END
     
     def enable(self):
         """Enable the polling service."""
         self._enabled = True
+        self.wake()
         
     def disable(self):
         """Disable the polling service."""
@@ -65,6 +96,7 @@ class OrderIngestionService:
             return
         
         self.running = True
+        self._wake.clear()
         self.thread = threading.Thread(target=self._poll_loop, daemon=True)
         self.thread.start()
         print("Order ingestion service started")
@@ -72,82 +104,151 @@ class OrderIngestionService:
     def stop(self):
         """Stop the background polling thread."""
         self.running = False
+        self._wake.set()
         if self.thread:
             self.thread.join(timeout=5)
+        self.next_run_at = None
         print("Order ingestion service stopped")
+
+    def wake(self):
+        """Let the poll thread run a sync now instead of at ``next_run_at``."""
+        self.next_run_at = datetime.now()
+        self._wake.set()
+
+    def next_wake(self, now=None):
+        """Next poll time: current interval plus jitter, moved into operating hours."""
+        now = now or datetime.now()
+        delay = self._interval * self._random.uniform(1 - JITTER, 1 + JITTER)
+        candidate = now + timedelta(seconds=delay)
+        if self.is_within_operating_hours(candidate):
+            return candidate
+        opening = datetime.combine(candidate.date(), OPERATING_START)
+        if candidate.time() > OPERATING_END:
+            opening += timedelta(days=1)
+        return opening + timedelta(seconds=self._random.uniform(0, JITTER * self.poll_interval))
+
+    def schedule_status(self):
+        """Last run and next planned run, for the orders page."""
+        return {
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds,
+            "last_new_orders": self.last_new_orders,
+            "next_run_at": self.next_run_at if self.running else None,
+            "interval_minutes": self._interval / SECONDS_PER_MINUTE,
+        }
+
+    def _record_run(self, started, ok, new_orders):
+        """Adapt the interval to the outcome of a run and plan the next one."""
+        self.last_run_at = datetime.now()
+        self.last_run_seconds = time.perf_counter() - started
+        self.last_new_orders = new_orders
+        if ok and new_orders:
+            self._interval = MIN_POLL_INTERVAL_MINUTES * SECONDS_PER_MINUTE
+        else:
+            self._interval = min(self._interval * BACKOFF_FACTOR,
+                                 MAX_POLL_INTERVAL_MINUTES * SECONDS_PER_MINUTE)
+        self.next_run_at = self.next_wake()
+        # A manual sync also reschedules the poll thread.
+        self._wake.set()
     
     def _poll_loop(self):
-        """Main polling loop that runs in the background."""
+        """Main polling loop: sleep on an event until ``next_run_at``."""
         # Do an initial sync on startup
         self.sync_orders()
         
         while self.running:
             try:
+                delay = (self.next_run_at - datetime.now()).total_seconds()
+                if self._wake.wait(timeout=max(0.0, delay)):
+                    # Rescheduled, woken for a sync or stopping.
+                    self._wake.clear()
+                    continue
                 # Only poll during operating hours and if enabled
                 if self.is_within_operating_hours() and self._enabled:
                     self.sync_orders()
-                
-                # Sleep for the poll interval
-                time.sleep(self.poll_interval)
+                else:
+                    self.next_run_at = self.next_wake()
                 
             except Exception as e:
                 print(f"Error in order ingestion loop: {e}")
-                time.sleep(SECONDS_PER_MINUTE)  # Wait a minute before retrying on error
+                self.next_run_at = datetime.now() + timedelta(seconds=SECONDS_PER_MINUTE)
     
-    def sync_orders(self):
+    def sync_orders(self, source=None):
         """
         Manually trigger a sync to fetch and process new orders.
+
+        Runs never overlap; each one adapts the polling interval and plans
+        the next run.
+
+        Args:
+            source: ``MailSource`` to read from (default: the Gmail mailbox)
         
         Returns:
             Tuple of (success: bool, message: str, new_orders_count: int)
         """
+        with self._sync_lock:
+            started = time.perf_counter()
+            result = self._sync(source)
+            self._record_run(started, result[0], result[2])
+            return result
+
+    def _sync(self, source):
+        """One sync run; see ``sync_orders``."""
+        self.last_run = defaultdict(list)
         try:
-            # Get Gmail service
-            service = get_gmail_service()
-            if not service:
-                return False, "Gmail authentication failed. Check credentials.", 0
-            
-            # Fetch unprocessed messages
-            messages = fetch_cardmarket_emails(service, self.processed_message_ids)
+            if source is None:
+                source = GmailSource(get_gmail_service, self._load_sync_value,
+                                     self._save_sync_value, self.processed_message_ids)
+            if not source.open():
+                return False, source.error, 0
+
+            with self._stage("fetch"):
+                messages = source.fetch(known_ids_lookup=self._known_message_ids)
             
             if not messages:
+                source.finish()
                 return True, "No new orders found", 0
             
             new_orders_count = 0
             
             # Process each message
             for message in messages:
-                message_id = message['id']
+                message_id = message.message_id
                 
-                # Extract email body, subject, and date
-                email_body = get_email_body(message)
-                email_subject = get_email_subject(message)
-                email_date = get_email_date(message)
-                
-                if not email_body:
+                if not message.body:
                     print(f"Could not extract body from message {message_id}")
                     continue
+
+                # Keep the raw body so it can be re-parsed offline later
+                with self._stage("archive"):
+                    self._archive_email(message_id, message.body, message.subject,
+                                        message.date)
                 
                 # Parse the email with subject and date (lossless WP2a extraction)
-                parsed = parse_order_email(email_body, message_id, subject=email_subject, email_date=email_date)
+                with self._stage("parse"):
+                    parsed = parse_order_email(message.body, message_id,
+                                               subject=message.subject,
+                                               email_date=message.date)
 
                 if not parsed['items']:
                     print(f"No items found in message {message_id}")
                     # Still mark as processed to avoid reprocessing
-                    mark_message_processed(service, message_id)
-                    self.processed_message_ids.add(message_id)
+                    source.mark_processed([message_id])
                     continue
                 
                 # Save order to database
-                success = self._save_order(parsed)
+                with self._stage("save"):
+                    success = self._save_order(parsed)
                 
                 if success:
                     # Mark email as processed
-                    mark_message_processed(service, message_id)
-                    self.processed_message_ids.add(message_id)
+                    source.mark_processed([message_id])
                     new_orders_count += 1
                     print(f"Processed order from {parsed['buyer_name']} with {len(parsed['items'])} items")
             
+            with self._stage("finish"):
+                source.finish()
+
             if new_orders_count > 0:
                 return True, f"Successfully imported {new_orders_count} new order(s)", new_orders_count
             else:
@@ -156,7 +257,58 @@ class OrderIngestionService:
         except Exception as e:
             print(f"Error syncing orders: {e}")
             return False, f"Error syncing orders: {str(e)}", 0
+
+    @contextmanager
+    def _stage(self, name):
+        """Record the duration of one pipeline stage in ``last_run``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last_run[name].append(time.perf_counter() - start)
     
+    def _load_sync_value(self, key):
+        """Return a value from ``sync_stand``, or None if it is not set."""
+        try:
+            with sqlite3.connect(DB_FILE) as conn:
+                row = conn.execute(
+                    "SELECT wert FROM sync_stand WHERE schluessel = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading sync state: {e}")
+            return None
+        return row[0] if row else None
+
+    def _save_sync_value(self, key, value):
+        """Store a value in ``sync_stand``."""
+        try:
+            schreibe(lambda conn: conn.execute(
+                "INSERT INTO sync_stand (schluessel, wert, geaendert_am) VALUES (?, ?, ?) "
+                "ON CONFLICT(schluessel) DO UPDATE SET wert = excluded.wert, "
+                "geaendert_am = excluded.geaendert_am",
+                (key, value, datetime.now().isoformat())), DB_FILE)
+        except sqlite3.Error as e:
+            print(f"Error saving sync state: {e}")
+
+    def _archive_email(self, message_id, body, subject, email_date):
+        """Store the mail body in the local mail archive (best effort)."""
+        try:
+            schreibe(lambda conn: mailarchiv.lege_ab(conn, message_id, body, subject,
+                                                     email_date), DB_FILE)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error archiving message {message_id}: {e}")
+
+    def _known_message_ids(self, message_ids):
+        """Return the subset of ``message_ids`` already stored in ``orders``."""
+        known = set()
+        with sqlite3.connect(DB_FILE) as conn:
+            for start in range(0, len(message_ids), 500):
+                chunk = list(message_ids[start:start + 500])
+                placeholders = ", ".join("?" * len(chunk))
+                known.update(row[0] for row in conn.execute(
+                    f"SELECT email_message_id FROM orders "
+                    f"WHERE email_message_id IN ({placeholders})", chunk))
+        return known
+
     def _save_order(self, parsed_order):
         """
         Save a parsed order to the database.
@@ -167,85 +319,101 @@ class OrderIngestionService:
         Returns:
             True if successful, False otherwise
         """
+        # Matching only reads; doing it before the write keeps the write
+        # transaction short.
         try:
-            with sqlite3.connect(DB_FILE) as conn:
-                cursor = conn.cursor()
+            with self._stage("match"):
+                conn = verbinde(DB_FILE)
+                try:
+                    matches = self._match_items(conn.cursor(), parsed_order['items'])
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            print(f"Database error saving order: {e}")
+            return False
 
-                # Idempotency: never insert the same message/order twice.
-                cursor.execute(
-                    "SELECT id FROM orders WHERE email_message_id = ?",
-                    (parsed_order['message_id'],)
+        def store(conn):
+            cursor = conn.cursor()
+
+            # Idempotency: never insert the same message/order twice.
+            cursor.execute(
+                "SELECT id FROM orders WHERE email_message_id = ?",
+                (parsed_order['message_id'],)
+            )
+            if cursor.fetchone():
+                print(f"Order {parsed_order['message_id']} already exists")
+                return False
+
+            amounts = parsed_order.get('amounts', {})
+            email_date = parsed_order.get('email_date') or datetime.now().isoformat()
+            cursor.execute(
+                """
+                INSERT INTO orders (buyer_name, email_message_id, date_received, email_date,
+                                    status, order_number, address, address_raw,
+                                    amount_gesamtwert, amount_gebuehren, amount_auszahlung,
+                                    amount_versand, amount_gesamt)
+                VALUES (?, ?, ?, ?, 'open', ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    parsed_order['buyer_name'],
+                    parsed_order['message_id'],
+                    datetime.now().isoformat(),
+                    email_date,
+                    parsed_order.get('order_number', ''),
+                    parsed_order.get('address_raw', ''),
+                    parsed_order.get('address_raw', ''),
+                    amounts.get('gesamtwert'),
+                    amounts.get('gebuehren'),
+                    amounts.get('auszahlungsbetrag'),
+                    amounts.get('versandkosten'),
+                    amounts.get('gesamtbetrag'),
                 )
-                if cursor.fetchone():
-                    print(f"Order {parsed_order['message_id']} already exists")
-                    return False
+            )
+
+            order_id = cursor.lastrowid
 
-                amounts = parsed_order.get('amounts', {})
-                email_date = parsed_order.get('email_date') or datetime.now().isoformat()
+            for item, match in zip(parsed_order['items'], matches):
                 cursor.execute(
                     """
-                    INSERT INTO orders (buyer_name, email_message_id, date_received, email_date,
-                                        status, order_number, address, address_raw,
-                                        amount_gesamtwert, amount_gebuehren, amount_auszahlung,
-                                        amount_versand, amount_gesamt)
-                    VALUES (?, ?, ?, ?, 'open', ?, ?, ?, ?, ?, ?, ?, ?)
+                    INSERT INTO order_items
+                        (order_id, card_name, quantity, image_url, storage_code,
+                         card_id, match_status, set_name, set_code, language,
+                         condition, foil, uncertain, unit_price, variant)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     """,
                     (
-                        parsed_order['buyer_name'],
-                        parsed_order['message_id'],
-                        datetime.now().isoformat(),
-                        email_date,
-                        parsed_order.get('order_number', ''),
-                        parsed_order.get('address_raw', ''),
-                        parsed_order.get('address_raw', ''),
-                        amounts.get('gesamtwert'),
-                        amounts.get('gebuehren'),
-                        amounts.get('auszahlungsbetrag'),
-                        amounts.get('versandkosten'),
-                        amounts.get('gesamtbetrag'),
+                        order_id,
+                        item['name'],
+                        item['quantity'],
+                        match['image_url'],
+                        match['storage_code'],
+                        match['card_id'],
+                        match['match_status'],
+                        item.get('set_name'),
+                        match['set_code'],
+                        item.get('language'),
+                        item.get('condition'),
+                        1 if item.get('foil') else 0,
+                        1 if item.get('uncertain') else 0,
+                        item.get('unit_price'),
+                        item.get('variant'),
                     )
                 )
 
-                order_id = cursor.lastrowid
-
-                for item in parsed_order['items']:
-                    match = self._match_item(cursor, item)
-                    cursor.execute(
-                        """
-                        INSERT INTO order_items
-                            (order_id, card_name, quantity, image_url, storage_code,
-                             card_id, match_status, set_name, set_code, language,
-                             condition, foil, uncertain, unit_price, variant)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            order_id,
-                            item['name'],
-                            item['quantity'],
-                            match['image_url'],
-                            match['storage_code'],
-                            match['card_id'],
-                            match['match_status'],
-                            item.get('set_name'),
-                            match['set_code'],
-                            item.get('language'),
-                            item.get('condition'),
-                            1 if item.get('foil') else 0,
-                            1 if item.get('uncertain') else 0,
-                            item.get('unit_price'),
-                            item.get('variant'),
-                        )
-                    )
-
-                conn.commit()
-                return True
+            return True
 
+        try:
+            return schreibe(store, DB_FILE)
         except sqlite3.Error as e:
             print(f"Database error saving order: {e}")
             return False
 
     def _match_item(self, cursor, item):
-        """Match a parsed position against inventory by identity (WP1b/WP2a).
+        """Match a single parsed position; see ``_match_items``."""
+        return self._match_items(cursor, [item])[0]
+
+    def _match_items(self, cursor, items):
+        """Match all positions of an order against inventory by identity (WP1b/WP2a).
 
         Matches on ``name + set_code + language`` (foil if known). Exactly one
         available match -> ``matched`` with the card's storage/image. Zero,
@@ -253,94 +421,84 @@ class OrderIngestionService:
         fallback image only; the panel then offers manual candidate selection.
         No silent ``LIMIT 1``, no ``LIKE`` substring auto-match.
 
-        Returns dict: card_id, match_status, storage_code, image_url, set_code.
+        The set names of the whole order are resolved in one pass and all
+        inventory candidates come from a single query over the folded card
+        names (``idx_cards_name_folded``); grouping by set and language then
+        happens in memory.
+
+        Returns one dict per item: card_id, match_status, storage_code,
+        image_url, set_code.
         """
-        name = item['name']
-        set_code, confidence = resolve_set_code(item.get('set_name'))
-        language = item.get('language')
-        uncertain = bool(item.get('uncertain'))
-
-        result = {
-            "card_id": None,
-            "match_status": "unresolved",
-            "storage_code": None,
-            "image_url": None,
-            "set_code": set_code,
-        }
+        set_codes = resolve_set_codes(item.get('set_name') for item in items)
 
-        # Only auto-match when the line is clean AND the set resolved confidently.
-        if not uncertain and set_code and confidence == "high":
-            query = (
-                "SELECT id, storage_code, image_url FROM cards "
-                "WHERE LOWER(name) = LOWER(?) AND LOWER(set_code) = LOWER(?) "
+        # Positions eligible for an automatic match: clean line, confident set.
+        wanted = {
+            _fold(item['name'])
+            for item in items
+            if not item.get('uncertain')
+            and set_codes[item.get('set_name')][0]
+            and set_codes[item.get('set_name')][1] == "high"
+        }
+        candidates = defaultdict(list)
+        wanted = sorted(wanted)
+        for start in range(0, len(wanted), 500):
+            block = wanted[start:start + 500]
+            cursor.execute(
+                "SELECT id, storage_code, image_url, lower(name), lower(set_code), "
+                "lower(language) FROM cards "
+                f"WHERE lower(name) IN ({', '.join('?' * len(block))}) "
+                "AND status = 'verfügbar' AND quantity > 0",
+                block,
             )
-            params = [name, set_code]
-            if language:
-                query += "AND LOWER(language) = LOWER(?) "
-                params.append(language)
-            query += "AND status = 'verfügbar' AND quantity > 0"
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-
-            if len(rows) == 1:
-                result.update(
-                    card_id=rows[0][0], match_status="matched",
-                    storage_code=rows[0][1],
-                    image_url=rows[0][2] or self._get_image_from_default_db(name),
-                )
-                return result
-            if len(rows) > 1:
-                result["match_status"] = "ambiguous"
+            for card_id, storage_code, image_url, name, set_code, language in cursor.fetchall():
+                candidates[(name, set_code)].append((card_id, storage_code, image_url, language))
+
+        results = []
+        for item in items:
+            name = item['name']
+            set_code, confidence = set_codes[item.get('set_name')]
+            language = item.get('language')
+            uncertain = bool(item.get('uncertain'))
+
+            result = {
+                "card_id": None,
+                "match_status": "unresolved",
+                "storage_code": None,
+                "image_url": None,
+                "set_code": set_code,
+            }
+            results.append(result)
+
+            # Only auto-match when the line is clean AND the set resolved confidently.
+            if not uncertain and set_code and confidence == "high":
+                rows = candidates.get((_fold(name), _fold(set_code)), [])
+                if language:
+                    rows = [row for row in rows if row[3] == _fold(language)]
+
+                if len(rows) == 1:
+                    result.update(
+                        card_id=rows[0][0], match_status="matched",
+                        storage_code=rows[0][1],
+                        image_url=rows[0][2],
+                    )
+                    continue
+                if len(rows) > 1:
+                    result["match_status"] = "ambiguous"
+                else:
+                    result["match_status"] = "unresolved"
             else:
-                result["match_status"] = "unresolved"
-        else:
-            result["match_status"] = "ambiguous" if uncertain else "unresolved"
+                result["match_status"] = "ambiguous" if uncertain else "unresolved"
 
-        # Fallback image for display only (does not imply a match).
-        result["image_url"] = self._get_image_from_default_db(name)
-        return result
-    
-    def _get_image_from_default_db(self, card_name):
-        """
-        Look up image_url from default-cards.db.
-        
-        Args:
-            card_name: Name of the card to search for
-            
-        Returns:
-            image_url or None
-        """
-        default_db_path = Path(__file__).resolve().parent / "data" / "default-cards.db"
-        
-        if not default_db_path.exists():
-            return None
-        
-        try:
-            with sqlite3.connect(default_db_path) as conn:
-                c = conn.cursor()
-                
-                # Try exact match first
-                c.execute(
-                    "SELECT image_url FROM cards WHERE LOWER(name) = LOWER(?) AND image_url IS NOT NULL LIMIT 1",
-                    (card_name,)
-                )
-                result = c.fetchone()
-                if result and result[0]:
-                    return result[0]
-                
-                # Try partial match
-                c.execute(
-                    "SELECT image_url FROM cards WHERE LOWER(name) LIKE LOWER(?) AND image_url IS NOT NULL LIMIT 1",
-                    (f"%{card_name}%",)
-                )
-                result = c.fetchone()
-                if result and result[0]:
-                    return result[0]
-                
-        except sqlite3.Error as e:
-            print(f"Error querying default-cards.db: {e}")
-        
-        return None
+        # Fallback images for display only (do not imply a match), resolved
+        # for the whole order at once from the local card database.
+        missing = [item['name'] for item, result in zip(items, results)
+                   if not result["image_url"]]
+        if missing:
+            images = image_urls_for_names(missing)
+            for item, result in zip(items, results):
+                if not result["image_url"]:
+                    result["image_url"] = images.get(item['name'])
+        return results
 
 
 # Global service instance
@@ -5,7 +5,9 @@ VAT calculation, no profit determination. It only *reads* the order data that is
 already stored and renders it as Excel-friendly German CSV, so it can be handed
 to the accounting software / tax advisor.
 
-Nothing here writes to the database.
+Nothing here writes to the database. The daily sales cube (``verkauf_tag``)
+is kept up to date by triggers set up in ``setup_db``; this module only
+slices it.
 """
 
 from __future__ import annotations
@@ -25,6 +27,21 @@ POSITION_COLUMNS = [
     "Datum", "Bestellnummer", "Menge", "Kartenname", "Set", "Zustand", "Foil", "Einzelpreis",
 ]
 
+# Dimensions of the daily sales cube (``verkauf_tag``): key -> (header, SQL).
+CUBE_DIMENSIONS = {
+    "jahr": ("Jahr", "substr(tag, 1, 4)"),
+    "monat": ("Monat", "substr(tag, 1, 7)"),
+    "tag": ("Datum", "tag"),
+    "verkaufskanal": ("Kanal", "verkaufskanal"),
+    "set_code": ("Set", "set_code"),
+    "language": ("Sprache", "language"),
+    "condition": ("Zustand", "condition"),
+    "foil": ("Foil", "foil"),
+    "rarity": ("Seltenheit", "rarity"),
+}
+CUBE_DEFAULT = ("monat", "set_code")
+CUBE_MEASURES = ["Menge", "Umsatz", "Bestellungen"]
+
 CSV_DELIMITER = ";"          # German Excel default
 CSV_ENCODING = "utf-8-sig"   # UTF-8 *with BOM* so Excel shows ä/ö/ü/ß and € right
 
@@ -137,7 +154,9 @@ def _num(value) -> float:
 # ---------------------------------------------------------------------------
 # Queries (strictly read-only)
 # ---------------------------------------------------------------------------
-_ORDER_DATE = "COALESCE(o.email_date, o.date_received)"
+# ``o.order_date`` is the calendar day of ``_ORDER_TS``, kept by a trigger and
+# indexed, so the period filter is an index range scan.
+_ORDER_TS = "COALESCE(o.email_date, o.date_received)"
 
 
 def fetch_orders(db_file: str, start: date, end: date) -> List[Dict]:
@@ -146,20 +165,20 @@ def fetch_orders(db_file: str, start: date, end: date) -> List[Dict]:
         conn.row_factory = sqlite3.Row
         rows = conn.execute(
             f"""
-            SELECT {_ORDER_DATE} AS order_date, o.order_number, o.buyer_name, o.address,
+            SELECT {_ORDER_TS} AS order_ts, o.order_number, o.buyer_name, o.address,
                    o.amount_gesamtwert, o.amount_versand, o.amount_gesamt,
                    o.amount_gebuehren, o.amount_auszahlung,
                    (SELECT COALESCE(SUM(oi.quantity), 0) FROM order_items oi
                      WHERE oi.order_id = o.id) AS item_count
             FROM orders o
-            WHERE date({_ORDER_DATE}) BETWEEN ? AND ?
-            ORDER BY {_ORDER_DATE} ASC, o.id ASC
+            WHERE o.order_date BETWEEN ? AND ?
+            ORDER BY {_ORDER_TS} ASC, o.id ASC
             """,
             (start.isoformat(), end.isoformat()),
         ).fetchall()
     return [
         {
-            "date": r["order_date"],
+            "date": r["order_ts"],
             "order_number": r["order_number"] or "",
             "buyer": r["buyer_name"] or "",
             "country": country_from_address(r["address"]),
@@ -180,20 +199,20 @@ def fetch_positions(db_file: str, start: date, end: date) -> List[Dict]:
         conn.row_factory = sqlite3.Row
         rows = conn.execute(
             f"""
-            SELECT {_ORDER_DATE} AS order_date, o.order_number,
+            SELECT {_ORDER_TS} AS order_ts, o.order_number,
                    oi.quantity, oi.card_name,
                    COALESCE(NULLIF(oi.set_name, ''), oi.set_code, '') AS set_label,
                    oi.condition, oi.foil, oi.unit_price
             FROM order_items oi
             JOIN orders o ON oi.order_id = o.id
-            WHERE date({_ORDER_DATE}) BETWEEN ? AND ?
-            ORDER BY {_ORDER_DATE} ASC, o.id ASC, oi.card_name ASC
+            WHERE o.order_date BETWEEN ? AND ?
+            ORDER BY {_ORDER_TS} ASC, o.id ASC, oi.card_name ASC
             """,
             (start.isoformat(), end.isoformat()),
         ).fetchall()
     return [
         {
-            "date": r["order_date"],
+            "date": r["order_ts"],
             "order_number": r["order_number"] or "",
             "quantity": r["quantity"] or 0,
             "card_name": r["card_name"] or "",
@@ -206,6 +225,38 @@ def fetch_positions(db_file: str, start: date, end: date) -> List[Dict]:
     ]
 
 
+def cube_dimensions(requested: Sequence[str]) -> List[str]:
+    """Known dimension keys from ``requested``, in cube order; default if none."""
+    dims = [d for d in CUBE_DIMENSIONS if d in requested]
+    return dims or list(CUBE_DEFAULT)
+
+
+def fetch_cube(db_file: str, start: date, end: date,
+               dims: Sequence[str]) -> List[Dict]:
+    """Slice the daily sales cube: sums per combination of ``dims`` in the period.
+
+    ``bestellungen`` counts orders per cube cell; an order whose positions fall
+    into several rows (e.g. two sets) is counted in each of them.
+    """
+    dims = cube_dimensions(dims)
+    cols = ", ".join(f"{CUBE_DIMENSIONS[d][1]} AS {d}" for d in dims)
+    keys = ", ".join(dims)
+    with sqlite3.connect(db_file) as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            f"""
+            SELECT {cols}, SUM(menge) AS menge, SUM(umsatz_cent) AS umsatz_cent,
+                   SUM(bestellungen) AS bestellungen
+            FROM verkauf_tag
+            WHERE tag BETWEEN ? AND ?
+            GROUP BY {keys}
+            ORDER BY {keys}
+            """,
+            (start.isoformat(), end.isoformat()),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
 def monthly_summary(orders: Sequence[Dict]) -> List[Dict]:
     """Aggregate the orders per calendar month for the overview table."""
     buckets: Dict[str, Dict] = {}
@@ -271,6 +322,32 @@ def build_positions_csv(positions: Sequence[Dict]) -> bytes:
     return _to_csv(POSITION_COLUMNS, rows)
 
 
+def _cube_cell(dim: str, value) -> str:
+    if dim == "foil":
+        return "Ja" if value else "Nein"
+    if dim == "tag":
+        return de_date(value)
+    if dim == "monat":
+        y, m = (str(value).split("-") + [""])[:2]
+        return f"{m}.{y}"
+    return str(value)
+
+
+def build_cube_csv(rows: Sequence[Dict], dims: Sequence[str]) -> bytes:
+    """Cube slice: one line per combination of ``dims``, plus a totals line."""
+    out = [
+        [_cube_cell(d, r[d]) for d in dims]
+        + [r["menge"], de_amount(r["umsatz_cent"] / 100), r["bestellungen"]]
+        for r in rows
+    ]
+    out.append(
+        ["Summe"] + [""] * (len(dims) - 1)
+        + [sum(r["menge"] for r in rows),
+           de_amount(sum(r["umsatz_cent"] for r in rows) / 100), ""]
+    )
+    return _to_csv([CUBE_DIMENSIONS[d][0] for d in dims] + CUBE_MEASURES, out)
+
+
 def export_filename(prefix: str, start: date, end: date) -> str:
     """e.g. ``verkaeufe_2026-01-01_bis_2026-12-31.csv``."""
     return f"{prefix}_{start.isoformat()}_bis_{end.isoformat()}.csv"
@@ -0,0 +1,197 @@
+"""Ein Schreiber für die Inventardatenbank.
+
+Bestellabruf, Hintergrundläufe und Flask-Anfragen haben bisher jeweils über
+eigene Verbindungen in ``mtg_lager.db`` geschrieben. Zwei Transaktionen, die
+erst lesen und dann schreiben wollen, kommen sich dabei in die Quere —
+SQLite bricht eine davon sofort mit „database is locked“ ab, ohne die
+Wartezeit abzuwarten. Deshalb:
+
+* Schreibende Arbeit geht als Arbeitseinheit in eine Warteschlange: eine
+  Funktion, die eine Verbindung bekommt. Ein eigener Thread führt die
+  Einheiten nacheinander aus, jede in einer Transaktion
+  (``BEGIN IMMEDIATE`` … ``COMMIT``). Ergebnis oder Fehler kommen beim
+  Aufrufer an; Einheiten committen nicht selbst.
+* Die Datenbank läuft im WAL-Modus (eingestellt von ``setup_db``): Leser
+  sehen den letzten Stand, ohne den Schreiber aufzuhalten, und umgekehrt.
+  Jede Verbindung wartet bis zu ``BUSY_TIMEOUT_MS`` auf eine Sperre (etwa
+  die einer Sicherung), statt aufzugeben; das Beginnen einer Transaktion
+  wird danach noch ``WIEDERHOLUNGEN``-mal versucht.
+* Kennzahlen (``statistik``): Länge der Warteschlange, Wartezeit in der
+  Schlange und auf die Sperre, Laufzeit der Einheiten.
+
+Ein langer Import besteht aus vielen kleinen Einheiten; ein Verkauf
+dazwischen reiht sich ein und wartet höchstens eine davon ab.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+#: Wartezeit auf eine Sperre je Verbindung; über ``TCG_DB_BUSY_TIMEOUT_MS``.
+BUSY_TIMEOUT_MS = int(os.environ.get("TCG_DB_BUSY_TIMEOUT_MS", "5000"))
+#: Weitere Versuche, eine Transaktion zu beginnen, wenn die Wartezeit nicht reicht.
+WIEDERHOLUNGEN = 3
+#: Pause zwischen diesen Versuchen (Sekunden, verdoppelt sich je Versuch).
+PAUSE = 0.1
+
+Arbeit = Callable[[sqlite3.Connection], Any]
+
+
+def _gesperrt(exc: sqlite3.OperationalError) -> bool:
+    text = str(exc).lower()
+    return "locked" in text or "busy" in text
+
+
+def verbinde(db_file: Optional[str] = None,
+             autocommit: bool = False) -> sqlite3.Connection:
+    """Verbindung, die bis zu ``BUSY_TIMEOUT_MS`` auf Sperren wartet.
+
+    Den WAL-Modus stellt ``setup_db.initialize_database`` einmal für die
+    Datei ein; er bleibt dort gespeichert und muss nicht je Verbindung
+    gesetzt werden.
+
+    Ohne ``db_file`` gilt ``TCGInventory.DB_FILE`` zum Zeitpunkt des Aufrufs.
+    """
+    if db_file is None:
+        from TCGInventory import DB_FILE as db_file
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False,
+                           isolation_level=None if autocommit else "")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class Schreiber:
+    """Warteschlange plus Schreib-Thread; je Datenbankdatei eine Verbindung."""
+
+    def __init__(self) -> None:
+        self._schlange: queue.Queue = queue.Queue()
+        self._sperre = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pfad: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._werte = self._leere_werte()
+
+    @staticmethod
+    def _leere_werte() -> Dict[str, float]:
+        return {"ausgefuehrt": 0, "fehler": 0, "max_warteschlange": 0,
+                "wartezeit_s": 0.0, "max_wartezeit_s": 0.0,
+                "sperre_s": 0.0, "max_sperre_s": 0.0, "laufzeit_s": 0.0}
+
+    def einreichen(self, arbeit: Arbeit, db_file: str) -> Future:
+        """Einheit einreihen; das Ergebnis liefert das zurückgegebene Future."""
+        zukunft: Future = Future()
+        if threading.current_thread() is self._thread:
+            # Aus einer laufenden Einheit heraus: in deren Transaktion mitlaufen,
+            # sonst warteten beide aufeinander.
+            try:
+                zukunft.set_result(arbeit(self._conn))
+            except BaseException as exc:          # noqa: BLE001
+                zukunft.set_exception(exc)
+            return zukunft
+        with self._sperre:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._lauf, name="db-schreiber",
+                                                daemon=True)
+                self._thread.start()
+            self._schlange.put((zukunft, arbeit, str(db_file), time.perf_counter()))
+            tiefe = self._schlange.qsize()
+            if tiefe > self._werte["max_warteschlange"]:
+                self._werte["max_warteschlange"] = tiefe
+        return zukunft
+
+    def ausfuehren(self, arbeit: Arbeit, db_file: str) -> Any:
+        """Einheit einreihen und auf ihr Ergebnis warten."""
+        return self.einreichen(arbeit, db_file).result()
+
+    def statistik(self) -> Dict[str, float]:
+        """Kennzahlen seit dem Start (oder dem letzten ``zuruecksetzen``)."""
+        with self._sperre:
+            werte = dict(self._werte)
+        werte["warteschlange"] = self._schlange.qsize()
+        anzahl = werte["ausgefuehrt"] + werte["fehler"]
+        werte["mittlere_wartezeit_s"] = werte["wartezeit_s"] / anzahl if anzahl else 0.0
+        werte["mittlere_sperre_s"] = werte["sperre_s"] / anzahl if anzahl else 0.0
+        return werte
+
+    def zuruecksetzen(self) -> None:
+        """Kennzahlen auf null setzen."""
+        with self._sperre:
+            self._werte = self._leere_werte()
+
+    def _verbindung(self, pfad: str) -> sqlite3.Connection:
+        if self._pfad != pfad:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = verbinde(pfad, autocommit=True)
+            self._pfad = pfad
+        return self._conn
+
+    def _beginne(self, conn: sqlite3.Connection) -> None:
+        for versuch in range(WIEDERHOLUNGEN + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as exc:
+                if not _gesperrt(exc) or versuch == WIEDERHOLUNGEN:
+                    raise
+                time.sleep(PAUSE * 2 ** versuch)
+
+    def _lauf(self) -> None:
+        while True:
+            zukunft, arbeit, pfad, eingereiht = self._schlange.get()
+            beginn = time.perf_counter()
+            gesperrt = beginn
+            try:
+                conn = self._verbindung(pfad)
+                conn.row_factory = None
+                self._beginne(conn)
+                gesperrt = time.perf_counter()
+                ergebnis = arbeit(conn)
+                if conn.in_transaction:
+                    conn.execute("COMMIT")
+            except BaseException as exc:          # noqa: BLE001
+                try:
+                    if self._conn is not None and self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    self._conn, self._pfad = None, None
+                ok = False
+                zukunft.set_exception(exc)
+            else:
+                ok = True
+                zukunft.set_result(ergebnis)
+            ende = time.perf_counter()
+            with self._sperre:
+                w = self._werte
+                w["ausgefuehrt" if ok else "fehler"] += 1
+                w["wartezeit_s"] += beginn - eingereiht
+                w["max_wartezeit_s"] = max(w["max_wartezeit_s"], beginn - eingereiht)
+                w["sperre_s"] += gesperrt - beginn
+                w["max_sperre_s"] = max(w["max_sperre_s"], gesperrt - beginn)
+                w["laufzeit_s"] += ende - gesperrt
+
+
+_SCHREIBER = Schreiber()
+
+
+def schreibe(arbeit: Arbeit, db_file: Optional[str] = None) -> Any:
+    """``arbeit(conn)`` im Schreib-Thread in einer Transaktion ausführen.
+
+    Gibt das Ergebnis von ``arbeit`` zurück; Ausnahmen werden beim Aufrufer
+    erneut ausgelöst, die Transaktion ist dann zurückgerollt.
+    """
+    if db_file is None:
+        from TCGInventory import DB_FILE as db_file
+    return _SCHREIBER.ausfuehren(arbeit, db_file)
+
+
+def statistik() -> Dict[str, float]:
+    """Kennzahlen des Schreibers (siehe ``Schreiber.statistik``)."""
+    return _SCHREIBER.statistik()
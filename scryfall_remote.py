@@ -0,0 +1,247 @@
+"""Online-Rückfall auf die Scryfall-API, gebündelt und gedrosselt.
+
+Die Kartensuche läuft zuerst gegen die lokale Kartendatenbank
+(``card_scanner``). Nur was dort fehlt, wird bei Scryfall nachgefragt — und
+zwar über diesen einen Zugang:
+
+* eine gemeinsame ``requests.Session`` (Verbindungen werden wiederverwendet,
+  statt für jede Karte neu aufgebaut zu werden),
+* Namen im Block über ``/cards/collection`` (bis zu 75 je Aufruf) statt einer
+  Anfrage je Karte,
+* ein Mindestabstand zwischen zwei Anfragen, wie Scryfall ihn verlangt, und
+  Wiederholung mit wachsender Wartezeit bei 429/5xx oder Verbindungsfehlern,
+* ein Negativ-Speicher für Namen, die es nicht gibt — ein Tippfehler in einer
+  Importliste kostet nur beim ersten Mal eine Anfrage.
+
+Rückgabe sind die rohen Scryfall-Objekte; die Umwandlung in ``CardInfo``
+übernimmt ``card_scanner``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASIS_URL = "https://api.scryfall.com"
+
+#: Scryfall bittet um eine aussagekräftige Kennung.
+USER_AGENT = "TCGInventory/1.0 (Kartensuche)"
+
+#: Höchstzahl an Kennungen je Aufruf von ``/cards/collection``.
+BLOCK = 75
+
+#: Mindestabstand zwischen zwei Anfragen in Sekunden. Such-Endpunkte sind bei
+#: Scryfall strenger begrenzt (2 je Sekunde) als die übrigen (10 je Sekunde).
+ABSTAND = 0.1
+ABSTAND_SUCHE = 0.5
+SUCH_ENDPUNKTE = ("/cards/collection", "/cards/named", "/cards/search")
+
+#: Wiederholungen bei 429/5xx/Verbindungsfehlern und erste Wartezeit.
+VERSUCHE = 3
+WARTEZEIT = 1.0
+
+#: Wie lange und wie viele nicht gefundene Namen gemerkt werden.
+NEGATIV_DAUER = 24 * 3600
+NEGATIV_MAX = 5000
+
+TIMEOUT = 10
+
+
+class ScryfallResolver:
+    """Gemeinsamer, gedrosselter Zugang zur Scryfall-API."""
+
+    def __init__(self, basis_url: str = BASIS_URL, abstand: float = ABSTAND,
+                 abstand_suche: float = ABSTAND_SUCHE, versuche: int = VERSUCHE,
+                 wartezeit: float = WARTEZEIT, timeout: float = TIMEOUT,
+                 negativ_dauer: float = NEGATIV_DAUER) -> None:
+        self.basis_url = basis_url.rstrip("/")
+        self.abstand = abstand
+        self.abstand_suche = abstand_suche
+        self.versuche = max(1, versuche)
+        self.wartezeit = wartezeit
+        self.timeout = timeout
+        self.negativ_dauer = negativ_dauer
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT,
+                                     "Accept": "application/json"})
+        self.anfragen = 0
+        self._letzte = 0.0
+        self._takt = threading.Lock()
+        self._negativ: OrderedDict[str, float] = OrderedDict()
+        self._negativ_sperre = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Transport
+    # ------------------------------------------------------------------
+    def _warte_auf_takt(self, pfad: str) -> None:
+        """Den Mindestabstand zur vorigen Anfrage einhalten (über alle Threads)."""
+        abstand = self.abstand_suche if pfad.startswith(SUCH_ENDPUNKTE) else self.abstand
+        with self._takt:
+            rest = self._letzte + abstand - time.monotonic()
+            if rest > 0:
+                time.sleep(rest)
+            self._letzte = time.monotonic()
+
+    def _anfrage(self, methode: str, pfad: str, **kwargs) -> Optional[Dict]:
+        """Eine Anfrage mit Drosselung und Wiederholung.
+
+        ``None`` bei 404 (gibt es nicht); andere Fehler werden nach dem letzten
+        Versuch als ``requests.RequestException`` weitergereicht.
+        """
+        for versuch in range(self.versuche):
+            self._warte_auf_takt(pfad)
+            self.anfragen += 1
+            try:
+                antwort = self.session.request(methode, self.basis_url + pfad,
+                                               timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if versuch + 1 >= self.versuche:
+                    raise
+                time.sleep(self.wartezeit * 2 ** versuch)
+                continue
+            if antwort.status_code == 404:
+                return None
+            if antwort.status_code == 429 or antwort.status_code >= 500:
+                if versuch + 1 >= self.versuche:
+                    antwort.raise_for_status()
+                try:
+                    pause = float(antwort.headers.get("Retry-After", ""))
+                except ValueError:
+                    pause = self.wartezeit * 2 ** versuch
+                time.sleep(pause)
+                continue
+            antwort.raise_for_status()
+            return antwort.json()
+        return None
+
+    # ------------------------------------------------------------------
+    # Negativ-Speicher
+    # ------------------------------------------------------------------
+    def ist_unbekannt(self, name: str) -> bool:
+        """Wurde ``name`` kürzlich vergeblich gesucht?"""
+        schluessel = name.strip().lower()
+        with self._negativ_sperre:
+            bis = self._negativ.get(schluessel)
+            if bis is None:
+                return False
+            if bis < time.monotonic():
+                del self._negativ[schluessel]
+                return False
+            return True
+
+    def _merke_unbekannt(self, name: str) -> None:
+        schluessel = name.strip().lower()
+        with self._negativ_sperre:
+            self._negativ[schluessel] = time.monotonic() + self.negativ_dauer
+            self._negativ.move_to_end(schluessel)
+            while len(self._negativ) > NEGATIV_MAX:
+                self._negativ.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+    def karte(self, card_id: str) -> Optional[Dict]:
+        """Eine Karte über ihre Scryfall-ID."""
+        return self._anfrage("GET", f"/cards/{card_id}")
+
+    def karte_nach_name(self, name: str) -> Optional[Dict]:
+        """Eine Karte über ihren exakten Namen (``None`` = gibt es nicht)."""
+        if self.ist_unbekannt(name):
+            return None
+        daten = self._anfrage("GET", "/cards/named", params={"exact": name})
+        if daten is None:
+            self._merke_unbekannt(name)
+        return daten
+
+    def namen_aufloesen(self, namen: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Viele Namen auf einmal, je 75 über ``/cards/collection``.
+
+        Rückgabe: Eingabename -> Scryfall-Karte oder ``None``, für jede
+        Schreibweise, in der ein Name übergeben wurde. Doppelseitige
+        Karten werden auch über den Namen einer Seite gefunden. Als unbekannt
+        gilt nur, was Scryfall unter ``not_found`` zurückgibt; die gefundenen
+        Karten kommen in der Reihenfolge der Anfrage und werden danach
+        zugeordnet, nicht über den (von Scryfall kanonisierten) Namen.
+        Scheitert die Anfrage eines Blocks, fehlen nur dessen Namen in der
+        Rückgabe.
+        """
+        # Gleiche Namen in anderer Schreibweise fragen wir einmal an; in der
+        # Rückgabe steht trotzdem jede Schreibweise der Eingabe.
+        schreibweisen: Dict[str, List[str]] = {}
+        offen: List[str] = []
+        aufgeloest: Dict[str, Optional[Dict]] = {}
+        for name in namen:
+            schluessel = name.strip().lower()
+            if not schluessel:
+                continue
+            if schluessel in schreibweisen:
+                schreibweisen[schluessel].append(name)
+                continue
+            schreibweisen[schluessel] = [name]
+            if self.ist_unbekannt(name):
+                aufgeloest[schluessel] = None
+            else:
+                offen.append(name)
+
+        for start in range(0, len(offen), BLOCK):
+            block = offen[start:start + BLOCK]
+            try:
+                daten = self._anfrage(
+                    "POST", "/cards/collection",
+                    json={"identifiers": [{"name": n} for n in block]})
+            except requests.RequestException as exc:
+                print(f"❌ Scryfall-Sammelabfrage fehlgeschlagen: {exc}")
+                continue
+            if daten is None:
+                continue
+            fehlt = {(k.get("name") or "").strip().lower()
+                     for k in daten.get("not_found", [])}
+            gefunden = [n.strip().lower() for n in block
+                        if n.strip().lower() not in fehlt]
+            karten = daten.get("data", [])
+            if len(karten) == len(gefunden):
+                aufgeloest.update(zip(gefunden, karten))
+            else:
+                # Unerwartete Antwort: über den Namen zuordnen, was passt.
+                nach_name: Dict[str, Dict] = {}
+                for karte in karten:
+                    voll = (karte.get("name") or "").lower()
+                    nach_name.setdefault(voll, karte)
+                    for seite in voll.split(" // "):
+                        nach_name.setdefault(seite, karte)
+                for schluessel in gefunden:
+                    aufgeloest[schluessel] = nach_name.get(schluessel)
+            for name in block:
+                if name.strip().lower() in fehlt:
+                    aufgeloest[name.strip().lower()] = None
+                    self._merke_unbekannt(name)
+
+        return {name: karte
+                for schluessel, karte in aufgeloest.items()
+                for name in schreibweisen[schluessel]}
+
+    def autocomplete(self, query: str) -> List[str]:
+        """Namensvorschläge (Scryfall liefert höchstens 20)."""
+        daten = self._anfrage("GET", "/cards/autocomplete", params={"q": query})
+        return (daten or {}).get("data", [])
+
+
+_RESOLVER: ScryfallResolver | None = None
+_RESOLVER_SPERRE = threading.Lock()
+
+
+def get_resolver() -> ScryfallResolver:
+    """Den gemeinsamen Zugang der Anwendung (eine Session für alle Threads)."""
+    global _RESOLVER
+    with _RESOLVER_SPERRE:
+        if _RESOLVER is None:
+            _RESOLVER = ScryfallResolver()
+        return _RESOLVER
@@ -3,10 +3,31 @@ import sqlite3
 from . import DB_FILE
 from .auth import init_user_db
 
+#: Kalendertag einer Bestellung und ihres Abschlusses, wie ihn die Trigger
+#: in ``orders.order_date`` / ``orders.completed_date`` ablegen.
+ORDER_DATE_SQL = "substr(COALESCE(email_date, date_received), 1, 10)"
+COMPLETED_DATE_SQL = "substr(COALESCE(date_completed, email_date, date_received), 1, 10)"
+
+#: Zeilen fuer ``verkauf_tag`` aus Bestellungen und Positionen; der Aufrufer
+#: haengt ``WHERE ...`` und ``GROUP BY 1, 2, 3, 4, 5, 6, 7`` an.
+VERKAUF_TAG_SQL = """
+    SELECT o.order_date, COALESCE(o.verkaufskanal, 'cardmarket'),
+           COALESCE(oi.set_code, ''), COALESCE(oi.language, ''),
+           COALESCE(oi.condition, ''), COALESCE(oi.foil, 0),
+           COALESCE(oi.rarity, ''),
+           SUM(oi.quantity),
+           SUM(oi.quantity * CAST(round(COALESCE(oi.unit_price, 0) * 100) AS INTEGER)),
+           COUNT(DISTINCT o.id)
+    FROM order_items oi JOIN orders o ON o.id = oi.order_id
+"""
+
 
 def initialize_database() -> None:
     """Create the SQLite database and all required tables."""
     with sqlite3.connect(DB_FILE) as conn:
+        # WAL: readers and the single writer (see ``schreiber``) don't block
+        # each other. The mode is stored in the file.
+        conn.execute("PRAGMA journal_mode = WAL")
         cursor = conn.cursor()
         init_user_db()
 
@@ -117,6 +138,10 @@ def initialize_database() -> None:
         cursor.execute(
             "CREATE INDEX IF NOT EXISTS idx_cards_name ON cards(name)"
         )
+        # Order matching looks cards up by lower(name); an expression index serves it.
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cards_name_folded ON cards(lower(name))"
+        )
 
         # Tabelle 2: Lagerplätze
         cursor.execute(
@@ -204,6 +229,39 @@ def initialize_database() -> None:
             if col not in order_columns:
                 cursor.execute(f"ALTER TABLE orders ADD COLUMN {col} {coltype}")
 
+        # Normalisierte Kalendertage (JJJJ-MM-TT) fuer Zeitraumabfragen:
+        # order_date = Bestelltag (Mail, sonst Eingang), completed_date =
+        # Abschlusstag (Verkauft-Datum, sonst Bestelltag). Auf Ausdruecken
+        # ueber COALESCE(...) kann SQLite keinen Index nutzen, auf diesen
+        # Spalten schon. Trigger fuehren sie bei jedem INSERT und bei jeder
+        # Aenderung der Quellspalten nach; vorhandene Zeilen werden einmalig
+        # nachgetragen.
+        neue_datumsspalten = [c for c in ("order_date", "completed_date")
+                              if c not in order_columns]
+        for col in neue_datumsspalten:
+            cursor.execute(f"ALTER TABLE orders ADD COLUMN {col} TEXT")
+        datum_setzen = (
+            f"UPDATE orders SET order_date = {ORDER_DATE_SQL}, "
+            f"completed_date = {COMPLETED_DATE_SQL}"
+        )
+        if neue_datumsspalten:
+            cursor.execute(datum_setzen)
+        for name, ereignis in (
+            ("orders_datum_neu", "INSERT"),
+            ("orders_datum_nachtrag", "UPDATE OF email_date, date_received, date_completed"),
+        ):
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {ereignis} ON orders "
+                f"FOR EACH ROW BEGIN {datum_setzen} WHERE id = NEW.id; END"
+            )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders(order_date)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_orders_status_completed "
+            "ON orders(status, completed_date)"
+        )
+
         # Tabelle 5: Order items (cards in orders)
         cursor.execute(
             """
@@ -239,6 +297,141 @@ def initialize_database() -> None:
             if col not in item_columns:
                 cursor.execute(f"ALTER TABLE order_items ADD COLUMN {col} {coltype}")
 
+        # Seltenheit der verknuepften Karte, festgehalten an der Position:
+        # Der Verkauf des letzten Exemplars loescht die Karte (sell_card),
+        # die Auswertung nach Seltenheit soll das ueberstehen. Trigger
+        # uebernehmen sie beim Verknuepfen und bei Aenderungen an der Karte.
+        if "rarity" not in item_columns:
+            cursor.execute("ALTER TABLE order_items ADD COLUMN rarity TEXT")
+            cursor.execute(
+                "UPDATE order_items SET rarity = "
+                "(SELECT rarity FROM cards WHERE cards.id = order_items.card_id) "
+                "WHERE card_id IS NOT NULL"
+            )
+        seltenheit_holen = (
+            "UPDATE order_items SET rarity = "
+            "(SELECT rarity FROM cards WHERE id = NEW.card_id) WHERE id = NEW.id"
+        )
+        cursor.execute(
+            "CREATE TRIGGER IF NOT EXISTS order_items_rarity_neu "
+            "AFTER INSERT ON order_items FOR EACH ROW WHEN NEW.card_id IS NOT NULL "
+            f"BEGIN {seltenheit_holen}; END"
+        )
+        cursor.execute(
+            "CREATE TRIGGER IF NOT EXISTS order_items_rarity_nachtrag "
+            "AFTER UPDATE OF card_id ON order_items FOR EACH ROW "
+            "WHEN NEW.card_id IS NOT OLD.card_id "
+            f"BEGIN {seltenheit_holen}; END"
+        )
+        cursor.execute(
+            "CREATE TRIGGER IF NOT EXISTS cards_rarity_nachtrag "
+            "AFTER UPDATE OF rarity ON cards FOR EACH ROW "
+            "WHEN NEW.rarity IS NOT OLD.rarity BEGIN "
+            "UPDATE order_items SET rarity = NEW.rarity WHERE card_id = NEW.id; END"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_order_items_card ON order_items(card_id)"
+        )
+
+        # Verkaufswuerfel: eine Zeile je Bestelltag und Merkmalskombination
+        # (Kanal, Set, Sprache, Zustand, Foil, Seltenheit) mit Stueckzahl,
+        # Umsatz in Cent und Zahl der Bestellungen. Die Auswertung liest nur
+        # diese Tabelle. Trigger rechnen jeden betroffenen Tag neu, sobald
+        # sich eine Bestellung oder Position aendert oder geloescht wird —
+        # ein Tag hat wenige Positionen, das bleibt billig und kann nicht
+        # wie aufsummierte Differenzen auseinanderlaufen.
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'verkauf_tag'"
+        )
+        wuerfel_neu = cursor.fetchone() is None
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS verkauf_tag (
+                tag TEXT NOT NULL,
+                verkaufskanal TEXT NOT NULL,
+                set_code TEXT NOT NULL,
+                language TEXT NOT NULL,
+                condition TEXT NOT NULL,
+                foil INTEGER NOT NULL,
+                rarity TEXT NOT NULL,
+                menge INTEGER NOT NULL,
+                umsatz_cent INTEGER NOT NULL,
+                bestellungen INTEGER NOT NULL,
+                PRIMARY KEY (tag, verkaufskanal, set_code, language,
+                             condition, foil, rarity)
+            ) WITHOUT ROWID
+            """
+        )
+
+        def tage_neu_rechnen(tage: str) -> str:
+            return (
+                f"DELETE FROM verkauf_tag WHERE tag IN ({tage}); "
+                f"INSERT INTO verkauf_tag {VERKAUF_TAG_SQL} "
+                f"WHERE o.order_date IN ({tage}) GROUP BY 1, 2, 3, 4, 5, 6, 7;"
+            )
+
+        tage_der_positionen = "SELECT order_date FROM orders WHERE id IN ({})"
+        for name, ereignis, tage in (
+            ("verkauf_tag_position_neu", "INSERT ON order_items",
+             tage_der_positionen.format("NEW.order_id")),
+            ("verkauf_tag_position_weg", "DELETE ON order_items",
+             tage_der_positionen.format("OLD.order_id")),
+            ("verkauf_tag_position_nachtrag",
+             "UPDATE OF order_id, quantity, unit_price, set_code, language, "
+             "condition, foil, rarity ON order_items",
+             tage_der_positionen.format("OLD.order_id, NEW.order_id")),
+            ("verkauf_tag_bestellung_nachtrag",
+             "UPDATE OF order_date, verkaufskanal ON orders",
+             "SELECT OLD.order_date UNION SELECT NEW.order_date"),
+            ("verkauf_tag_bestellung_weg", "DELETE ON orders",
+             "SELECT OLD.order_date"),
+        ):
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {ereignis} "
+                f"FOR EACH ROW BEGIN {tage_neu_rechnen(tage)} END"
+            )
+        if wuerfel_neu:
+            cursor.execute(
+                f"INSERT INTO verkauf_tag {VERKAUF_TAG_SQL} "
+                "WHERE o.order_date IS NOT NULL GROUP BY 1, 2, 3, 4, 5, 6, 7"
+            )
+
+        # Sync-Stand des Mailabrufs (z. B. die zuletzt gesehene Gmail-historyId).
+        # Liegt in der Datenbank statt im Speicher, damit ein Neustart nicht
+        # das ganze Postfach neu durchsucht.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sync_stand (
+                schluessel TEXT PRIMARY KEY,
+                wert TEXT NOT NULL,
+                geaendert_am TEXT NOT NULL
+            )
+            """
+        )
+
+        # Index des Mailarchivs (siehe mailarchiv.py): wo der Text jeder
+        # eingelesenen Bestellmail in data/mailarchiv/ liegt.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mailarchiv (
+                message_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                datei TEXT NOT NULL,
+                versatz INTEGER NOT NULL,
+                laenge INTEGER NOT NULL,
+                betreff TEXT,
+                email_date TEXT,
+                abgelegt_am TEXT NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_mailarchiv_sha256 ON mailarchiv(sha256)"
+        )
+
         # Tabelle 6: Audit log for tracking changes
         cursor.execute(
             """
@@ -275,6 +468,16 @@ def initialize_database() -> None:
             )
             """
         )
+        # Belegdateien liegen inhaltsadressiert (nach SHA-256) ab; gleiche
+        # Dateien teilen sich Ablage und Vorschaubild, behalten aber je
+        # Hochladen eine eigene Zeile. vorschau: Pfad des Vorschaubilds
+        # relativ zum Belegordner, NULL wenn keins erzeugt werden konnte.
+        cursor.execute("PRAGMA table_info(belege)")
+        if "vorschau" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE belege ADD COLUMN vorschau TEXT")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_belege_sha256 ON belege(sha256)"
+        )
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS journal (
@@ -320,12 +523,37 @@ def initialize_database() -> None:
         cursor.execute(
             "CREATE INDEX IF NOT EXISTS idx_journal_zahlung ON journal(zahlungseingang_am)"
         )
+        # Buchungen je Bestellung (Bestellansicht, Uebernahme-Pruefung).
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_bestellung ON journal(bestellung_id)"
+        )
+        # Journalansicht: gefiltert nach Art bzw. Kategorie, geblaettert ueber lfd_nr.
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_art_nr ON journal(art, lfd_nr)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_kategorie_nr ON journal(kategorie, lfd_nr)"
+        )
+        # Stichtag der EUER (Zufluss bei Einnahmen, Buchungsdatum bei Ausgaben)
+        # fuer die Auswertung; nur aktive Buchungen. Der Ausdruck muss
+        # woertlich bookkeeping.STICHTAG_SQL entsprechen.
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_stichtag ON journal("
+            "coalesce(substr(CASE WHEN art = 'einnahme' THEN zahlungseingang_am "
+            "ELSE buchungsdatum END, 1, 10), ''), art, kategorie, betrag_cent) "
+            "WHERE art <> 'storno' AND storniert_durch IS NULL"
+        )
         # Verknuepfung zur erfassten Auszahlung (Zuflussprinzip); wird wie
         # zahlungseingang_am einmalig nachgetragen.
         cursor.execute("PRAGMA table_info(journal)")
         journal_columns = [row[1] for row in cursor.fetchall()]
         if "auszahlung_id" not in journal_columns:
             cursor.execute("ALTER TABLE journal ADD COLUMN auszahlung_id INTEGER")
+        # Abgleich der Auszahlungen: zugeordnete Buchungen je Auszahlung und
+        # die noch offenen (auszahlung_id IS NULL).
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_auszahlung ON journal(auszahlung_id)"
+        )
 
         # Briefmarken-Vorrat: vorab gekaufte Marken je Wert. Der Kauf wird EINMAL
         # als Ausgabe im Journal gebucht (mit Beleg); beim Versand wird hier nur
@@ -450,6 +678,80 @@ def initialize_database() -> None:
                     "(SELECT 1 FROM markenart m WHERE m.nennwert_cent = b.wert_cent)"
                 )
 
+        # Gefuehrter Bestand je Markenart: gekaufte (ohne stornierte Kaeufe) und
+        # verbrauchte Stueck als Zaehler, damit Versand und Markenliste nicht
+        # bei jedem Aufruf alle Kaeufe und Verbraeuche summieren. Die Trigger
+        # decken jeden Weg ab (Kauf, Verbrauch, Ruecknahme, Storno);
+        # bookkeeping.verify_markenbestand rechnet nach.
+        cursor.execute("PRAGMA table_info(markenart)")
+        markenart_spalten = [row[1] for row in cursor.fetchall()]
+        if "gekauft" not in markenart_spalten:
+            cursor.execute("ALTER TABLE markenart ADD COLUMN gekauft INTEGER NOT NULL DEFAULT 0")
+            cursor.execute(
+                "ALTER TABLE markenart ADD COLUMN verbraucht INTEGER NOT NULL DEFAULT 0"
+            )
+            cursor.execute(
+                """
+                UPDATE markenart SET
+                    gekauft = COALESCE((SELECT SUM(k.stueckzahl) FROM markenkauf k
+                                        LEFT JOIN journal j ON j.lfd_nr = k.journal_lfd_nr
+                                        WHERE k.markenart_id = markenart.id
+                                          AND (j.id IS NULL OR j.storniert_durch IS NULL)), 0),
+                    verbraucht = COALESCE((SELECT SUM(v.stueckzahl) FROM markenverbrauch v
+                                           WHERE v.markenart_id = markenart.id), 0)
+                """
+            )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS markenkauf_bestand
+            AFTER INSERT ON markenkauf
+            FOR EACH ROW
+            WHEN NOT EXISTS (SELECT 1 FROM journal j WHERE j.lfd_nr = NEW.journal_lfd_nr
+                             AND j.storniert_durch IS NOT NULL)
+            BEGIN
+                UPDATE markenart SET gekauft = gekauft + NEW.stueckzahl
+                WHERE id = NEW.markenart_id;
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS markenverbrauch_bestand_zu
+            AFTER INSERT ON markenverbrauch
+            FOR EACH ROW
+            BEGIN
+                UPDATE markenart SET verbraucht = verbraucht + NEW.stueckzahl
+                WHERE id = NEW.markenart_id;
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS markenverbrauch_bestand_weg
+            AFTER DELETE ON markenverbrauch
+            FOR EACH ROW
+            BEGIN
+                UPDATE markenart SET verbraucht = verbraucht - OLD.stueckzahl
+                WHERE id = OLD.markenart_id;
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS journal_storno_markenkauf
+            AFTER UPDATE OF storniert_durch ON journal
+            FOR EACH ROW
+            WHEN OLD.storniert_durch IS NULL AND NEW.storniert_durch IS NOT NULL
+            BEGIN
+                UPDATE markenart SET gekauft = gekauft - (
+                    SELECT SUM(k.stueckzahl) FROM markenkauf k
+                    WHERE k.journal_lfd_nr = NEW.lfd_nr AND k.markenart_id = markenart.id)
+                WHERE id IN (SELECT markenart_id FROM markenkauf
+                             WHERE journal_lfd_nr = NEW.lfd_nr);
+            END
+            """
+        )
+
         # Loeschen ist grundsaetzlich verboten.
         cursor.execute(
             """
@@ -505,6 +807,142 @@ def initialize_database() -> None:
             """
         )
 
+        # Monatssummen des Journals (Monat x Art x Kategorie). Weil das Journal
+        # nur waechst, fuehren Trigger sie beim Anhaengen und beim einmaligen
+        # Nachtragen von storniert_durch / zahlungseingang_am mit; Auswertungen
+        # ueber mehrere Jahre lesen dann Monate statt Buchungen. Gezaehlt wird
+        # je aktiver Buchung zweimal: nach EUER-Stichtag (summe_cent/anzahl,
+        # Monat '' = noch nicht zugeflossen) und nach Buchungsdatum
+        # (gebucht_cent/gebucht_anzahl, fuer die Versand-Marge).
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_monatssumme (
+                monat TEXT NOT NULL,
+                art TEXT NOT NULL,
+                kategorie TEXT NOT NULL,
+                summe_cent INTEGER NOT NULL DEFAULT 0,
+                anzahl INTEGER NOT NULL DEFAULT 0,
+                gebucht_cent INTEGER NOT NULL DEFAULT 0,
+                gebucht_anzahl INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (monat, art, kategorie)
+            ) WITHOUT ROWID
+            """
+        )
+        for name, ereignis, zeile, vorzeichen in (
+            ("journal_monatssumme_neu", "INSERT", "NEW", ""),
+            ("journal_monatssumme_alt", "UPDATE OF storniert_durch, zahlungseingang_am",
+             "OLD", "-"),
+            ("journal_monatssumme_nachtrag", "UPDATE OF storniert_durch, zahlungseingang_am",
+             "NEW", ""),
+        ):
+            stichtag_monat = (
+                f"substr(coalesce(substr(CASE WHEN {zeile}.art = 'einnahme' "
+                f"THEN {zeile}.zahlungseingang_am ELSE {zeile}.buchungsdatum END, 1, 10), ''), "
+                f"1, 7)"
+            )
+            buchungs_monat = f"substr({zeile}.buchungsdatum, 1, 7)"
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} "
+                f"AFTER {ereignis} ON journal FOR EACH ROW "
+                f"WHEN {zeile}.art <> 'storno' AND {zeile}.storniert_durch IS NULL "
+                f"BEGIN "
+                + _monatssumme_upsert(stichtag_monat, zeile, vorzeichen, "summe_cent", "anzahl")
+                + _monatssumme_upsert(buchungs_monat, zeile, vorzeichen,
+                                      "gebucht_cent", "gebucht_anzahl")
+                + " END"
+            )
+        # Bestehende Journale einmalig nachrechnen.
+        if (cursor.execute("SELECT COUNT(*) FROM journal_monatssumme").fetchone()[0] == 0
+                and cursor.execute("SELECT COUNT(*) FROM journal").fetchone()[0]):
+            cursor.execute(
+                """
+                INSERT INTO journal_monatssumme
+                    (monat, art, kategorie, summe_cent, anzahl, gebucht_cent, gebucht_anzahl)
+                SELECT monat, art, kategorie, SUM(s), SUM(n), SUM(g), SUM(gn) FROM (
+                    SELECT substr(coalesce(substr(CASE WHEN art = 'einnahme'
+                               THEN zahlungseingang_am ELSE buchungsdatum END, 1, 10), ''),
+                               1, 7) AS monat,
+                           art, kategorie, betrag_cent AS s, 1 AS n, 0 AS g, 0 AS gn
+                    FROM journal WHERE art <> 'storno' AND storniert_durch IS NULL
+                    UNION ALL
+                    SELECT substr(buchungsdatum, 1, 7), art, kategorie, 0, 0, betrag_cent, 1
+                    FROM journal WHERE art <> 'storno' AND storniert_durch IS NULL
+                )
+                GROUP BY monat, art, kategorie
+                """
+            )
+
+        # Jahresabschluss (Festschreibung): eingefrorene, signierte Werte
+        # eines abgelaufenen Geschaeftsjahres als JSON (``inhalt``), erzeugt von
+        # bookkeeping.close_year. Abschluesse werden weder geaendert noch
+        # geloescht; Auswertungen abgeschlossener Jahre lesen nur noch sie.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jahresabschluss (
+                jahr TEXT PRIMARY KEY,
+                abgeschlossen_am TEXT NOT NULL,
+                inhalt TEXT NOT NULL,
+                verfahren TEXT NOT NULL,
+                signatur TEXT NOT NULL
+            )
+            """
+        )
+        for name, ereignis in (("jahresabschluss_no_update", "UPDATE"),
+                               ("jahresabschluss_no_delete", "DELETE")):
+            cursor.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS {name}
+                BEFORE {ereignis} ON jahresabschluss
+                BEGIN
+                    SELECT RAISE(ABORT, 'Jahresabschluesse sind unveraenderlich');
+                END
+                """
+            )
+        # Was ein abgeschlossenes Jahr betrifft, ist festgeschrieben: keine
+        # neuen Buchungen mit Datum darin, kein Storno seiner Buchungen und
+        # kein Zufluss, der hineinfaellt. Korrekturen gehen ins laufende Jahr.
+        festgeschrieben = "EXISTS (SELECT 1 FROM jahresabschluss WHERE jahr IN ({}))"
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS journal_festgeschrieben_neu
+            BEFORE INSERT ON journal
+            FOR EACH ROW
+            WHEN {festgeschrieben.format(
+                "substr(NEW.buchungsdatum, 1, 4), substr(NEW.zahlungseingang_am, 1, 4)")}
+            BEGIN
+                SELECT RAISE(ABORT, 'Geschaeftsjahr ist abgeschlossen (festgeschrieben)');
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS journal_festgeschrieben_nachtrag
+            BEFORE UPDATE OF storniert_durch, zahlungseingang_am ON journal
+            FOR EACH ROW
+            WHEN (NEW.storniert_durch IS NOT OLD.storniert_durch
+                  AND {festgeschrieben.format(
+                      "substr(OLD.buchungsdatum, 1, 4), substr(OLD.zahlungseingang_am, 1, 4)")})
+              OR (NEW.zahlungseingang_am IS NOT OLD.zahlungseingang_am
+                  AND {festgeschrieben.format("substr(NEW.zahlungseingang_am, 1, 4)")})
+            BEGIN
+                SELECT RAISE(ABORT, 'Geschaeftsjahr ist abgeschlossen (festgeschrieben)');
+            END
+            """
+        )
+
+
+def _monatssumme_upsert(monat: str, zeile: str, vorzeichen: str,
+                        cent_spalte: str, anzahl_spalte: str) -> str:
+    """Trigger statement adding (or with ``-`` removing) one booking."""
+    return (
+        f"INSERT INTO journal_monatssumme (monat, art, kategorie, {cent_spalte}, {anzahl_spalte}) "
+        f"VALUES ({monat}, {zeile}.art, {zeile}.kategorie, "
+        f"{vorzeichen}{zeile}.betrag_cent, {vorzeichen}1) "
+        f"ON CONFLICT (monat, art, kategorie) DO UPDATE SET "
+        f"{cent_spalte} = {cent_spalte} + excluded.{cent_spalte}, "
+        f"{anzahl_spalte} = {anzahl_spalte} + excluded.{anzahl_spalte};"
+    )
+
 
 if __name__ == "__main__":
     initialize_database()
@@ -9,6 +9,7 @@ import sys
 import types
 import hashlib
 import sqlite3
+from datetime import date
 from pathlib import Path
 
 import pytest
@@ -129,6 +130,49 @@ def test_lfd_nr_is_gapless(tmp_path):
     assert nrs == list(range(1, len(nrs) + 1))
 
 
+def test_journal_pages_by_lfd_nr_with_storno_reference(tmp_path):
+    db = _db(tmp_path)
+    for i in range(7):
+        bookkeeping.add_booking(f"2026-03-0{i + 1}", "ausgabe",
+                                "Bürobedarf" if i % 2 else "Verpackungsmaterial", 100 + i, f"#{i}")
+    sid = bookkeeping.storno_booking(1)
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        erste = bookkeeping.list_bookings(limit=3)
+    finally:
+        bookkeeping._connect = verbinde
+    assert len(abfragen) == 1                       # keine id→lfd_nr-Tabelle mehr
+    assert [b["lfd_nr"] for b in erste] == [8, 7, 6]
+    zweite = bookkeeping.list_bookings(limit=3, vor_nr=erste[-1]["lfd_nr"])
+    assert [b["lfd_nr"] for b in zweite] == [5, 4, 3]
+    alle = {b["lfd_nr"]: b for b in bookkeeping.list_bookings()}
+    assert alle[1]["storniert_durch_nr"] == 8 and alle[2]["storniert_durch_nr"] is None
+    assert sid == alle[8]["id"]
+
+    gefiltert = bookkeeping.list_bookings(von="2026-03-02", bis="2026-03-06", art="ausgabe",
+                                          kategorie="Bürobedarf", vor_nr=6)
+    assert [b["lfd_nr"] for b in gefiltert] == [4, 2]
+
+    from TCGInventory import web
+    client = _client(db)
+    web.JOURNAL_JE_SEITE = 5
+    try:
+        body = client.get("/buchhaltung?ansicht=journal").get_data(as_text=True)
+        assert "vor=4" in body and "Ältere Buchungen" in body
+        body = client.get("/buchhaltung?ansicht=journal&vor=4").get_data(as_text=True)
+        assert "#2" in body and "#4" not in body and "Neueste" in body
+    finally:
+        web.JOURNAL_JE_SEITE = 100
+
+
 # =========================================================================
 # Bestellungen
 # =========================================================================
@@ -175,6 +219,54 @@ def test_unique_index_blocks_duplicate_at_db_level(tmp_path):
                                 "Dublette", bestellung_id=7)
 
 
+def test_batch_takeover_books_in_one_transaction_with_consecutive_numbers(tmp_path):
+    db = _db(tmp_path)
+    for oid in (7, 8, 9):
+        _order(db, oid=oid, number=str(1000 + oid))
+    _order(db, oid=10, number="1010", versandt="2026-05-01")        # vor Geschäftsbeginn
+    _order(db, oid=11, number="1011", versand=None)
+    bookkeeping.book_order(8)
+    bookkeeping.add_booking("2026-06-06", "ausgabe", "Bürobedarf", 100, "dazwischen")
+
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        ergebnisse = bookkeeping.book_orders([9, 8, 7, 404, 9, 11])
+    finally:
+        bookkeeping._connect = verbinde
+    assert sum(q.startswith("BEGIN") for q in abfragen) == 1
+    assert [(e["order_id"], e["ok"]) for e in ergebnisse] == \
+        [(9, True), (8, False), (7, True), (404, False), (11, True)]
+    assert ergebnisse[1]["fehler"] == "Diese Bestellung wurde bereits übernommen"
+    assert ergebnisse[3]["fehler"] == "Bestellung nicht gefunden"
+    assert ergebnisse[4]["hinweise"]                                 # Versand fehlt
+
+    with sqlite3.connect(db) as c:
+        nrs = [r[0] for r in c.execute("SELECT lfd_nr FROM journal ORDER BY lfd_nr")]
+        neun = [r[0] for r in c.execute(
+            "SELECT id FROM journal WHERE bestellung_id = 9 ORDER BY lfd_nr")]
+        pruefen = c.execute("SELECT buchung_pruefen FROM orders WHERE id = 11").fetchone()[0]
+    assert nrs == list(range(1, 14))                                # lückenlos
+    assert ergebnisse[0]["buchung_ids"] == neun
+    assert "Versandkosten fehlen" in pruefen
+    assert bookkeeping.verify_monatssumme() == []
+
+    # "Alle": nur was bookable_orders anbietet (10 liegt vor Geschäftsbeginn).
+    assert bookkeeping.book_orders() == []
+    _order(db, oid=12, number="1012")
+    client = _client(db)
+    resp = client.post("/buchhaltung/uebernehmen", data={"alle": "1"}, follow_redirects=True)
+    assert "1 Bestellung(en) übernommen" in resp.get_data(as_text=True)
+    assert bookkeeping.order_already_booked(12) and not bookkeeping.order_already_booked(10)
+
+
 def test_orders_before_business_start_are_hidden(tmp_path):
     """Bestellungen von vor dem Geschäftsbeginn werden nicht zur Übernahme
     angeboten — vor der Gründung gehören sie nicht in die EÜR."""
@@ -312,6 +404,65 @@ def test_storno_of_stamp_purchase_removes_stock(tmp_path):
     assert bookkeeping.get_markenart(art)["bestand"] == 0
 
 
+def test_stock_counters_follow_purchase_consumption_and_storno(tmp_path):
+    db = _db(tmp_path)
+    _order(db)
+    art = _markenart(95)
+    kauf = bookkeeping.buy_stamps("2026-03-02", art, 10, 950)
+    v1 = bookkeeping.consume_stamps(art, 2, bestellung_id=7)
+    bookkeeping.consume_stamps(art, 1, bestellung_id=7)
+    bookkeeping.buy_and_consume("2026-03-03", art, 1, 95, bestellung_id=7)
+    assert bookkeeping.remove_consumption(v1)
+    m = bookkeeping.get_markenart(art)
+    assert (m["gekauft"], m["verbraucht"], m["bestand"]) == (11, 2, 9)
+
+    assert bookkeeping.remove_consumptions_for_order(7) == 2
+    bookkeeping.storno_booking(kauf)
+    m = bookkeeping.get_markenart(art)
+    assert (m["gekauft"], m["verbraucht"], m["bestand"]) == (1, 0, 1)
+    assert bookkeeping.verify_markenbestand() == []
+
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        bookkeeping.get_markenart(art)
+    finally:
+        bookkeeping._connect = verbinde
+    assert len(abfragen) == 1 and "markenkauf" not in abfragen[0]
+
+
+def test_stock_checker_finds_and_repairs_drift(tmp_path):
+    db = _db(tmp_path)
+    art = _markenart(95)
+    bookkeeping.buy_stamps("2026-03-02", art, 10, 950)
+    with sqlite3.connect(db) as c:
+        c.execute("UPDATE markenart SET gekauft = 3, verbraucht = 1 WHERE id = ?", (art,))
+    (abweichung,) = bookkeeping.verify_markenbestand(repair=True)
+    assert abweichung["soll"] == {"gekauft": 10, "verbraucht": 0}
+    assert abweichung["ist"] == {"gekauft": 3, "verbraucht": 1}
+    assert bookkeeping.verify_markenbestand() == []
+    assert bookkeeping.get_markenart(art)["bestand"] == 10
+
+    # Datenbank aus der Vorversion ohne Zähler: beim Update nachgerechnet.
+    bookkeeping.consume_stamps(art, 4)
+    with sqlite3.connect(db) as c:
+        for trigger in ("markenkauf_bestand", "markenverbrauch_bestand_zu",
+                        "markenverbrauch_bestand_weg", "journal_storno_markenkauf"):
+            c.execute(f"DROP TRIGGER {trigger}")
+        c.execute("ALTER TABLE markenart DROP COLUMN gekauft")
+        c.execute("ALTER TABLE markenart DROP COLUMN verbraucht")
+    setup_db.initialize_database()
+    assert bookkeeping.get_markenart(art)["bestand"] == 6
+    assert bookkeeping.verify_markenbestand() == []
+
+
 def test_inventory_correction_sets_stock_without_booking(tmp_path):
     _db(tmp_path)
     art = _markenart(180)
@@ -350,6 +501,95 @@ def test_order_belongs_to_only_one_auszahlung(tmp_path):
     assert bookkeeping.order_auszahlung_id(7) == a1
 
 
+def test_payout_list_is_one_grouped_query_over_the_index(tmp_path):
+    db = _db(tmp_path)
+    for oid in (7, 8, 9):
+        _order(db, oid=oid, number=str(1000 + oid))
+    bookkeeping.book_orders([7, 8, 9])
+    a1 = bookkeeping.create_auszahlung("2026-06-10", 1050)
+    bookkeeping.create_auszahlung("2026-06-20", 999)
+    bookkeeping.assign_orders_to_auszahlung(a1, [7, 8])
+
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        liste = bookkeeping.list_auszahlungen()
+        offen = bookkeeping.open_payment_orders()
+    finally:
+        bookkeeping._connect = verbinde
+    assert len(abfragen) == 2
+    assert [(a["zugeordnet_cent"], a["bestellungen"], a["differenz_cent"]) for a in liste] \
+        == [(0, 0, -999), (1050, 2, 0)]
+    assert [(o["id"], o["netto_cent"]) for o in offen] == [(9, 525)]
+    with sqlite3.connect(db) as c:
+        for sql in abfragen:
+            plan = " ".join(r[3] for r in c.execute("EXPLAIN QUERY PLAN " + sql,
+                                                    () if "?" not in sql else ("",)))
+            assert "idx_journal_auszahlung" in plan, plan
+
+
+def test_payout_suggestion_finds_the_subset_and_prefers_older_orders():
+    orders = [{"id": i, "netto_cent": c} for i, c in
+              enumerate([525, 310, 215, 990, 525, 1200], start=1)]
+    v = bookkeeping.suggest_payout_orders(1050, orders=orders)
+    assert v["gefunden"] and v["summe_cent"] == 1050
+    assert v["order_ids"] == [1, 2, 3]        # die älteren, nicht 1+5
+    assert bookkeeping.suggest_payout_orders(740, orders=orders)["order_ids"] == [1, 3]
+
+    ungenau = bookkeeping.suggest_payout_orders(1052, orders=orders)
+    assert not ungenau["gefunden"]
+    mit_toleranz = bookkeeping.suggest_payout_orders(1052, toleranz_cent=2, orders=orders)
+    assert mit_toleranz["gefunden"] and mit_toleranz["differenz_cent"] == -2
+
+    # Ohne Zeit: greedy nach Alter, als unvollständig gekennzeichnet.
+    eilig = bookkeeping.suggest_payout_orders(1050, orders=orders, zeitlimit=-1)
+    assert eilig["vollstaendig"] is False and eilig["summe_cent"] <= 1050
+
+
+def test_payout_suggestion_falls_back_to_greedy_beyond_the_bit_budget(monkeypatch):
+    orders = [{"id": i, "netto_cent": c} for i, c in
+              enumerate([525, 310, 215, 990, 525, 1200], start=1)]
+    # 5 Kandidaten (1200 liegt über der Grenze) × 1051 Bits passen nicht.
+    monkeypatch.setattr(bookkeeping, "VORSCHLAG_BITS", 5 * 1051 - 1)
+    v = bookkeeping.suggest_payout_orders(1050, orders=orders)
+    assert v["vollstaendig"] is False
+    assert v["order_ids"] == [1, 2, 3] and v["gefunden"]   # greedy trifft hier zufällig
+
+    monkeypatch.setattr(bookkeeping, "VORSCHLAG_BITS", 5 * 1051)
+    assert bookkeeping.suggest_payout_orders(1050, orders=orders)["vollstaendig"]
+
+
+def test_payout_suggestion_stays_fast_for_hundreds_of_orders():
+    import random
+    import time
+    zufall = random.Random(4)
+    orders = [{"id": i, "netto_cent": zufall.randint(80, 6000)} for i in range(400)]
+    ziel = sum(o["netto_cent"] for o in zufall.sample(orders, 60))
+    beginn = time.perf_counter()
+    v = bookkeeping.suggest_payout_orders(ziel, orders=orders)
+    assert time.perf_counter() - beginn < 2
+    assert v["gefunden"] and v["vollstaendig"]
+    assert sum(o["netto_cent"] for o in orders if o["id"] in v["order_ids"]) == ziel
+
+
+def test_payments_page_preselects_the_suggestion(tmp_path):
+    db = _db(tmp_path)
+    for oid in (7, 8, 9):
+        _order(db, oid=oid, number=str(1000 + oid), gesamt=5.45 + oid - 7)
+    bookkeeping.book_orders([7, 8, 9])
+    az = bookkeeping.create_auszahlung("2026-06-30", 525 + 725)
+    body = _client(db).get(f"/buchhaltung/auszahlungen?vorschlag={az}").get_data(as_text=True)
+    assert "2 Bestellung(en) über 12,50" in body
+    assert body.count("checked") == 2 and 'value="7"\n                       checked' in body
+
+
 def test_summary_uses_inflow_and_lists_pending(tmp_path):
     db = _db(tmp_path)
     _order(db)
@@ -421,6 +661,267 @@ def test_no_rounding_errors_in_cent_arithmetic(tmp_path):
     assert bookkeeping.to_cent("1.234,56") == 123456
 
 
+def _summary_referenz(db, start, end):
+    """Die frühere Python-Auswertung über das ganze Journal, als Maßstab."""
+    with sqlite3.connect(db) as c:
+        c.row_factory = sqlite3.Row
+        rows = c.execute("SELECT * FROM journal").fetchall()
+    ein, aus, offen, offen_n = {}, {}, 0, 0
+    for r in rows:
+        if r["art"] == "storno" or r["storniert_durch"] is not None:
+            continue
+        eff = r["zahlungseingang_am"] if r["art"] == "einnahme" else r["buchungsdatum"]
+        if not eff:
+            offen_n += 1
+            offen += r["betrag_cent"]
+            continue
+        if start <= eff[:10] <= end:
+            bucket = ein if r["art"] == "einnahme" else aus
+            bucket[r["kategorie"]] = bucket.get(r["kategorie"], 0) + r["betrag_cent"]
+    return {"einnahmen": dict(sorted(ein.items())), "ausgaben": dict(sorted(aus.items())),
+            "summe_einnahmen": sum(ein.values()), "summe_ausgaben": sum(aus.values()),
+            "ueberschuss": sum(ein.values()) - sum(aus.values()),
+            "offen_einnahme": offen, "offen_count": offen_n, "festgeschrieben": []}
+
+
+def test_sql_summary_matches_the_python_reference(tmp_path):
+    db = _db(tmp_path)
+    for oid, tag in ((7, "2026-01-30"), (8, "2026-06-05"), (9, "2026-12-31"), (10, "2027-01-02")):
+        _order(db, oid=oid, number=str(1000 + oid), versandt=tag, datum=tag + "T10:00:00")
+        bookkeeping.book_order(oid)
+    az = bookkeeping.create_auszahlung("2026-06-30T18:00:00", 1050)
+    bookkeeping.assign_orders_to_auszahlung(az, [7, 8])
+    az2 = bookkeeping.create_auszahlung("2027-01-05", 525)
+    bookkeeping.assign_orders_to_auszahlung(az2, [10])
+    bookkeeping.buy_stamps("2026-03-02", _markenart(95), 10, 950)
+    bookkeeping.add_booking("2025-12-31", "ausgabe", "Bürobedarf", 199, "Vorjahr")
+    bookkeeping.add_booking("2026-01-01", "ausgabe", "Bürobedarf", 0, "Nullbetrag")
+    bookkeeping.add_booking("2026-12-31", "einnahme", "Sonstige Einnahmen", 1234, "bar")
+    storniert = bookkeeping.add_booking("2026-05-05", "ausgabe", "Bürobedarf", 500, "Fehler")
+    bookkeeping.storno_booking(storniert, "doppelt")
+
+    for start, end in (("2026-01-01", "2026-12-31"), ("2026-06-01", "2026-06-30"),
+                       ("2026-12-31", "2026-12-31"), ("2027-01-01", "2027-12-31"),
+                       ("2020-01-01", "2030-12-31"), ("2031-01-01", "2031-12-31"),
+                       ("2026-01-15", "2026-07-10"), ("2026-02-01", "2026-02-28")):
+        assert bookkeeping.summary(start, end) == _summary_referenz(db, start, end), (start, end)
+        with sqlite3.connect(db) as c:
+            versand = c.execute(
+                "SELECT COALESCE(SUM(betrag_cent), 0), COUNT(*) FROM journal "
+                "WHERE kategorie = 'Vereinnahmte Versandkosten' AND art = 'einnahme' "
+                "AND storniert_durch IS NULL AND buchungsdatum BETWEEN ? AND ?",
+                (start, end)).fetchone()
+        assert bookkeeping.versand_marge(start, end)["vereinnahmt_cent"] == versand[0]
+
+
+def test_summary_reads_months_and_only_the_partial_edges(tmp_path):
+    db = _db(tmp_path)
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        bookkeeping.summary("2024-01-15", "2026-12-31")
+    finally:
+        bookkeeping._connect = verbinde
+    (sql,) = [q for q in abfragen if "GROUP BY art, kategorie" in q]
+    with sqlite3.connect(db) as c:
+        plan = " ".join(r[3] for r in c.execute("EXPLAIN QUERY PLAN " + sql))
+    assert "journal_monatssumme" in plan
+    assert plan.count("idx_journal_stichtag") == 1, plan     # nur der Januar-Rest
+    assert "SCAN journal" not in plan
+
+
+def test_monthly_rollup_follows_bookings_storno_and_inflow(tmp_path):
+    db = _db(tmp_path)
+    _order(db)
+    bookkeeping.book_order(7)
+    bookkeeping.add_booking("2025-11-03", "ausgabe", "Bürobedarf", 300, "Ordner")
+    az = bookkeeping.create_auszahlung("2026-07-01", 525)
+    bookkeeping.assign_orders_to_auszahlung(az, [7])
+    bid = bookkeeping.add_booking("2026-02-02", "ausgabe", "Bürobedarf", 999, "falsch")
+    bookkeeping.storno_booking(bid)
+
+    with sqlite3.connect(db) as c:
+        zeilen = {(m, k): (s, n) for m, k, s, n in c.execute(
+            "SELECT monat, kategorie, summe_cent, anzahl FROM journal_monatssumme")}
+    assert zeilen[("2026-07", "Warenverkauf")] == (390, 1)
+    assert zeilen[("", "Warenverkauf")] == (0, 0)                # Zufluss nachgetragen
+    assert zeilen[("2026-02", "Bürobedarf")] == (0, 0)           # storniert
+    assert bookkeeping.verify_monatssumme() == []
+    assert [(j["jahr"], j["einnahmen"], j["ausgaben"]) for j in bookkeeping.jahresuebersicht()] \
+        == [("2026", 545, 20), ("2025", 0, 300)]
+    m = bookkeeping.versand_marge("2026-06-01", "2026-06-30")
+    assert m["vereinnahmt_cent"] == 155 and m["sendungen"] == 1
+    body = _client(db).get("/buchhaltung/auswertung?jahr=2026").get_data(as_text=True)
+    assert "Jahre im Überblick" in body and "jahr=2025" in body
+
+
+def test_rollup_checker_finds_and_repairs_drift(tmp_path):
+    db = _db(tmp_path)
+    bookkeeping.add_booking("2026-03-01", "ausgabe", "Bürobedarf", 100, "Stifte")
+    with sqlite3.connect(db) as c:
+        c.execute("UPDATE journal_monatssumme SET summe_cent = 1 WHERE monat = '2026-03'")
+        c.execute("INSERT INTO journal_monatssumme (monat, art, kategorie, summe_cent, anzahl) "
+                  "VALUES ('2019-01', 'ausgabe', 'Bürobedarf', 5, 1)")
+    abweichungen = bookkeeping.verify_monatssumme(repair=True)
+    assert {a["monat"] for a in abweichungen} == {"2026-03", "2019-01"}
+    assert abweichungen[1]["soll"]["summe_cent"] == 100
+    assert bookkeeping.verify_monatssumme() == []
+    assert bookkeeping.summary("2019-01-01", "2026-12-31")["summe_ausgaben"] == 100
+
+
+def test_rollup_is_backfilled_for_existing_journals(tmp_path):
+    db = _db(tmp_path)
+    bookkeeping.add_booking("2026-03-01", "ausgabe", "Bürobedarf", 100, "Stifte")
+    with sqlite3.connect(db) as c:
+        c.execute("DROP TABLE journal_monatssumme")
+    setup_db.initialize_database()
+    assert bookkeeping.verify_monatssumme() == []
+    assert bookkeeping.summary("2026-01-01", "2026-12-31")["summe_ausgaben"] == 100
+
+
+def _geschaeftsjahr(jahr):
+    """Ein kleines Geschäftsjahr: Zufluss, offene Einnahme, Ausgabe, Marken."""
+    bezahlt = bookkeeping.add_booking(f"{jahr}-03-01", "einnahme", "Sonstige Einnahmen", 1000,
+                                      "bar", zahlungseingang_am=f"{jahr}-03-01")
+    offen = bookkeeping.add_booking(f"{jahr}-12-20", "einnahme", "Warenverkauf", 450, "offen")
+    bookkeeping.add_booking(f"{jahr}-05-05", "ausgabe", "Bürobedarf", 300, "Ordner")
+    kauf = bookkeeping.buy_stamps(f"{jahr}-02-01", _markenart(95), 10, 950)
+    bookkeeping.consume_stamps(_markenart(95), 3, datum=f"{jahr}-11-11")
+    return bezahlt, offen, kauf
+
+
+def test_year_close_freezes_the_year_and_reports_read_the_snapshot(tmp_path):
+    db = _db(tmp_path)
+    bezahlt, offen, _ = _geschaeftsjahr("2024")
+    bookkeeping.consume_stamps(_markenart(95), 2, datum="2025-01-10")
+    vorher = bookkeeping.summary("2024-01-01", "2024-12-31")
+
+    abschluss = bookkeeping.close_year(2024)
+    assert abschluss["verfahren"] == "sha256" and abschluss["vorgaenger"] == ""
+    assert abschluss["offen_einnahme_cent"] == 450 and abschluss["offen_anzahl"] == 1
+    assert abschluss["lfd_nr"] == {"erste": 1, "letzte": 4, "anzahl": 4}
+    (marke,) = abschluss["marken"]
+    assert (marke["gekauft"], marke["verbraucht"], marke["bestand"]) == (10, 3, 7)
+
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        jahr = bookkeeping.summary("2024-01-01", "2024-12-31")
+    finally:
+        bookkeeping._connect = verbinde
+    assert not [q for q in abfragen if "journal" in q]            # nur der Abschluss
+    assert {k: v for k, v in jahr.items() if k != "festgeschrieben"} \
+        == {k: v for k, v in vorher.items() if k != "festgeschrieben"}
+    assert [a["jahr"] for a in jahr["festgeschrieben"]] == ["2024"]
+
+    # Festgeschrieben: keine Buchung, kein Storno, kein Zufluss mehr im Jahr 2024.
+    with pytest.raises(ValueError, match="2024 ist abgeschlossen"):
+        bookkeeping.add_booking("2024-12-31", "ausgabe", "Bürobedarf", 100, "nachträglich")
+    with pytest.raises(ValueError, match="2024 ist abgeschlossen"):
+        bookkeeping.storno_booking(bezahlt)
+    az = bookkeeping.create_auszahlung("2024-12-30", 450)
+    with pytest.raises(ValueError, match="2024 ist abgeschlossen"):
+        bookkeeping.assign_orders_to_auszahlung(az, [1])
+    with pytest.raises(sqlite3.IntegrityError):
+        with sqlite3.connect(db) as c:
+            c.execute("UPDATE journal SET storniert_durch = 99 WHERE id = ?", (offen,))
+    with pytest.raises(sqlite3.IntegrityError):
+        with sqlite3.connect(db) as c:
+            c.execute("DELETE FROM jahresabschluss")
+    with sqlite3.connect(db) as c:
+        assert c.execute("SELECT COUNT(*) FROM journal").fetchone()[0] == 4
+
+    # Der Zufluss der offenen Einnahme im Folgejahr ist erlaubt und ändert 2024 nicht.
+    with sqlite3.connect(db) as c:
+        c.execute("UPDATE journal SET zahlungseingang_am = '2025-01-15' WHERE id = ?", (offen,))
+    assert bookkeeping.summary("2024-01-01", "2024-12-31") == jahr
+    uebergreifend = bookkeeping.summary("2024-01-01", "2025-12-31")
+    assert uebergreifend["einnahmen"] == {"Sonstige Einnahmen": 1000, "Warenverkauf": 450}
+    assert bookkeeping.verify_jahresabschluss() == []
+
+    with pytest.raises(ValueError, match="bereits abgeschlossen"):
+        bookkeeping.close_year("2024")
+    with pytest.raises(ValueError, match="noch nicht abgelaufen"):
+        bookkeeping.close_year(date.today().year)
+
+
+def test_year_close_is_chained_and_verification_finds_changes(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    _geschaeftsjahr("2023")
+    _geschaeftsjahr("2024")
+    with pytest.raises(ValueError, match="Zuerst 2023"):
+        bookkeeping.close_year("2024")
+    erstes = bookkeeping.close_year("2023")
+    monkeypatch.setattr(bookkeeping, "ABSCHLUSS_SCHLUESSEL", "geheim")
+    zweites = bookkeeping.close_year("2024")
+    assert zweites["verfahren"] == "hmac-sha256"
+    assert zweites["vorgaenger"] == erstes["signatur"]
+    assert [j["festgeschrieben"] for j in bookkeeping.jahresuebersicht()] == [True, True]
+    assert bookkeeping.verify_jahresabschluss() == []
+
+    # Ein nachträglich gelöschter Verbrauch fällt beim Nachrechnen auf, ...
+    with sqlite3.connect(db) as c:
+        c.execute("DELETE FROM markenverbrauch WHERE datum = '2024-11-11'")
+    (abweichung,) = bookkeeping.verify_jahresabschluss("2024")
+    assert abweichung["feld"] == "marken"
+    assert abweichung["soll"][0]["verbraucht"] == 3 and abweichung["ist"][0]["verbraucht"] == 6
+
+    # ... ein veränderter Abschluss an der Signatur, ohne Schlüssel jeder HMAC-Abschluss.
+    with sqlite3.connect(db) as c:
+        c.execute("DROP TRIGGER jahresabschluss_no_update")
+        c.execute("UPDATE jahresabschluss SET inhalt = replace(inhalt, '1000', '10') "
+                  "WHERE jahr = '2023'")
+    felder = {(a["jahr"], a["feld"]) for a in bookkeeping.verify_jahresabschluss()}
+    assert ("2023", "signatur") in felder and ("2023", "kategorien") in felder
+    monkeypatch.setattr(bookkeeping, "ABSCHLUSS_SCHLUESSEL", "")
+    assert ("2024", "signatur") in {(a["jahr"], a["feld"])
+                                    for a in bookkeeping.verify_jahresabschluss()}
+
+
+def test_year_close_waits_for_pending_orders_and_blocks_late_bookings(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(bookkeeping, "GESCHAEFTSBEGINN", "2024-01-01")
+    _order(db, oid=7, versandt="2024-06-05", datum="2024-06-04T10:00:00")
+    with pytest.raises(ValueError, match="1 versendete Bestellung"):
+        bookkeeping.close_year("2024")
+    bookkeeping.book_order(7)
+    bookkeeping.close_year("2024")
+
+    _order(db, oid=8, number="1002", versandt="2024-12-30", datum="2024-12-30T10:00:00")
+    (ergebnis,) = bookkeeping.book_orders([8])
+    assert not ergebnis["ok"] and "2024 ist abgeschlossen" in ergebnis["fehler"]
+
+
+def test_year_close_route_and_summary_page(tmp_path):
+    db = _db(tmp_path)
+    _geschaeftsjahr("2024")
+    client = _client(db)
+    body = client.get("/buchhaltung/auswertung?jahr=2024").get_data(as_text=True)
+    assert "Abschließen" in body
+    client.post("/buchhaltung/abschluss", data={"jahr": "2024"})
+    body = client.get("/buchhaltung/auswertung?jahr=2024").get_data(as_text=True)
+    assert "Geschäftsjahr 2024 ist abgeschlossen" in body and "Abschließen" not in body
+    csv_text = client.get("/buchhaltung/auswertung.csv?jahr=2024").get_data().decode("utf-8-sig")
+    assert "Geschäftsjahr 2024 festgeschrieben am" in csv_text
+    assert client.post("/buchhaltung/ausgabe", data={
+        "buchungsdatum": "2024-06-01", "betrag": "1,00", "kategorie": "Bürobedarf",
+    }).status_code == 302
+
+
 def test_summary_csv_german_format(tmp_path):
     db = _db(tmp_path)
     _order(db)
@@ -462,6 +963,84 @@ def test_receipt_stored_with_checksum_and_kept_after_storno(tmp_path):
             c.execute("DELETE FROM belege WHERE id = ?", (bid,))
 
 
+def _bild(fmt="PNG", groesse=(1200, 900)):
+    import io
+    from PIL import Image
+    puffer = io.BytesIO()
+    Image.new("RGB", groesse, (200, 30, 30)).save(puffer, fmt)
+    return puffer.getvalue()
+
+
+class _Strom:
+    """Upload-Strom, der mitschreibt, wie groß die gelesenen Blöcke sind."""
+
+    def __init__(self, data):
+        import io
+        self._io = io.BytesIO(data)
+        self.bloecke = []
+
+    def read(self, n=-1):
+        assert 0 < n <= bookkeeping.BELEG_BLOCK       # nie alles auf einmal
+        block = self._io.read(n)
+        self.bloecke.append(len(block))
+        return block
+
+
+def test_receipt_is_streamed_stored_by_content_and_shared_by_duplicates(tmp_path):
+    _db(tmp_path)
+    data = _bild() + os.urandom(3 * bookkeeping.BELEG_BLOCK)   # PNG mit Anhang
+    strom = _Strom(data)
+    erster = bookkeeping.save_receipt("Scan.png", strom, "image/png")
+    assert len(strom.bloecke) > 3
+    zweiter = bookkeeping.save_receipt("Scan Kopie.png", data, "image/png")
+
+    a, b = bookkeeping.get_receipt(erster), bookkeeping.get_receipt(zweiter)
+    digest = hashlib.sha256(data).hexdigest()
+    assert a["id"] != b["id"] and b["original_name"] == "Scan Kopie.png"
+    assert a["gespeichert_als"] == b["gespeichert_als"] == f"{digest[:2]}/{digest}.png"
+    assert a["groesse"] == b["groesse"] == len(data)
+    assert Path(a["pfad"]).read_bytes() == data
+    dateien = [p for p in bookkeeping.BELEGE_DIR.rglob("*") if p.is_file()]
+    assert sorted(p.parent.name for p in dateien) == [digest[:2], "vorschau"]
+
+    from PIL import Image
+    assert a["vorschau"] == b["vorschau"] == f"vorschau/{digest}.jpg"
+    with Image.open(a["vorschau_pfad"]) as vorschau:
+        assert max(vorschau.size) <= max(bookkeeping.VORSCHAU_GROESSE)
+        assert vorschau.format == "JPEG"
+
+
+def test_pdf_preview_uses_the_embedded_scan(tmp_path):
+    _db(tmp_path)
+    scan = bytes(b"%PDF-1.4\n1 0 obj << /Filter /DCTDecode >> stream\n"
+                 + _bild("JPEG") + b"\nendstream endobj\n%%EOF")
+    mit = bookkeeping.get_receipt(bookkeeping.save_receipt("Scan.pdf", scan))
+    assert mit["vorschau"] and Path(mit["vorschau_pfad"]).exists()
+
+    ohne = bookkeeping.get_receipt(bookkeeping.save_receipt("Text.pdf", b"%PDF-1.4 Text"))
+    assert ohne["vorschau"] is None and ohne["vorschau_pfad"] is None
+    assert Path(ohne["pfad"]).read_bytes() == b"%PDF-1.4 Text"
+
+
+def test_receipt_lists_link_the_preview_not_the_scan(tmp_path):
+    db = _db(tmp_path)
+    bid = bookkeeping.save_receipt("Kartons.jpg", _bild("JPEG"), "image/jpeg")
+    bookkeeping.add_booking("2026-06-01", "ausgabe", "Verpackungsmaterial", 1290,
+                            "Kartons", beleg_id=bid)
+    client = _client(db)
+    journal = client.get("/buchhaltung?ansicht=journal").get_data(as_text=True)
+    assert f"/buchhaltung/beleg/{bid}/vorschau" in journal
+
+    vorschau = client.get(f"/buchhaltung/beleg/{bid}/vorschau")
+    assert vorschau.status_code == 200 and vorschau.mimetype == "image/jpeg"
+    assert len(vorschau.get_data()) < Path(bookkeeping.get_receipt(bid)["pfad"]).stat().st_size
+    voll = client.get(f"/buchhaltung/beleg/{bid}")
+    assert voll.mimetype == "image/jpeg" and "Kartons.jpg" in voll.headers["Content-Disposition"]
+
+    ohne = bookkeeping.save_receipt("Text.pdf", b"%PDF-1.4 Text")
+    assert client.get(f"/buchhaltung/beleg/{ohne}/vorschau").status_code == 404
+
+
 # =========================================================================
 # Abgrenzung
 # =========================================================================
@@ -625,6 +1204,51 @@ def test_immediate_purchase_is_linked_to_the_order(tmp_path):
     assert gruppe["sonstige"] == []                 # nichts landet daneben
 
 
+def test_orders_view_is_grouped_in_sql_per_period_and_page(tmp_path):
+    db = _db(tmp_path)
+    for oid, tag in ((7, "2026-06-05"), (8, "2026-06-20"), (9, "2026-07-02"), (10, "2026-05-01")):
+        _order(db, oid=oid, number=str(1000 + oid), versandt=tag, auszahlung=5.25 if oid != 9 else 9.99)
+        bookkeeping.book_order(oid)
+    bid = bookkeeping.add_booking("2026-06-10", "ausgabe", "Bürobedarf", 100, "Stifte")
+    with sqlite3.connect(db) as c:
+        waren_8 = c.execute("SELECT id FROM journal WHERE bestellung_id = 8 "
+                            "AND kategorie = 'Warenverkauf'").fetchone()[0]
+    bookkeeping.storno_booking(waren_8)
+
+    abfragen = []
+    verbinde = bookkeeping._connect
+
+    def mitschneiden(db_file=None):
+        conn = verbinde(db_file)
+        conn.set_trace_callback(abfragen.append)
+        return conn
+
+    bookkeeping._connect = mitschneiden
+    try:
+        erste = bookkeeping.journal_by_order(von="2026-06-01", bis="2026-07-31", je_seite=2)
+    finally:
+        bookkeeping._connect = verbinde
+    assert [g["order_id"] for g in erste["orders"]] == [9, 8]
+    assert erste["gesamt"] == 3 and erste["seiten"] == 2
+    neun, acht = erste["orders"]
+    assert neun["netto_cent"] == 525 and neun["reconcile_diff_cent"] == 525 - 999
+    assert neun["has_auszahlung"] is True and neun["reconcile_ok"] is False
+    assert acht["warenverkauf_cent"] == 0 and acht["einnahmen_cent"] == 155
+    assert len(acht["bookings"]) == 4                      # inkl. Stornozeile
+    assert [b["id"] for b in erste["sonstige"]] == [bid]
+    # Einzelbuchungen nur für die Bestellungen der Seite.
+    assert any("IN (9, 8)" in q or "IN (8, 9)" in q for q in abfragen)
+    assert not any(q.strip().startswith("SELECT * FROM journal") for q in abfragen)
+
+    zweite = bookkeeping.journal_by_order(von="2026-06-01", bis="2026-07-31", seite=2, je_seite=2)
+    assert [g["order_id"] for g in zweite["orders"]] == [7]
+    assert zweite["orders"][0]["reconcile_ok"] is True
+    assert [g["order_id"] for g in bookkeeping.journal_by_order()["orders"]] == [9, 8, 7, 10]
+
+    body = _client(db).get("/buchhaltung?von=2026-06-01&bis=2026-06-30").get_data(as_text=True)
+    assert "1008" in body and "1007" in body and "1009" not in body
+
+
 def test_stock_never_goes_negative(tmp_path):
     """'Aus Vorrat' ohne Bestand wird abgelehnt, statt den Vorrat ins Minus zu ziehen."""
     db = _db(tmp_path)
@@ -10,6 +10,7 @@ import json
 import os
 import sqlite3
 import sys
+import time
 import types
 
 import pytest
@@ -208,6 +209,115 @@ def test_replacement_is_atomic(tmp_path):
         assert conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0] == 2
 
 
+# =========================================================================
+# Mehrsprachiger Aufbau (all_cards)
+# =========================================================================
+
+def _sprachfassungen(i, sprachen=("en", "de", "fr")):
+    """Eine Ausgabe in mehreren Sprachen, wie sie ``all_cards`` liefert."""
+    return [_karte(i, id=f"{i:08d}-{lang}", lang=lang) for lang in sprachen]
+
+
+def test_multilingual_build_shares_printing_core(tmp_path):
+    db = tmp_path / "cards.db"
+    karten = _sprachfassungen(1) + _sprachfassungen(2, ("en", "ja"))
+    anzahl = bcd.schreibe_datenbank(karten, db, mehrsprachig=True)
+    assert anzahl == 5
+
+    with sqlite3.connect(str(db)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM drucke").fetchone()[0] == 2
+        assert conn.execute("SELECT COUNT(*) FROM sprachen").fetchone()[0] == 5
+        # Die Sicht liefert die bekannten Spalten – alle Abfragen bleiben gleich.
+        zeile = conn.execute(
+            "SELECT name, set_name, cardmarket_id FROM cards WHERE id='00000001-de'"
+        ).fetchone()
+        namen = {r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")}
+    assert zeile == ("Karte 1", "Testset", "1001")
+    assert {"idx_druck_identity", "idx_sprache"} <= namen
+
+
+def test_multilingual_build_keeps_cardmarket_id_of_other_languages(tmp_path):
+    """Fehlt einer Sprachfassung die Cardmarket-ID, gilt die der Ausgabe."""
+    db = tmp_path / "cards.db"
+    karten = [_karte(1, id="a-en", lang="en"),
+              _karte(1, id="a-de", lang="de", cardmarket_id=None)]
+    bcd.schreibe_datenbank(karten, db, mehrsprachig=True)
+    with sqlite3.connect(str(db)) as conn:
+        assert conn.execute(
+            "SELECT cardmarket_id FROM cards WHERE id='a-de'").fetchone()[0] == "1001"
+
+
+def test_multilingual_build_skips_digital_and_replaces_atomically(tmp_path):
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([_karte(1)], db)
+    karten = _sprachfassungen(1) + [_karte(2, id="arena", digital=True)]
+    assert bcd.schreibe_datenbank(karten, db, mehrsprachig=True) == 3
+    with sqlite3.connect(str(db)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM drucke").fetchone()[0] == 1
+    assert not (tmp_path / "cards.db.neu").exists()
+
+
+def test_find_by_identity_returns_exact_language_from_all_cards(tmp_path):
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank(_sprachfassungen(7), db, mehrsprachig=True)
+    cs.reset_card_database()
+    cs.DEFAULT_DB_PATH = db
+
+    treffer = cs.find_by_identity("TST", "7", "fr")
+    assert treffer["scryfall_id"] == "00000007-fr"
+    assert treffer["language"] == "fr"
+    assert treffer["cardmarket_id"] == "1007"
+    # Unbekannte Sprache: wie bisher die englische Fassung.
+    assert cs.find_by_identity("tst", "7", "ko")["scryfall_id"] == "00000007-en"
+
+
+def test_identity_lookup_uses_index(tmp_path):
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank(_sprachfassungen(1), db, mehrsprachig=True)
+    with sqlite3.connect(str(db)) as conn:
+        plan = " ".join(r[-1] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM cards "
+            "WHERE set_code=? AND collector_number=?", ("tst", "1")))
+    assert "idx_druck_identity" in plan
+    assert "idx_sprache" in plan
+
+
+def test_messe_aufbau_reports_size_and_time(tmp_path):
+    karten = [k for i in range(20) for k in _sprachfassungen(i)]
+    werte = bcd.messe_aufbau(karten, tmp_path / "cards.db", mehrsprachig=True)
+    assert werte["anzahl"] == 60
+    assert werte["drucke"] == 20
+    assert werte["groesse_mb"] >= 0
+    assert werte["bytes_je_karte"] > 0
+    assert {"sekunden", "karten_je_sekunde", "spitzen_rss_mb"} <= set(werte)
+
+
+def test_stored_state_is_tied_to_bulk_type(tmp_path):
+    """Ein Wechsel default_cards -> all_cards darf nicht als „aktuell“ gelten."""
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([_karte(1)], db, stand="2026-01-01")
+    assert bcd._gespeicherter_stand(db) == "2026-01-01"
+    assert bcd._gespeicherter_stand(db, bcd.BULK_TYP_ALLE) is None
+
+
+def test_state_is_written_before_the_swap(tmp_path):
+    """Nach dem Tausch wird die (immutable gelesene) Datei nicht mehr verändert."""
+    db = tmp_path / "cards.db"
+    getauscht = []
+
+    def vor_tausch():
+        neu = db.with_name(db.name + ".neu")
+        with sqlite3.connect(neu) as conn:
+            getauscht.append(conn.execute("SELECT wert FROM meta "
+                                          "WHERE schluessel = 'updated_at'").fetchone())
+
+    bcd.schreibe_datenbank(_sprachfassungen(1), db, vor_tausch=vor_tausch,
+                           mehrsprachig=True, stand="2026-02-02")
+    assert getauscht == [("2026-02-02",)]
+    assert bcd._gespeicherter_stand(db, bcd.BULK_TYP_ALLE) == "2026-02-02"
+
+
 # =========================================================================
 # Bildadresse aus der ID
 # =========================================================================
@@ -238,10 +348,10 @@ def test_reset_closes_cached_connection(tmp_path):
     cs.reset_card_database()
     cs.DEFAULT_DB_PATH = db
     cs.fetch_card_info_by_name("Karte 1")
-    assert cs._DB_CONN is not None
+    assert cs._DB_POOL is not None
 
     cs.reset_card_database()
-    assert cs._DB_CONN is None                 # nach dem Tausch neu oeffnen
+    assert cs._DB_POOL is None                 # nach dem Tausch neu oeffnen
 
 
 def test_swapped_database_is_seen_after_reset(tmp_path):
@@ -258,6 +368,169 @@ def test_swapped_database_is_seen_after_reset(tmp_path):
     assert cs.fetch_card_info_by_name("Karte 1") is None
 
 
+# =========================================================================
+# Schreibgeschuetzte Leseverbindungen
+# =========================================================================
+
+def test_connections_are_read_only_and_memory_mapped(tmp_path):
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([_karte(1)], db)
+    pool = cs._LesePool(db, groesse=2, mmap_mb=64, cache_kb=1024)
+    with pool.verbindung() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM cards")
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 64 * 1024 * 1024
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -1024
+    pool.schliessen()
+
+
+def test_pool_reuses_connections_and_stays_bounded(tmp_path):
+    import threading
+
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([_karte(i) for i in range(20)], db)
+    pool = cs._LesePool(db, groesse=2)
+    fehler = []
+
+    def lauf():
+        try:
+            for i in range(20):
+                with pool.verbindung() as conn:
+                    conn.execute("SELECT name FROM cards WHERE collector_number=?",
+                                 (str(i),)).fetchone()
+        except Exception as exc:            # noqa: BLE001
+            fehler.append(exc)
+
+    threads = [threading.Thread(target=lauf) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fehler == []
+    assert pool.offen <= 2                     # nie mehr als die Poolgroesse
+    pool.schliessen()
+
+
+def test_connection_borrowed_during_reset_is_closed_on_return(tmp_path):
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([_karte(1)], db)
+    pool = cs._LesePool(db)
+    with pool.verbindung() as conn:
+        pool.schliessen()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_messe_abfragen_reports_latency(tmp_path):
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([_karte(i) for i in range(30)], db)
+    cs.reset_card_database()
+    cs.DEFAULT_DB_PATH = db
+
+    werte = cs.messe_abfragen(anzahl=10, threads=2)
+    assert werte["abfragen"] == 20
+    assert werte["median_us"] > 0
+    assert 1 <= werte["verbindungen"] <= cs.POOL_GROESSE
+
+
+# =========================================================================
+# Arbeitsmenge im Speicher
+# =========================================================================
+
+@pytest.fixture
+def arbeitsmenge(tmp_path, monkeypatch):
+    """Kartendatenbank mit zwei Sets; ein Name ist in beiden gedruckt."""
+    db = tmp_path / "cards.db"
+    bcd.schreibe_datenbank([
+        _karte(1, id="a-en", set="tst"),
+        _karte(1, id="a-de", set="tst", lang="de"),
+        _karte(2, id="b-en", set="tst"),
+        _karte(3, id="c-en", set="alt", name="Karte 1"),     # Nachdruck
+        _karte(4, id="d-en", set="alt"),
+    ], db)
+    monkeypatch.setattr(cs, "_ARBEITSMENGE_SETS", set())
+    monkeypatch.setattr(cs, "_ARBEITSMENGE", None)
+    cs.reset_card_database()
+    cs.DEFAULT_DB_PATH = db
+    yield db
+    cs.reset_card_database()
+
+
+def _ohne_sql(monkeypatch):
+    def kein_sql(*a, **k):
+        raise AssertionError("SQL-Abfrage trotz Arbeitsmenge")
+    monkeypatch.setattr(cs, "_abfrage", kein_sql)
+
+
+def test_working_set_serves_lookups_without_sql(arbeitsmenge, monkeypatch):
+    vorher = (cs.find_by_identity("tst", "1", "de"), cs.fetch_variants("Karte 1"),
+              cs.fetch_card_info_by_name("karte 2"))
+    cs.reset_card_database()
+
+    stat = cs.aktiviere_arbeitsmenge(["TST"])
+    assert stat["sets"] == 1
+    assert stat["zeilen"] == 4                 # tst komplett + Nachdruck aus alt
+    _ohne_sql(monkeypatch)
+
+    assert cs.find_by_identity("tst", "1", "de") == vorher[0]
+    assert cs.fetch_variants("Karte 1") == vorher[1]
+    assert cs.fetch_card_info_by_name("karte 2") == vorher[2]
+    assert cs.find_by_identity("tst", "99", "en") is None   # Set geladen: verbindlich
+
+
+def _warte_auf_sets(anzahl):
+    """Das Nachladen läuft im Hintergrund — kurz auf sein Ergebnis warten."""
+    for _ in range(200):
+        if cs.arbeitsmenge_statistik()["sets"] == anzahl:
+            break
+        time.sleep(0.01)
+    return cs.arbeitsmenge_statistik()
+
+
+def test_working_set_falls_back_and_learns_recent_sets(arbeitsmenge):
+    cs.aktiviere_arbeitsmenge(["tst"])
+    assert cs.find_by_identity("alt", "4", "en")["scryfall_id"] == "d-en"
+    assert _warte_auf_sets(2)["sets"] == 2                # zuletzt benutzt
+
+
+def test_working_set_evicts_least_recently_used_set(arbeitsmenge, monkeypatch):
+    monkeypatch.setattr(cs, "ARBEITSMENGE_MAX", 4)
+    assert cs.aktiviere_arbeitsmenge(["tst"])["zeilen"] == 4
+
+    # alt passt nur hinein, wenn tst geht — und es kommt trotzdem hinein.
+    assert cs.find_by_identity("alt", "4", "en")["scryfall_id"] == "d-en"
+    for _ in range(200):
+        if cs.arbeitsmenge_statistik()["verdraengt"]:
+            break
+        time.sleep(0.01)
+    stat = cs.arbeitsmenge_statistik()
+    assert stat["verdraengt"] == 1 and stat["sets"] == 1 and stat["zeilen"] == 4
+    _ohne_sql(monkeypatch)
+    assert cs.find_by_identity("alt", "4", "en")["scryfall_id"] == "d-en"
+    assert sorted(v["scryfall_id"] for v in cs.fetch_variants("Karte 1")) \
+        == ["a-de", "a-en", "c-en"]                         # Nachdrucke über alt
+    assert "karte 2" not in cs._ARBEITSMENGE.nach_name      # nur in tst gedruckt
+
+
+def test_working_set_is_bounded_and_reported(arbeitsmenge, monkeypatch):
+    monkeypatch.setattr(cs, "ARBEITSMENGE_MAX", 3)
+    stat = cs.aktiviere_arbeitsmenge(["tst", "alt"])
+    assert stat["zeilen"] <= 3
+    assert stat["voll"] is True
+    assert stat["speicher_mb"] >= 0
+    # Was nicht hineinpasst, kommt weiter korrekt aus SQLite.
+    assert cs.find_by_identity("alt", "4", "en")["scryfall_id"] == "d-en"
+
+
+def test_working_set_is_rebuilt_after_swap(arbeitsmenge):
+    cs.aktiviere_arbeitsmenge(["tst"])
+    bcd.schreibe_datenbank([_karte(5, id="e-en", set="tst")], arbeitsmenge,
+                           vor_tausch=cs.reset_card_database)
+    assert cs.find_by_identity("tst", "1", "en") is None
+    assert cs.find_by_identity("tst", "5", "en")["scryfall_id"] == "e-en"
+    assert cs.arbeitsmenge_statistik()["sets"] == 1
+
+
 # =========================================================================
 # Weboberflaeche
 # =========================================================================
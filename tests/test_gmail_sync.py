@@ -0,0 +1,501 @@
+"""Gmail-Abruf der Bestellmails: gebündelt, nur das Nötige, nichts doppelt.
+
+Gmail wird durch ein Ersatzobjekt vertreten, das jede Anfrage zählt. Die
+Tests prüfen weniger das Ergebnis als die Zahl der Rundreisen — darum geht es
+beim ersten Abgleich nach einem Wochenende.
+"""
+
+import base64
+import functools
+import os
+import sqlite3
+import sys
+import types
+from collections import Counter
+
+import pytest
+from googleapiclient.errors import HttpError
+
+sys.modules.setdefault("cv2", types.SimpleNamespace())
+_pyz = types.ModuleType("pyzbar")
+_pyz.pyzbar = types.SimpleNamespace(decode=lambda *a, **k: [])
+sys.modules.setdefault("pyzbar", _pyz)
+sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import TCGInventory                                              # noqa: E402
+from TCGInventory import (gmail_auth, lager_manager,             # noqa: E402
+                          mailarchiv, order_service, setup_db)
+
+
+def _mail(nummer):
+    return f"""Bestellnummer: {nummer}
+Käufer: Kaeufer{nummer}
+Status: Bezahlt
+
+Max Mustermann
+Musterweg 1
+12345 Musterstadt
+Deutschland
+
+1x Force of Negation (Modern Horizons) - R - Englisch - NM 1,06 EUR
+
+Gesamtwert: 1,06 EUR
+Versandkosten: 1,55 EUR
+Gebühren: 0,07 EUR
+Gesamtbetrag: 2,61 EUR
+Auszahlungsbetrag: 2,54 EUR
+"""
+
+
+def _nachricht(msg_id, text, absender="noreply@cardmarket.com",
+               betreff="Bitte versenden"):
+    return {
+        "id": msg_id,
+        "internalDate": "1783000000000",
+        "labelIds": ["INBOX"],
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [{"name": "From", "value": f"Cardmarket <{absender}>"},
+                        {"name": "Subject", "value": betreff}],
+            "body": {"data": base64.urlsafe_b64encode(text.encode()).decode()},
+        },
+    }
+
+
+def _http_fehler(status):
+    return HttpError(types.SimpleNamespace(status=status, reason="Fehler"), b"")
+
+
+class _Aufruf:
+    def __init__(self, funktion):
+        self.funktion = funktion
+
+    def execute(self):
+        return self.funktion()
+
+
+class FalscherGmailDienst:
+    """Ersetzt den Gmail-Dienst und zählt jede Anfrage in ``aufrufe``."""
+
+    def __init__(self, anzahl=0, seite=500):
+        self.nachrichten = {}
+        self.verlauf = []                 # (historyId, msg_id) je neuer Mail
+        self.history_id = 100
+        self.aeltester_verlauf = 0        # darunter gilt der Cursor als abgelaufen
+        for i in range(anzahl):
+            self.neu(f"m{i:04d}")
+        self.seite = seite
+        self.aufrufe = Counter()
+        self.parameter = []
+        self.labels_vorhanden = []
+        self.markiert = []                # (Label-Änderung, IDs) je batchModify
+        self.markieren_stoert = False
+
+    def neu(self, msg_id, **kopf):
+        self.history_id += 1
+        self.verlauf.append((self.history_id, msg_id))
+        self.nachrichten[msg_id] = _nachricht(
+            msg_id, _mail(1000000 + len(self.nachrichten)), **kopf)
+
+    # -- Gmail-Oberfläche -------------------------------------------------
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def getProfile(self, userId=None, fields=None):
+        self.aufrufe["profile"] += 1
+        return _Aufruf(lambda: {"historyId": str(self.history_id)})
+
+    def history(self):
+        dienst = self
+
+        class Verlauf:
+            def list(self, userId=None, startHistoryId=None, historyTypes=None,
+                     maxResults=100, pageToken=None, fields=None):
+                def holen():
+                    dienst.aufrufe["history"] += 1
+                    start = int(startHistoryId)
+                    if start < dienst.aeltester_verlauf:
+                        raise _http_fehler(404)
+                    neu = [{"messagesAdded": [{"message": {"id": m}}]}
+                           for h, m in dienst.verlauf if h > start]
+                    anfang = int(pageToken or 0)
+                    ende = anfang + min(maxResults, dienst.seite)
+                    antwort = {"historyId": str(dienst.history_id)}
+                    if neu[anfang:ende]:
+                        antwort["history"] = neu[anfang:ende]
+                    if ende < len(neu):
+                        antwort["nextPageToken"] = str(ende)
+                    return antwort
+                return _Aufruf(holen)
+        return Verlauf()
+
+    def list(self, userId=None, q=None, maxResults=100, pageToken=None, fields=None):
+        self.aufrufe["list"] += 1
+        ids = sorted(self.nachrichten)
+        start = int(pageToken or 0)
+        ende = start + min(maxResults, self.seite)
+        antwort = {"messages": [{"id": i} for i in ids[start:ende]]}
+        if ende < len(ids):
+            antwort["nextPageToken"] = str(ende)
+        return _Aufruf(lambda: antwort)
+
+    def labels(self):
+        dienst = self
+
+        class Labels:
+            def list(self, userId=None, fields=None):
+                dienst.aufrufe["labels.list"] += 1
+                return _Aufruf(lambda: {"labels": list(dienst.labels_vorhanden)})
+
+            def create(self, userId=None, body=None):
+                dienst.aufrufe["labels.create"] += 1
+                label = {"id": f"Label_{len(dienst.labels_vorhanden) + 1}",
+                         "name": body["name"]}
+                dienst.labels_vorhanden.append(label)
+                return _Aufruf(lambda: label)
+        return Labels()
+
+    def batchModify(self, userId=None, body=None):
+        def ausfuehren():
+            self.aufrufe["batchModify"] += 1
+            if self.markieren_stoert:
+                raise _http_fehler(500)
+            assert len(body["ids"]) <= 1000
+            self.markiert.append((body.get("addLabelIds"), list(body["ids"])))
+            return {}
+        return _Aufruf(ausfuehren)
+
+    def get(self, userId=None, id=None, format=None, fields=None, metadataHeaders=None):
+        self.parameter.append({"format": format, "fields": fields})
+
+        def holen():
+            self.aufrufe["get" if format == "full" else format] += 1
+            return self.nachrichten[id]
+        return _Aufruf(holen)
+
+    def new_batch_http_request(self, callback=None):
+        dienst = self
+
+        class Stapel:
+            def __init__(self):
+                self.anfragen = []
+
+            def add(self, anfrage, request_id=None):
+                assert len(self.anfragen) < 100, "Gmail erlaubt hoechstens 100 je Stapel"
+                self.anfragen.append((request_id, anfrage))
+
+            def execute(self):
+                dienst.aufrufe["batch"] += 1
+                for request_id, anfrage in self.anfragen:
+                    try:
+                        callback(request_id, anfrage.execute(), None)
+                    except KeyError as exc:
+                        callback(request_id, None, exc)
+        return Stapel()
+
+
+@pytest.fixture()
+def db(tmp_path):
+    pfad = str(tmp_path / "g.db")
+    for modul in (TCGInventory, setup_db, order_service, lager_manager):
+        modul.DB_FILE = pfad
+    mailarchiv.ARCHIV_DIR = tmp_path / "mailarchiv"
+    setup_db.initialize_database()
+    return pfad
+
+
+@pytest.fixture()
+def ohne_kartendaten(monkeypatch):
+    """Abgleich ohne Kartendatenbank — hier geht es ums Holen und Markieren."""
+    monkeypatch.setattr(order_service, "resolve_set_codes",
+                        lambda names: {name: (None, "none") for name in names})
+    monkeypatch.setattr(order_service, "image_urls_for_names", lambda names: {})
+
+
+def _anzahl_bestellungen(db):
+    with sqlite3.connect(db) as conn:
+        return conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+
+# ---------------------------------------------------------------------------
+# fetch_cardmarket_emails
+# ---------------------------------------------------------------------------
+def test_messages_are_fetched_in_batches():
+    dienst = FalscherGmailDienst(120)
+    mails = gmail_auth.fetch_cardmarket_emails(dienst)
+    assert len(mails) == 120
+    assert dienst.aufrufe["batch"] == 3            # 50 + 50 + 20
+    assert dienst.aufrufe["get"] == 120
+
+
+def test_listing_follows_pagination_beyond_100():
+    dienst = FalscherGmailDienst(250, seite=100)
+    mails = gmail_auth.fetch_cardmarket_emails(dienst)
+    assert len(mails) == 250
+    assert dienst.aufrufe["list"] == 3
+
+
+def test_only_needed_fields_are_requested():
+    dienst = FalscherGmailDienst(2)
+    gmail_auth.fetch_cardmarket_emails(dienst)
+    felder = dienst.parameter[0]["fields"]
+    assert felder == gmail_auth.MESSAGE_FIELDS
+    assert "payload(" in felder and "internalDate" in felder
+
+
+def test_known_and_processed_messages_are_not_downloaded():
+    dienst = FalscherGmailDienst(10)
+    mails = gmail_auth.fetch_cardmarket_emails(
+        dienst, processed_message_ids={"m0000"},
+        known_ids_lookup=lambda ids: {"m0001", "m0002"})
+    assert [m["id"] for m in mails] == [f"m{i:04d}" for i in range(3, 10)]
+    assert dienst.aufrufe["get"] == 7
+
+
+def test_failed_message_is_left_out():
+    dienst = FalscherGmailDienst(3)
+    echte_get = dienst.get
+
+    def get(userId=None, id=None, **kwargs):
+        if id == "m0001":
+            return _Aufruf(lambda: dienst.nachrichten["gibt-es-nicht"])
+        return echte_get(userId=userId, id=id, **kwargs)
+
+    dienst.get = get
+    mails = gmail_auth.fetch_cardmarket_emails(dienst)
+    assert [m["id"] for m in mails] == ["m0000", "m0002"]
+
+
+# ---------------------------------------------------------------------------
+# sync_orders
+# ---------------------------------------------------------------------------
+def _sync_stand(db):
+    with sqlite3.connect(db) as conn:
+        zeile = conn.execute("SELECT wert FROM sync_stand WHERE schluessel = ?",
+                             (order_service.HISTORY_CURSOR_KEY,)).fetchone()
+    return zeile[0] if zeile else None
+
+
+def test_sync_skips_existing_orders_before_fetching(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(5)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+
+    ok, _, neu = order_service.OrderIngestionService().sync_orders()
+    assert ok and neu == 5
+    assert dienst.aufrufe["get"] == 5
+
+    # Ohne gespeicherten Cursor (wie vor der ersten Synchronisation) läuft
+    # die volle Suche; die fünf Mails stehen schon als Bestellungen in der
+    # Datenbank und werden nicht noch einmal geholt.
+    with sqlite3.connect(db) as conn:
+        conn.execute("DELETE FROM sync_stand")
+    dienst.neu("m9999")
+    dienst.aufrufe.clear()
+    ok, _, neu = order_service.OrderIngestionService().sync_orders()
+    assert neu == 1
+    assert dienst.aufrufe["list"] == 1
+    assert dienst.aufrufe["get"] == 1
+    assert _anzahl_bestellungen(db) == 6
+
+
+# ---------------------------------------------------------------------------
+# Inkrementeller Abgleich über historyId
+# ---------------------------------------------------------------------------
+def test_first_sync_stores_history_cursor(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(3)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+
+    order_service.OrderIngestionService().sync_orders()
+    assert _sync_stand(db) == str(dienst.history_id)
+    assert dienst.aufrufe["list"] == 1
+
+
+def test_idle_poll_costs_one_call_and_survives_restart(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(3)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    order_service.OrderIngestionService().sync_orders()
+
+    dienst.aufrufe.clear()
+    ok, text, neu = order_service.OrderIngestionService().sync_orders()  # „Neustart“
+    assert ok and neu == 0
+    assert dict(dienst.aufrufe) == {"history": 1}
+
+
+def test_new_mail_is_picked_up_incrementally(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(3)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    service = order_service.OrderIngestionService()
+    service.sync_orders()
+
+    dienst.neu("neu1")
+    dienst.neu("privat", absender="freund@example.org", betreff="Grillen?")
+    dienst.neu("spiel", absender="noreply@cardmarket.com", betreff="Newsletter")
+    dienst.aufrufe.clear()
+    ok, _, neu = service.sync_orders()
+
+    assert neu == 1
+    assert dienst.aufrufe["list"] == 0
+    assert dienst.aufrufe["metadata"] == 3        # nur Kopfzeilen der neuen Mails
+    assert dienst.aufrufe["get"] == 1             # nur die Bestellung vollständig
+    assert _sync_stand(db) == str(dienst.history_id)
+    assert _anzahl_bestellungen(db) == 4
+
+
+def test_expired_cursor_falls_back_to_full_search(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(2)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    service = order_service.OrderIngestionService()
+    service.sync_orders()
+
+    dienst.neu("neu1")
+    dienst.aeltester_verlauf = dienst.history_id + 1   # Cursor verfällt
+    dienst.aufrufe.clear()
+    ok, _, neu = service.sync_orders()
+
+    assert ok and neu == 1
+    assert dienst.aufrufe["history"] == 1
+    assert dienst.aufrufe["list"] == 1
+    assert _sync_stand(db) == str(dienst.history_id)
+
+
+def test_cursor_stays_when_a_new_mail_cannot_be_fetched(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(1)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    service = order_service.OrderIngestionService()
+    service.sync_orders()
+    vorher = _sync_stand(db)
+
+    dienst.neu("kaputt")
+    inhalt = dienst.nachrichten.pop("kaputt")      # get() schlägt fehl
+    service.sync_orders()
+    assert _sync_stand(db) == vorher
+
+    dienst.nachrichten["kaputt"] = inhalt
+    ok, _, neu = service.sync_orders()
+    assert neu == 1
+    assert _sync_stand(db) == str(dienst.history_id)
+
+
+def test_mail_that_failed_to_save_is_retried_next_poll(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(1)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    service = order_service.OrderIngestionService()
+    service.sync_orders()
+
+    dienst.neu("wackelig")
+    speichern = service._save_order
+    fehlschlaege = []
+
+    def einmal_kaputt(parsed):
+        if not fehlschlaege:
+            fehlschlaege.append(parsed["message_id"])
+            return False                          # etwa ein Datenbankfehler
+        return speichern(parsed)
+
+    monkeypatch.setattr(service, "_save_order", einmal_kaputt)
+    ok, _, neu = service.sync_orders()
+    assert neu == 0 and fehlschlaege == ["wackelig"]
+    assert _sync_stand(db) == str(dienst.history_id)  # Cursor ist weiter
+
+    dienst.aufrufe.clear()
+    ok, _, neu = service.sync_orders()                 # kein neuer Verlauf
+    assert ok and neu == 1
+    assert dienst.aufrufe["list"] == 0 and dienst.aufrufe["get"] == 1
+    assert _anzahl_bestellungen(db) == 2
+
+    dienst.aufrufe.clear()
+    service.sync_orders()                              # nichts mehr offen
+    assert dict(dienst.aufrufe) == {"history": 1}
+
+
+def test_cut_off_history_falls_back_to_full_search(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(1, seite=2)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    service = order_service.OrderIngestionService()
+    service.sync_orders()
+    cursor = _sync_stand(db)
+
+    for i in range(5):
+        dienst.neu(f"flut{i}")
+    ids, history_id = gmail_auth.list_added_message_ids(dienst, cursor, max_messages=2)
+    assert ids == ["flut0", "flut1"] and history_id is None
+
+    monkeypatch.setattr(gmail_auth, "list_added_message_ids", functools.partial(
+        gmail_auth.list_added_message_ids, max_messages=2))
+    dienst.aufrufe.clear()
+    ok, _, neu = service.sync_orders()
+    assert ok and neu == 5                             # keine Mail übersprungen
+    assert dienst.aufrufe["list"] == 3
+    assert _sync_stand(db) == str(dienst.history_id)
+
+
+# ---------------------------------------------------------------------------
+# Markieren mit dem Label processed-tcg
+# ---------------------------------------------------------------------------
+def test_processed_mails_are_labelled_in_one_call(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(30)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+
+    ok, _, neu = order_service.OrderIngestionService().sync_orders()
+    assert neu == 30
+    assert dienst.aufrufe["labels.list"] == 1
+    assert dienst.aufrufe["labels.create"] == 1
+    assert dienst.aufrufe["batchModify"] == 1
+    assert dienst.markiert == [(["Label_1"], sorted(dienst.nachrichten))]
+
+
+def test_label_id_is_cached_per_service():
+    dienst = FalscherGmailDienst()
+    dienst.labels_vorhanden = [{"id": "Label_7", "name": gmail_auth.PROCESSED_LABEL}]
+    for i in range(3):
+        assert gmail_auth.mark_message_processed(dienst, f"m{i}")
+    assert dienst.aufrufe["labels.list"] == 1
+    assert dienst.aufrufe["batchModify"] == 3
+
+    anderer = FalscherGmailDienst()                    # neuer Dienst: neu nachschlagen
+    gmail_auth.mark_message_processed(anderer, "m0")
+    assert anderer.aufrufe["labels.list"] == 1
+
+
+def test_batch_modify_is_split_at_1000():
+    dienst = FalscherGmailDienst()
+    assert gmail_auth.mark_messages_processed(dienst, [f"m{i}" for i in range(2500)])
+    assert [len(ids) for _, ids in dienst.markiert] == [1000, 1000, 500]
+
+
+def test_unlabelled_mails_are_retried_next_run(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(3)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    service = order_service.OrderIngestionService()
+
+    dienst.markieren_stoert = True
+    ok, _, neu = service.sync_orders()
+    assert ok and neu == 3
+    assert dienst.markiert == []
+
+    dienst.markieren_stoert = False
+    dienst.neu("m0100")
+    service.sync_orders()
+    assert len(dienst.markiert) == 1
+    assert sorted(dienst.markiert[0][1]) == ["m0000", "m0001", "m0002", "m0100"]
+
+    dienst.aufrufe.clear()
+    service.sync_orders()                              # nichts mehr offen
+    assert dienst.aufrufe["batchModify"] == 0
+
+
+def test_ingested_mails_are_archived(db, monkeypatch, ohne_kartendaten):
+    dienst = FalscherGmailDienst(3)
+    monkeypatch.setattr(order_service, "get_gmail_service", lambda: dienst)
+    order_service.OrderIngestionService().sync_orders()
+
+    with sqlite3.connect(db) as conn:
+        archiv = mailarchiv.lies_viele(conn, sorted(dienst.nachrichten))
+    assert len(archiv) == 3
+    assert archiv["m0001"]["betreff"] == "Bitte versenden"
+    assert "Bestellnummer: 1000001" in archiv["m0001"]["text"]
@@ -0,0 +1,115 @@
+"""Offline-Mailquellen: mbox, Maildir und .eml-Verzeichnis laufen durch
+denselben Weg wie Gmail (parsen → archivieren → speichern)."""
+
+import mailbox
+import os
+import sqlite3
+import sys
+import types
+
+import pytest
+
+sys.modules.setdefault("cv2", types.SimpleNamespace())
+_pyz = types.ModuleType("pyzbar")
+_pyz.pyzbar = types.SimpleNamespace(decode=lambda *a, **k: [])
+sys.modules.setdefault("pyzbar", _pyz)
+sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import TCGInventory                                              # noqa: E402
+from TCGInventory import (lager_manager, mail_sources,           # noqa: E402
+                          mailarchiv, order_service, setup_db)
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    pfad = str(tmp_path / "r.db")
+    for modul in (TCGInventory, setup_db, order_service, lager_manager):
+        modul.DB_FILE = pfad
+    mailarchiv.ARCHIV_DIR = tmp_path / "mailarchiv"
+    setup_db.initialize_database()
+    monkeypatch.setattr(order_service, "resolve_set_codes",
+                        lambda names: {name: (None, "none") for name in names})
+    monkeypatch.setattr(order_service, "image_urls_for_names", lambda names: {})
+    return pfad
+
+
+def _bestellungen(db):
+    with sqlite3.connect(db) as conn:
+        return conn.execute(
+            "SELECT order_number, buyer_name, amount_versand FROM orders ORDER BY order_number"
+        ).fetchall()
+
+
+def _mails(anzahl):
+    return [mail_sources.synthetic_mail(1000000 + i) for i in range(anzahl)]
+
+
+def test_mbox_is_ingested(db, tmp_path):
+    pfad = mail_sources.write_mbox(tmp_path / "o.mbox", 5)
+    ok, _, neu = order_service.OrderIngestionService().sync_orders(
+        source=mail_sources.ReplaySource(pfad))
+    assert ok and neu == 5
+    assert _bestellungen(db)[0] == ("1000000", "Kaeufer1000000", 1.55)
+
+
+def test_maildir_is_ingested(db, tmp_path):
+    box = mailbox.Maildir(str(tmp_path / "Maildir"))
+    for mail in _mails(3):
+        box.add(mail)
+    ok, _, neu = order_service.OrderIngestionService().sync_orders(
+        source=mail_sources.ReplaySource(tmp_path / "Maildir"))
+    assert neu == 3
+
+
+def test_eml_directory_is_ingested_and_archived(db, tmp_path):
+    ordner = tmp_path / "eml"
+    (ordner / "juli").mkdir(parents=True)
+    for i, mail in enumerate(_mails(4)):
+        (ordner / "juli" / f"{i}.eml").write_bytes(bytes(mail))
+    (ordner / "notiz.txt").write_text("keine Mail")
+
+    quelle = mail_sources.ReplaySource(ordner)
+    ok, _, neu = order_service.OrderIngestionService().sync_orders(source=quelle)
+    assert neu == 4
+
+    nachricht = quelle.parse(bytes(_mails(1)[0]))
+    assert nachricht.subject == "Bestellung 1000000 für Kaeufer1000000: Bitte versenden"
+    assert nachricht.message_id == "1000000@replay.invalid"
+    assert nachricht.date == "2026-07-01T00:00:00"
+    with sqlite3.connect(db) as conn:
+        assert mailarchiv.lies(conn, nachricht.message_id)["text"] == nachricht.body
+
+
+def test_replay_skips_orders_already_stored(db, tmp_path):
+    pfad = mail_sources.write_mbox(tmp_path / "o.mbox", 3)
+    service = order_service.OrderIngestionService()
+    service.sync_orders(source=mail_sources.ReplaySource(pfad))
+    ok, text, neu = service.sync_orders(source=mail_sources.ReplaySource(pfad))
+    assert ok and neu == 0 and text == "No new orders found"
+    assert len(_bestellungen(db)) == 3
+
+
+def test_missing_source_is_reported(db, tmp_path):
+    ok, text, neu = order_service.OrderIngestionService().sync_orders(
+        source=mail_sources.ReplaySource(tmp_path / "fehlt.mbox"))
+    assert not ok and "not found" in text
+
+
+def test_source_without_fetch_cannot_be_created():
+    class Halb(mail_sources.MailSource):
+        pass
+
+    with pytest.raises(TypeError):
+        Halb()
+
+
+def test_benchmark_reports_stages_and_leaves_live_db_alone(db, tmp_path):
+    bericht = mail_sources.benchmark(20, workdir=tmp_path / "bench")
+    assert bericht["ok"] and bericht["orders"] == 20
+    assert bericht["orders_per_second"] > 0
+    assert {"fetch", "archive", "parse", "save", "match"} <= set(bericht["stages"])
+    assert bericht["stages"]["parse"]["calls"] == 20
+    assert bericht["db_write_seconds"] >= 0
+    assert order_service.DB_FILE == db and _bestellungen(db) == []
@@ -0,0 +1,94 @@
+"""Mailarchiv: komprimiert ablegen, gezielt wieder lesen, nichts doppelt."""
+
+import os
+import sqlite3
+import sys
+import types
+
+import pytest
+
+sys.modules.setdefault("cv2", types.SimpleNamespace())
+_pyz = types.ModuleType("pyzbar")
+_pyz.pyzbar = types.SimpleNamespace(decode=lambda *a, **k: [])
+sys.modules.setdefault("pyzbar", _pyz)
+sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import TCGInventory                                              # noqa: E402
+from TCGInventory import mailarchiv, setup_db                    # noqa: E402
+
+
+def _text(nummer):
+    return (f"Bestellnummer: {nummer}\nKäufer: Sharqy\nStatus: Bezahlt\n\n"
+            + "1x Force of Negation (Modern Horizons) - R - Englisch - NM 1,06 EUR\n" * 20
+            + "Gesamtbetrag: 2,61 EUR\n")
+
+
+@pytest.fixture()
+def conn(tmp_path):
+    pfad = str(tmp_path / "a.db")
+    TCGInventory.DB_FILE = setup_db.DB_FILE = pfad
+    mailarchiv.ARCHIV_DIR = tmp_path / "mailarchiv"
+    setup_db.initialize_database()
+    with sqlite3.connect(pfad) as verbindung:
+        yield verbindung
+
+
+def test_mail_is_read_back_unchanged(conn):
+    assert mailarchiv.lege_ab(conn, "m1", _text(1), "Bitte versenden",
+                              "2026-07-14T10:00:00")
+    eintrag = mailarchiv.lies(conn, "m1")
+    assert eintrag == {"text": _text(1), "betreff": "Bitte versenden",
+                       "email_date": "2026-07-14T10:00:00"}
+    assert mailarchiv.lies(conn, "gibt-es-nicht") is None
+
+
+def test_one_compressed_file_per_month(conn):
+    mailarchiv.lege_ab(conn, "m1", _text(1), email_date="2026-07-14T10:00:00")
+    mailarchiv.lege_ab(conn, "m2", _text(2), email_date="2026-07-30T10:00:00")
+    mailarchiv.lege_ab(conn, "m3", _text(3), email_date="2026-08-01T09:00:00")
+
+    dateien = sorted(p.name for p in mailarchiv.ARCHIV_DIR.iterdir())
+    assert dateien == ["2026-07.gz", "2026-08.gz"]
+    juli = (mailarchiv.ARCHIV_DIR / "2026-07.gz").stat().st_size
+    assert juli < len(_text(1).encode())              # zwei Mails, kleiner als eine
+    gelesen = mailarchiv.lies_viele(conn, ["m3", "m1", "m2"])
+    assert {k: v["text"] for k, v in gelesen.items()} == {
+        "m1": _text(1), "m2": _text(2), "m3": _text(3)}
+
+
+def test_same_text_is_stored_once(conn):
+    mailarchiv.lege_ab(conn, "m1", _text(1), email_date="2026-07-14")
+    groesse = (mailarchiv.ARCHIV_DIR / "2026-07.gz").stat().st_size
+    assert mailarchiv.lege_ab(conn, "m1-kopie", _text(1), email_date="2026-07-15")
+    assert (mailarchiv.ARCHIV_DIR / "2026-07.gz").stat().st_size == groesse
+    assert mailarchiv.lies(conn, "m1-kopie")["text"] == _text(1)
+    assert mailarchiv.statistik(conn) == {"mails": 2, "texte": 1, "bytes": groesse}
+
+
+def test_caller_owns_the_transaction(conn):
+    from TCGInventory import schreiber
+    mailarchiv.lege_ab(conn, "m1", _text(1))
+    conn.rollback()                                   # lege_ab hat nicht committet
+    assert mailarchiv.lies(conn, "m1") is None
+
+    schreiber.schreibe(lambda c: mailarchiv.lege_ab(c, "m2", _text(2)),
+                       TCGInventory.DB_FILE)
+    assert mailarchiv.lies(conn, "m2")["text"] == _text(2)
+
+
+def test_known_message_is_not_stored_again(conn):
+    assert mailarchiv.lege_ab(conn, "m1", _text(1))
+    assert not mailarchiv.lege_ab(conn, "m1", _text(2))
+    assert mailarchiv.lies(conn, "m1")["text"] == _text(1)
+    assert not mailarchiv.lege_ab(conn, "m2", "")
+
+
+def test_damaged_entry_is_skipped(conn, capsys):
+    mailarchiv.lege_ab(conn, "m1", _text(1), email_date="2026-07-14")
+    mailarchiv.lege_ab(conn, "m2", _text(2), email_date="2026-07-14")
+    conn.execute("UPDATE mailarchiv SET versatz = versatz + 3 WHERE message_id = 'm1'")
+    gelesen = mailarchiv.lies_viele(conn, ["m1", "m2"])
+    assert list(gelesen) == ["m2"]
+    assert "nicht lesbar" in capsys.readouterr().out
@@ -26,8 +26,8 @@ sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 import TCGInventory                                              # noqa: E402
-from TCGInventory import (auth, lager_manager, nachlesen,        # noqa: E402
-                          order_service, setup_db, web)
+from TCGInventory import (auth, lager_manager, mailarchiv,       # noqa: E402
+                          nachlesen, order_service, setup_db, web)
 
 MAIL = """Bestellnummer: 1287799674
 Käufer: Sharqy
@@ -57,14 +57,14 @@ class FalscherDienst:
         self.mails = mails            # message_id -> Mailtext
         self.abgerufen = []
 
-    # Nachgebaut wird nur, was hole_nachricht benutzt.
+    # Nachgebaut wird nur, was das Nachlesen benutzt.
     def users(self):
         return self
 
     def messages(self):
         return self
 
-    def get(self, userId=None, id=None, format=None):
+    def get(self, userId=None, id=None, format=None, fields=None):
         self.abgerufen.append(id)
         dienst = self
 
@@ -80,6 +80,33 @@ class FalscherDienst:
         return Aufruf()
 
 
+class GebuendelterDienst(FalscherDienst):
+    """Wie ``FalscherDienst``, aber mit Gmail-Batches; zählt die Batches."""
+
+    def __init__(self, mails):
+        super().__init__(mails)
+        self.batches = []
+
+    def new_batch_http_request(self, callback=None):
+        dienst = self
+
+        class Stapel:
+            def __init__(self):
+                self.anfragen = []
+
+            def add(self, anfrage, request_id=None):
+                self.anfragen.append((request_id, anfrage))
+
+            def execute(self):
+                dienst.batches.append(len(self.anfragen))
+                for request_id, anfrage in self.anfragen:
+                    try:
+                        callback(request_id, anfrage.execute(), None)
+                    except Exception as exc:
+                        callback(request_id, None, exc)
+        return Stapel()
+
+
 @pytest.fixture(autouse=True)
 def gmail_ersatz(monkeypatch):
     """Mailtext direkt aus dem gefaelschten Nachrichtenobjekt lesen."""
@@ -93,6 +120,7 @@ def db(tmp_path):
     pfad = str(tmp_path / "n.db")
     for modul in (TCGInventory, web, auth, setup_db, order_service, lager_manager):
         modul.DB_FILE = pfad
+    mailarchiv.ARCHIV_DIR = tmp_path / "mailarchiv"
     setup_db.initialize_database()
     return pfad
 
@@ -142,6 +170,29 @@ def test_zeichenkette_none_gilt_als_leer(db):
     assert [z["id"] for z in offen] == [bid]
 
 
+def test_sql_filter_entspricht_fehlt(db):
+    """Der Filter in SQL muss genau das finden, was ``_fehlt`` meint."""
+    voll = dict(nummer="1", gesamt=2.61, gesamtwert=1.06, versand=1.55,
+                gebuehren=0.07, auszahlung=2.54)
+    ids = {
+        "vollstaendig": _bestellung(db, mid="a", **voll),
+        "null_ist_kein_loch": _bestellung(db, mid="b", **{**voll, "versand": 0.0}),
+        "leere_nummer": _bestellung(db, mid="c", **{**voll, "nummer": "  "}),
+        "none_text": _bestellung(db, mid="d", **{**voll, "gebuehren": "None"}),
+        "fehlt": _bestellung(db, mid="e", **{**voll, "gesamt": None}),
+    }
+    with sqlite3.connect(db) as conn:
+        conn.row_factory = sqlite3.Row
+        alle = conn.execute("SELECT * FROM orders ORDER BY id").fetchall()
+        erwartet = [z["id"] for z in alle
+                    if any(nachlesen._fehlt(z[s]) for s in
+                           list(nachlesen.BETRAGSFELDER) + list(nachlesen.TEXTFELDER))]
+        gefunden = [z["id"] for z in nachlesen.offene_bestellungen(conn)]
+        begrenzt = [z["id"] for z in nachlesen.offene_bestellungen(conn, 2)]
+    assert gefunden == erwartet == [ids["leere_nummer"], ids["none_text"], ids["fehlt"]]
+    assert begrenzt == gefunden[:2]
+
+
 # ---------------------------------------------------------------------------
 # Nachlesen
 # ---------------------------------------------------------------------------
@@ -256,6 +307,135 @@ def test_bestand_und_positionen_bleiben_unberuehrt(db):
     assert _abbild() == vorher
 
 
+def test_altbestand_in_einem_lauf_und_gebuendelt(db):
+    """Mehrere hundert Altbestellungen: ein Klick, Gmail-Batches statt Einzelabrufen."""
+    anzahl = 120
+    for i in range(anzahl):
+        _bestellung(db, mid=f"alt-{i}")
+    _bestellung(db, mid="weg")
+    dienst = GebuendelterDienst({f"alt-{i}": MAIL for i in range(anzahl)})
+
+    with sqlite3.connect(db) as conn:
+        ergebnis = nachlesen.lese_nach(conn, service=dienst, schreiben=True)
+
+    assert ergebnis.geprueft == anzahl + 1
+    assert ergebnis.ergaenzt == anzahl
+    assert ergebnis.ohne_mail == 1
+    assert dienst.batches == [50, 50, 21]
+    with sqlite3.connect(db) as conn:
+        assert nachlesen.offene_bestellungen(conn)[0]["email_message_id"] == "weg"
+
+
+def test_grenze_begrenzt_den_lauf(db):
+    for i in range(5):
+        _bestellung(db, mid=f"alt-{i}")
+    dienst = GebuendelterDienst({f"alt-{i}": MAIL for i in range(5)})
+    with sqlite3.connect(db) as conn:
+        ergebnis = nachlesen.lese_nach(conn, service=dienst, grenze=3)
+    assert ergebnis.geprueft == 3
+    assert sorted(dienst.abgerufen) == ["alt-0", "alt-1", "alt-2"]
+
+
+# ---------------------------------------------------------------------------
+# Mailarchiv
+# ---------------------------------------------------------------------------
+def _archiviere(db, mid, text=MAIL):
+    with sqlite3.connect(db) as conn:
+        mailarchiv.lege_ab(conn, mid, text, "Bitte versenden", "2026-07-14T10:00:00")
+
+
+def test_archivierte_mail_braucht_kein_gmail(db):
+    bid = _bestellung(db)
+    _archiviere(db, "msg-1")
+    dienst = FalscherDienst({})
+
+    with sqlite3.connect(db) as conn:
+        ergebnis = nachlesen.lese_nach(conn, service=dienst, schreiben=True)
+
+    assert dienst.abgerufen == []
+    assert ergebnis.ergaenzt == 1
+    assert _lies(db, bid)["amount_gesamt"] == 2.61
+
+
+def test_von_gmail_geholte_mail_wird_archiviert(db):
+    _bestellung(db)
+    with sqlite3.connect(db) as conn:
+        nachlesen.lese_nach(conn, service=FalscherDienst({"msg-1": MAIL}))
+        assert mailarchiv.lies(conn, "msg-1")["text"] == MAIL
+
+
+def test_keine_schreibsperre_waehrend_gmail_laedt(db):
+    """Zwischen zwei Blöcken kann jeder andere Schreiber an die Datenbank."""
+    anzahl = 2 * nachlesen.BLOCK + 1      # der dritte Abruf folgt sicher auf Block 1
+    for i in range(anzahl):
+        _bestellung(db, mid=f"alt-{i}")
+    dienst = GebuendelterDienst({f"alt-{i}": MAIL for i in range(anzahl)})
+    frei = []
+    abruf = dienst.new_batch_http_request
+
+    def pruefender_abruf(callback=None):
+        with sqlite3.connect(db, timeout=0) as andere:
+            andere.execute("BEGIN IMMEDIATE")
+            andere.rollback()
+        frei.append(True)
+        return abruf(callback)
+    dienst.new_batch_http_request = pruefender_abruf
+
+    with sqlite3.connect(db) as conn:
+        ergebnis = nachlesen.lese_nach(conn, service=dienst, schreiben=True)
+
+    assert frei == [True, True, True]
+    assert ergebnis.ergaenzt == anzahl
+
+
+def test_abbruch_behaelt_archiv_aber_keine_nachtraege(db, monkeypatch):
+    for i in range(nachlesen.BLOCK + 1):
+        _bestellung(db, mid=f"alt-{i}")
+    dienst = GebuendelterDienst({f"alt-{i}": MAIL for i in range(nachlesen.BLOCK + 1)})
+    geparst = nachlesen._werte_aus_mail
+    aufrufe = []
+
+    def bricht_ab(nachricht):
+        aufrufe.append(nachricht["id"])
+        if len(aufrufe) > nachlesen.BLOCK:
+            raise RuntimeError("Abbruch im zweiten Block")
+        return geparst(nachricht)
+    monkeypatch.setattr(nachlesen, "_werte_aus_mail", bricht_ab)
+
+    with sqlite3.connect(db) as conn:
+        with pytest.raises(RuntimeError):
+            nachlesen.lese_nach(conn, service=dienst, schreiben=True)
+
+    with sqlite3.connect(db) as conn:
+        assert mailarchiv.lies(conn, "alt-0")["text"] == MAIL
+        assert len(nachlesen.offene_bestellungen(conn)) == nachlesen.BLOCK + 1
+
+
+@pytest.mark.parametrize("prozesse", [1, 2])
+def test_massenlauf_aus_dem_archiv(db, monkeypatch, prozesse):
+    monkeypatch.setattr(nachlesen, "PARALLEL_AB", 2)
+    ids = [_bestellung(db, mid=f"msg-{i}") for i in range(4)]
+    for i in range(3):
+        _archiviere(db, f"msg-{i}", MAIL.replace("1287799674", f"12877996{i:02d}"))
+    teilweise = _bestellung(db, mid="msg-teil", versand=9.99, nummer="1")
+    _archiviere(db, "msg-teil")
+
+    with sqlite3.connect(db) as conn:
+        vorschau = nachlesen.lese_archiv_nach(conn, prozesse=prozesse)
+    assert _lies(db, ids[0])["amount_gesamt"] is None       # Vorschau schreibt nicht
+    assert vorschau.ergaenzt == 4
+
+    with sqlite3.connect(db) as conn:
+        ergebnis = nachlesen.lese_archiv_nach(conn, schreiben=True, prozesse=prozesse)
+
+    assert (ergebnis.geprueft, ergebnis.ergaenzt, ergebnis.ohne_mail) == (5, 4, 1)
+    assert _lies(db, ids[2])["order_number"] == "1287799602"
+    assert _lies(db, ids[3])["amount_gesamt"] is None       # nicht archiviert
+    zeile = _lies(db, teilweise)
+    assert zeile["amount_versand"] == 9.99 and zeile["order_number"] == "1"
+    assert zeile["amount_gesamt"] == 2.61
+
+
 # ---------------------------------------------------------------------------
 # Seite
 # ---------------------------------------------------------------------------
@@ -15,7 +15,8 @@ sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from TCGInventory.order_service import OrderIngestionService  # noqa: E402
-from TCGInventory.card_scanner import resolve_set_code  # noqa: E402
+from TCGInventory import build_card_db, card_scanner  # noqa: E402
+from TCGInventory.card_scanner import resolve_set_code, resolve_set_codes  # noqa: E402
 
 
 _DB_SEQ = [0]
@@ -120,34 +121,90 @@ def test_no_like_substring_automatch(tmp_path):
     assert res["card_id"] is None
 
 
-# --- image fallback ------------------------------------------------------
+def test_resolve_set_codes_matches_single_resolution():
+    names = ["FINAL FANTASY", "Avatar: The Last Airbender", "Totally Unknown Set",
+             "Universes Beyond: Assassin's Cre...", None, "FINAL FANTASY"]
+    assert resolve_set_codes(names) == {name: resolve_set_code(name) for name in names}
 
-def test_get_image_from_default_db(tmp_path):
-    default_db_path = tmp_path / "default-cards.db"
-    with sqlite3.connect(default_db_path) as conn:
-        c = conn.cursor()
-        c.execute(
-            """CREATE TABLE cards (id TEXT PRIMARY KEY, name TEXT, set_code TEXT,
-               set_name TEXT, lang TEXT, collector_number TEXT, cardmarket_id TEXT, image_url TEXT)"""
-        )
-        c.execute(
-            "INSERT INTO cards (id, name, set_code, image_url) VALUES (?, ?, ?, ?)",
-            ("123", "Counterspell", "LEA", "http://example.com/counter.jpg"),
-        )
-        conn.commit()
 
+def test_match_items_one_inventory_query_per_order(tmp_path):
+    db = _inventory_db(tmp_path, [
+        ("Rumble Arena", "tla", "en", "O01-S01-P1", 1),
+        ("Rumble Arena", "tla", "de", "O01-S01-P2", 1),
+        ("Lightning Bolt", "fin", "en", "O01-S02-P1", 1),
+        ("Lightning Bolt", "fin", "en", "O01-S02-P2", 1),
+    ])
+    items = [
+        {"name": "rumble arena", "set_name": "Avatar: The Last Airbender", "language": "EN"},
+        {"name": "Rumble Arena", "set_name": "Avatar: The Last Airbender", "language": None},
+        {"name": "Lightning Bolt", "set_name": "FINAL FANTASY", "language": "en"},
+        {"name": "Lightning Bolt", "set_name": "Totally Unknown Set", "language": "en"},
+        {"name": "Rumble Arena", "set_name": "Avatar: The Last Airbender",
+         "language": "en", "uncertain": True},
+    ]
     service = OrderIngestionService()
+    statements = []
+    with sqlite3.connect(db) as conn:
+        conn.set_trace_callback(statements.append)
+        results = service._match_items(conn.cursor(), items)
+        conn.set_trace_callback(None)
+        single = [service._match_item(conn.cursor(), item) for item in items]
 
-    def mock_get_image(card_name):
-        with sqlite3.connect(default_db_path) as conn:
-            c = conn.cursor()
-            c.execute(
-                "SELECT image_url FROM cards WHERE LOWER(name) = LOWER(?) AND image_url IS NOT NULL LIMIT 1",
-                (card_name,),
-            )
-            r = c.fetchone()
-            return r[0] if r and r[0] else None
+    assert [r["match_status"] for r in results] == [
+        "matched", "ambiguous", "ambiguous", "unresolved", "ambiguous"]
+    assert results[0]["storage_code"] == "O01-S01-P1"
+    assert results == single
+    assert len([s for s in statements if "FROM cards" in s]) == 1
 
-    service._get_image_from_default_db = mock_get_image
-    assert service._get_image_from_default_db("Counterspell") == "http://example.com/counter.jpg"
-    assert service._get_image_from_default_db("Nonexistent Card") is None
+
+# --- image fallback ------------------------------------------------------
+
+def _card_db(tmp_path):
+    db = tmp_path / "default-cards.db"
+    build_card_db.schreibe_datenbank([
+        {"id": "de-cs", "name": "Counterspell", "set": "lea", "lang": "de",
+         "collector_number": "1"},
+        {"id": "en-cs", "name": "Counterspell", "set": "lea", "lang": "en",
+         "collector_number": "2"},
+    ], db)
+    card_scanner.reset_card_database()
+    card_scanner.DEFAULT_DB_PATH = db
+    return db
+
+
+def test_image_urls_for_names_uses_card_db_and_caches(tmp_path):
+    _card_db(tmp_path)
+    images = card_scanner.image_urls_for_names(["counterspell", "Nonexistent Card"])
+    assert images == {"counterspell": card_scanner.image_url_for("en-cs"),
+                      "Nonexistent Card": None}
+
+    # Second lookup is answered from the process cache, not the database.
+    queries = []
+    original = card_scanner._abfrage
+    card_scanner._abfrage = lambda *args: queries.append(args) or original(*args)
+    try:
+        assert card_scanner.image_url_for_name("Counterspell") == card_scanner.image_url_for("en-cs")
+        assert card_scanner.image_url_for_name("Nonexistent Card") is None
+    finally:
+        card_scanner._abfrage = original
+    assert queries == []
+    card_scanner.reset_card_database()
+
+
+def test_image_lookup_uses_folded_name_index(tmp_path):
+    db = _card_db(tmp_path)
+    with sqlite3.connect(str(db)) as conn:
+        plan = " ".join(r[-1] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM cards WHERE lower(name) = ?", ("x",)))
+    assert "idx_name_gefaltet" in plan
+    card_scanner.reset_card_database()
+
+
+def test_unmatched_position_gets_image_from_card_db(tmp_path):
+    _card_db(tmp_path)
+    inventory = _inventory_db(tmp_path, [])
+    res = _match(inventory, {"name": "Counterspell", "set_name": "Totally Unknown Set",
+                             "language": "en", "uncertain": False})
+    assert res["match_status"] == "unresolved"
+    assert res["image_url"] == card_scanner.image_url_for("en-cs")
+    card_scanner.reset_card_database()
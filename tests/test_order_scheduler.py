@@ -0,0 +1,107 @@
+"""Abrufplan des Bestelldienstes: Betriebszeiten, Backoff, Aufwecken."""
+
+import os
+import sys
+import time
+import types
+from datetime import datetime, timedelta
+
+sys.modules.setdefault("cv2", types.SimpleNamespace())
+_pyz = types.ModuleType("pyzbar")
+_pyz.pyzbar = types.SimpleNamespace(decode=lambda *a, **k: [])
+sys.modules.setdefault("pyzbar", _pyz)
+sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import TCGInventory                                              # noqa: E402
+from TCGInventory import auth, order_service, setup_db, web      # noqa: E402
+from TCGInventory.order_service import OrderIngestionService      # noqa: E402
+
+
+def _dienst(ergebnisse=()):
+    """Dienst, dessen Abruf der Reihe nach ``ergebnisse`` liefert."""
+    svc = OrderIngestionService()
+    folge = list(ergebnisse)
+    svc._sync = lambda source: folge.pop(0) if folge else (True, "No new orders found", 0)
+    return svc
+
+
+def test_next_wake_stays_within_operating_hours():
+    svc = _dienst()
+    mittag = datetime(2026, 7, 14, 12, 0)
+    naechster = svc.next_wake(mittag)
+    assert timedelta(minutes=9) <= naechster - mittag <= timedelta(minutes=11)
+
+    # Kurz vor Schluss: nicht um 22:05, sondern am nächsten Morgen ab 11 Uhr.
+    spaet = svc.next_wake(datetime(2026, 7, 14, 21, 58))
+    assert spaet.date() == datetime(2026, 7, 15).date()
+    assert datetime(2026, 7, 15, 11, 0) <= spaet <= datetime(2026, 7, 15, 11, 1)
+
+    # Nachts: noch am selben Tag um 11 Uhr.
+    nachts = svc.next_wake(datetime(2026, 7, 15, 3, 0))
+    assert nachts.date() == datetime(2026, 7, 15).date() and nachts.hour == 11
+
+
+def test_backoff_when_idle_and_tighten_after_orders():
+    svc = _dienst([(True, "No new orders found", 0)] * 4
+                  + [(True, "Successfully imported 2 new order(s)", 2)])
+    intervalle = []
+    for _ in range(5):
+        svc.sync_orders()
+        intervalle.append(svc.schedule_status()["interval_minutes"])
+    assert intervalle == [20, 40, 60, 60, order_service.MIN_POLL_INTERVAL_MINUTES]
+    assert svc.last_new_orders == 2
+    assert svc.last_run_seconds >= 0
+
+
+def test_failed_run_backs_off_too():
+    svc = _dienst([(False, "Gmail not reachable", 0)])
+    svc.sync_orders()
+    assert svc.schedule_status()["interval_minutes"] == 20
+
+
+def test_wake_runs_sync_and_stop_returns_promptly(monkeypatch):
+    monkeypatch.setattr(OrderIngestionService, "is_within_operating_hours",
+                        lambda self, now=None: True)
+    svc = _dienst()
+    svc.start()
+    try:
+        for _ in range(100):
+            if svc.last_run_at:
+                break
+            time.sleep(0.01)
+        erster = svc.last_run_at
+        assert erster and svc.schedule_status()["next_run_at"] > datetime.now()
+
+        svc.wake()
+        for _ in range(100):
+            if svc.last_run_at != erster:
+                break
+            time.sleep(0.01)
+        assert svc.last_run_at != erster
+    finally:
+        beginn = time.perf_counter()
+        svc.stop()
+    assert time.perf_counter() - beginn < 1
+    assert not svc.thread.is_alive()
+    assert svc.schedule_status()["next_run_at"] is None
+
+
+def test_orders_page_shows_last_and_next_run(tmp_path, monkeypatch):
+    db = str(tmp_path / "plan.db")
+    for modul in (TCGInventory, web, auth, setup_db, order_service):
+        monkeypatch.setattr(modul, "DB_FILE", db)
+    setup_db.initialize_database()
+    svc = _dienst()
+    svc.sync_orders()
+    svc.running = True
+    svc.next_run_at = datetime.now().replace(hour=15, minute=42)
+    monkeypatch.setattr(web, "get_order_service", lambda: svc)
+    web.app.config["TESTING"] = True
+    client = web.app.test_client()
+    with client.session_transaction() as sitzung:
+        sitzung["user"] = "tester"
+    body = client.get("/orders").get_data(as_text=True)
+    assert "Letzter Abruf" in body
+    assert "nächster 15:42" in body
@@ -106,6 +106,51 @@ def test_period_filter_selects_only_range(tmp_path):
     assert [o["order_number"] for o in orders] == ["1001", "1002"]   # sorted by date, 0999 excluded
 
 
+def test_order_dates_follow_source_columns(tmp_path):
+    db = _make_db(tmp_path)
+    with sqlite3.connect(db) as conn:
+        conn.execute("UPDATE orders SET date_completed = '2026-04-01T09:00:00+02:00', "
+                     "status = 'sold' WHERE id = 1")
+        conn.execute("UPDATE orders SET email_date = NULL, "
+                     "date_received = '2026-03-21T23:30:00' WHERE id = 2")
+        rows = conn.execute(
+            "SELECT id, order_date, completed_date FROM orders ORDER BY id").fetchall()
+    assert rows == [(1, "2026-03-05", "2026-04-01"),
+                    (2, "2026-03-21", "2026-03-21"),
+                    (3, "2025-12-31", "2025-12-31")]
+
+
+def test_existing_orders_get_dates_on_migration(tmp_path):
+    db = _make_db(tmp_path)
+    with sqlite3.connect(db) as conn:
+        # Stand vor der Migration: Spalten, Trigger und Indizes fehlen noch.
+        for (name,) in conn.execute("SELECT name FROM sqlite_master "
+                                    "WHERE type = 'trigger'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        for name in ("idx_orders_order_date", "idx_orders_status_completed"):
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute("ALTER TABLE orders DROP COLUMN order_date")
+        conn.execute("ALTER TABLE orders DROP COLUMN completed_date")
+    from TCGInventory import setup_db
+    setup_db.initialize_database()
+    assert [o["order_number"] for o in sales_export.fetch_orders(db, _START, _END)] \
+        == ["1001", "1002"]
+
+
+def test_period_filter_uses_the_date_index(tmp_path):
+    db = _make_db(tmp_path)
+    plaene = []
+    with sqlite3.connect(db) as conn:
+        for sql in ("SELECT id FROM orders o WHERE o.order_date BETWEEN ? AND ?",
+                    "SELECT id FROM orders o WHERE o.status = 'sold' "
+                    "AND o.completed_date >= ?"):
+            werte = ("2026-01-01", "2026-12-31")[:sql.count("?")]
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql, werte).fetchall()
+            plaene.append(" ".join(zeile[-1] for zeile in plan))
+    assert plaene[0].startswith("SEARCH") and "idx_orders_order_date" in plaene[0]
+    assert plaene[1].startswith("SEARCH") and "idx_orders_status_completed" in plaene[1]
+
+
 def test_orders_csv_format_and_totals(tmp_path):
     db = _make_db(tmp_path)
     orders = sales_export.fetch_orders(db, _START, _END)
@@ -198,3 +243,91 @@ def test_export_routes(tmp_path):
     assert "positionen_2026-01-01_bis_2026-12-31.csv" in r2.headers["Content-Disposition"]
 
     assert _snapshot(db) == _snapshot(db)                 # routes are read-only
+
+
+# --- sales cube ------------------------------------------------------------
+
+def _cube_neu_gerechnet(conn):
+    """Was die Trigger in ``verkauf_tag`` halten sollten, frisch aus den Quellen."""
+    from TCGInventory import setup_db
+    return conn.execute(
+        f"{setup_db.VERKAUF_TAG_SQL} WHERE o.order_date IS NOT NULL "
+        "GROUP BY 1, 2, 3, 4, 5, 6, 7 ORDER BY 1, 2, 3, 4, 5, 6, 7").fetchall()
+
+
+def _cube(conn):
+    return conn.execute("SELECT * FROM verkauf_tag ORDER BY 1, 2, 3, 4, 5, 6, 7").fetchall()
+
+
+def test_cube_follows_inserts_edits_and_deletes(tmp_path):
+    db = _make_db(tmp_path)
+    with sqlite3.connect(db) as conn:
+        conn.execute("PRAGMA foreign_keys = ON")
+        assert _cube(conn) == _cube_neu_gerechnet(conn)
+        assert len(_cube(conn)) == 3
+
+        conn.execute("INSERT INTO cards (id, name, set_code, rarity) "
+                     "VALUES (7, 'Sol Ring', 'CMR', 'uncommon')")
+        conn.execute("UPDATE order_items SET card_id = 7, set_code = 'CMR' WHERE order_id = 2")
+        conn.execute("INSERT INTO order_items (order_id, card_name, quantity, set_code, "
+                     "condition, foil, unit_price, card_id) "
+                     "VALUES (1, 'Sol Ring', 3, 'CMR', 'EX', 0, 2.50, 7)")
+        conn.execute("UPDATE orders SET verkaufskanal = 'direkt' WHERE id = 2")
+        conn.execute("UPDATE orders SET email_date = '2026-03-06T08:00:00' WHERE id = 1")
+        assert _cube(conn) == _cube_neu_gerechnet(conn)
+
+        # Letztes Exemplar verkauft: die Karte verschwindet, die Seltenheit nicht.
+        conn.execute("DELETE FROM cards WHERE id = 7")
+        conn.execute("UPDATE orders SET status = 'sold', "
+                     "date_completed = '2026-03-22T10:00:00' WHERE id = 2")
+        zeile = conn.execute("SELECT verkaufskanal, rarity, menge, umsatz_cent, bestellungen "
+                             "FROM verkauf_tag WHERE tag = '2026-03-20'").fetchall()
+        assert zeile == [("direkt", "uncommon", 1, 330, 1)]
+
+        conn.execute("DELETE FROM orders WHERE id = 3")
+        assert _cube(conn) == _cube_neu_gerechnet(conn)
+        assert conn.execute("SELECT COUNT(*) FROM verkauf_tag "
+                            "WHERE tag LIKE '2025%'").fetchone()[0] == 0
+
+
+def test_cube_is_filled_for_existing_orders(tmp_path):
+    db = _make_db(tmp_path)
+    with sqlite3.connect(db) as conn:
+        conn.execute("DELETE FROM verkauf_tag")
+        conn.execute("DROP TABLE verkauf_tag")
+    from TCGInventory import setup_db
+    setup_db.initialize_database()
+    with sqlite3.connect(db) as conn:
+        assert _cube(conn) == _cube_neu_gerechnet(conn) and _cube(conn)
+
+
+def test_cube_slices_and_csv(tmp_path):
+    db = _make_db(tmp_path)
+    rows = sales_export.fetch_cube(db, _START, _END, ["condition", "monat", "unbekannt"])
+    assert rows == [
+        {"monat": "2026-03", "condition": "EX", "menge": 1, "umsatz_cent": 330,
+         "bestellungen": 1},
+        {"monat": "2026-03", "condition": "NM", "menge": 2, "umsatz_cent": 780,
+         "bestellungen": 1},
+    ]
+    text = sales_export.build_cube_csv(rows, ["monat", "condition"]).decode("utf-8-sig")
+    lines = text.split("\r\n")
+    assert lines[0] == "Monat;Zustand;Menge;Umsatz;Bestellungen"
+    assert lines[1] == "03.2026;EX;1;3,30;1"
+    assert lines[3] == "Summe;;3;11,10;"
+
+    from TCGInventory import web
+    web.DB_FILE = db
+    web.app.config["TESTING"] = True
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = "tester"
+    page = client.get("/auswertung?von=2026-01-01&bis=2026-12-31&merkmal=foil"
+                      ).get_data(as_text=True)
+    assert "Umsatz nach Merkmalen" in page
+    assert "7,80 €" in page and "3,30 €" in page
+    r = client.get("/auswertung/kennzahlen.csv?von=2026-01-01&bis=2026-12-31"
+                   "&merkmal=rarity")
+    assert r.status_code == 200
+    assert "kennzahlen_2026-01-01_bis_2026-12-31.csv" in r.headers["Content-Disposition"]
+    assert r.get_data().decode("utf-8-sig").startswith("Seltenheit;Menge")
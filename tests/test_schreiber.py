@@ -0,0 +1,131 @@
+"""Ein Schreiber: Warteschlange, Transaktionen, Kennzahlen, keine Sperrfehler."""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.modules.setdefault("cv2", types.SimpleNamespace())
+_pyz = types.ModuleType("pyzbar")
+_pyz.pyzbar = types.SimpleNamespace(decode=lambda *a, **k: [])
+sys.modules.setdefault("pyzbar", _pyz)
+sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import TCGInventory                                              # noqa: E402
+from TCGInventory import (auth, bookkeeping, lager_manager,  # noqa: E402
+                          schreiber, setup_db)
+
+
+@pytest.fixture()
+def db(tmp_path):
+    pfad = str(tmp_path / "s.db")
+    for modul in (TCGInventory, auth, setup_db, lager_manager):
+        modul.DB_FILE = pfad
+    setup_db.initialize_database()
+    with sqlite3.connect(pfad) as conn:
+        conn.execute("CREATE TABLE zaehler (n INTEGER)")
+        conn.execute("INSERT INTO zaehler VALUES (0)")
+    return pfad
+
+
+def _erhoehe(conn):
+    # Lesen, dann schreiben — genau das Muster, das ohne Schreiber kollidiert.
+    n = conn.execute("SELECT n FROM zaehler").fetchone()[0]
+    conn.execute("UPDATE zaehler SET n = ?", (n + 1,))
+    return n + 1
+
+
+def test_concurrent_writers_and_readers_do_not_collide(db):
+    fehler = []
+
+    def schreiben():
+        try:
+            for _ in range(40):
+                schreiber.schreibe(_erhoehe, db)
+        except sqlite3.Error as exc:
+            fehler.append(exc)
+
+    def lesen():
+        try:
+            for _ in range(40):
+                conn = schreiber.verbinde(db)
+                conn.execute("SELECT COUNT(*) FROM cards").fetchone()
+                conn.close()
+        except sqlite3.Error as exc:
+            fehler.append(exc)
+
+    threads = ([threading.Thread(target=schreiben) for _ in range(6)]
+               + [threading.Thread(target=lesen) for _ in range(2)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fehler == []
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT n FROM zaehler").fetchone()[0] == 240
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_bookkeeping_waits_like_every_other_writer(db):
+    conn = bookkeeping._connect(db)
+    try:
+        assert (conn.execute("PRAGMA busy_timeout").fetchone()[0]
+                == schreiber.BUSY_TIMEOUT_MS)
+        assert conn.execute("SELECT 1").fetchone().keys() == ["1"]
+    finally:
+        conn.close()
+
+
+def test_failing_unit_rolls_back_and_raises_at_caller(db):
+    def kaputt(conn):
+        _erhoehe(conn)
+        raise ValueError("Abbruch")
+
+    with pytest.raises(ValueError):
+        schreiber.schreibe(kaputt, db)
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT n FROM zaehler").fetchone()[0] == 0
+    assert schreiber.schreibe(_erhoehe, db) == 1       # Schreiber lebt weiter
+
+
+def test_nested_unit_runs_inside_the_outer_transaction(db):
+    def aussen(conn):
+        _erhoehe(conn)
+        return schreiber.schreibe(_erhoehe, db)
+
+    assert schreiber.schreibe(aussen, db) == 2
+
+
+def test_metrics_report_lock_wait_and_queue(db):
+    schreiber._SCHREIBER.zuruecksetzen()
+    fremd = sqlite3.connect(db, isolation_level=None, check_same_thread=False)
+    fremd.execute("BEGIN IMMEDIATE")                  # etwa eine laufende Sicherung
+    threading.Timer(0.2, lambda: fremd.execute("COMMIT")).start()
+    zukuenfte = [schreiber._SCHREIBER.einreichen(_erhoehe, db) for _ in range(3)]
+    assert [z.result(timeout=10) for z in zukuenfte] == [1, 2, 3]
+    fremd.close()
+
+    werte = schreiber.statistik()
+    assert werte["ausgefuehrt"] == 3 and werte["fehler"] == 0
+    assert werte["max_sperre_s"] >= 0.1
+    assert werte["max_warteschlange"] >= 2
+    assert werte["warteschlange"] == 0
+
+
+def test_sell_during_import_goes_through_the_writer(db):
+    lager_manager.add_card("Bolt", "m10", "en", "NM", 1.0, quantity=2,
+                           storage_code="O01-S01-P1")
+    with sqlite3.connect(db) as conn:
+        card_id = conn.execute("SELECT id FROM cards").fetchone()[0]
+    schreiber._SCHREIBER.zuruecksetzen()
+    assert lager_manager.sell_card(card_id)
+    lager_manager.update_card(card_id, price=2.0)
+    assert schreiber.statistik()["ausgefuehrt"] == 2
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT quantity, price FROM cards").fetchone() == (1, 2.0)
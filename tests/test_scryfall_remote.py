@@ -0,0 +1,213 @@
+"""Online-Rückfall auf Scryfall: gebündelt, gedrosselt, mit Negativ-Speicher.
+
+Statt des echten Dienstes antwortet ein kleiner HTTP-Server im Testprozess.
+Er zählt die Anfragen je Endpunkt — daran lässt sich ablesen, dass 500 Namen
+nicht 500 Anfragen kosten.
+"""
+
+import json
+import os
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.modules.setdefault("cv2", types.SimpleNamespace())
+_pyz = types.ModuleType("pyzbar")
+_pyz.pyzbar = types.SimpleNamespace(decode=lambda *a, **k: [])
+sys.modules.setdefault("pyzbar", _pyz)
+sys.modules.setdefault("pyzbar.pyzbar", _pyz.pyzbar)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from TCGInventory import scryfall_remote                  # noqa: E402
+import TCGInventory.card_scanner as cs                    # noqa: E402
+
+
+def _karte(name, **extra):
+    karte = {"id": f"id-{name.lower().replace(' ', '-')}", "name": name,
+             "set": "tst", "lang": "en", "collector_number": "1"}
+    karte.update(extra)
+    return karte
+
+
+class _Scryfall:
+    """Nachbildung der benutzten Scryfall-Endpunkte."""
+
+    def __init__(self, karten):
+        self.karten = {k["name"].lower(): k for k in karten}
+        for k in karten:                                   # Seiten doppelseitiger Karten
+            for seite in k["name"].lower().split(" // "):
+                self.karten.setdefault(seite, k)
+        self.aufrufe = {}
+        self.stoerungen = []              # Statuscodes, die zuerst geliefert werden
+        self.bloecke = []
+        self.kaputt = set()               # Sammelabfragen mit diesen Namen scheitern
+
+    def antworte(self, handler, methode):
+        pfad = urlparse(handler.path)
+        self.aufrufe[pfad.path] = self.aufrufe.get(pfad.path, 0) + 1
+        if self.stoerungen:
+            status = self.stoerungen.pop(0)
+            handler.send_response(status)
+            handler.send_header("Retry-After", "0")
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        query = parse_qs(pfad.query)
+        if pfad.path == "/cards/collection" and methode == "POST":
+            laenge = int(handler.headers.get("Content-Length", 0))
+            kennungen = json.loads(handler.rfile.read(laenge))["identifiers"]
+            if any(k["name"] in self.kaputt for k in kennungen):
+                return self._json(handler, {}, 500)
+            self.bloecke.append(len(kennungen))
+            treffer = [self.karten[k["name"].lower()] for k in kennungen
+                       if k["name"].lower() in self.karten]
+            fehlt = [k for k in kennungen if k["name"].lower() not in self.karten]
+            return self._json(handler, {"data": treffer, "not_found": fehlt})
+        if pfad.path == "/cards/named":
+            karte = self.karten.get(query["exact"][0].lower())
+            return self._json(handler, karte) if karte else self._json(handler, {}, 404)
+        if pfad.path == "/cards/autocomplete":
+            q = query["q"][0].lower()
+            return self._json(handler, {"data": sorted(
+                {k["name"] for k in self.karten.values() if k["name"].lower().startswith(q)})})
+        if pfad.path.startswith("/cards/"):
+            kennung = pfad.path.rsplit("/", 1)[-1]
+            for karte in self.karten.values():
+                if karte["id"] == kennung:
+                    return self._json(handler, karte)
+        return self._json(handler, {}, 404)
+
+    @staticmethod
+    def _json(handler, daten, status=200):
+        rumpf = json.dumps(daten).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(rumpf)))
+        handler.end_headers()
+        handler.wfile.write(rumpf)
+
+
+@pytest.fixture
+def scryfall(monkeypatch):
+    dienst = _Scryfall([_karte(f"Karte {i}") for i in range(200)]
+                       + [_karte("Fire // Ice", id="id-fire-ice")])
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            dienst.antworte(self, "GET")
+
+        def do_POST(self):
+            dienst.antworte(self, "POST")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    resolver = scryfall_remote.ScryfallResolver(
+        f"http://127.0.0.1:{server.server_address[1]}",
+        abstand=0, abstand_suche=0, wartezeit=0.01)
+    dienst.resolver = resolver
+    # Ohne lokale Kartendatenbank geht jede Suche an den Stand-in.
+    monkeypatch.setattr(scryfall_remote, "_RESOLVER", resolver)
+    monkeypatch.setattr(cs, "DEFAULT_DB_PATH", cs.Path("/gibt/es/nicht.db"))
+    cs.reset_card_database()
+    yield dienst
+    server.shutdown()
+    server.server_close()
+    cs.reset_card_database()
+
+
+def test_names_are_resolved_in_blocks_of_75(scryfall):
+    namen = [f"Karte {i}" for i in range(160)] + ["Gibt es nicht"]
+    ergebnis = cs.fetch_card_infos_by_name(namen)
+
+    assert scryfall.aufrufe == {"/cards/collection": 3}
+    assert scryfall.bloecke == [75, 75, 11]
+    assert ergebnis["Karte 42"]["scryfall_id"] == "id-karte-42"
+    assert ergebnis["Gibt es nicht"] is None
+
+
+def test_double_faced_card_is_found_by_face_name(scryfall):
+    ergebnis = cs.fetch_card_infos_by_name(["Fire"])
+    assert ergebnis["Fire"]["scryfall_id"] == "id-fire-ice"
+
+
+def test_canonical_names_are_matched_by_request_order(scryfall):
+    # Scryfall findet die Karte auch ohne Akzent, antwortet aber kanonisch.
+    scryfall.karten["lim-dul's vault"] = _karte("Lim-Dûl's Vault")
+    ergebnis = cs.fetch_card_infos_by_name(["Lim-Dul's Vault", "Karte 2", "Gibt es nicht"])
+    assert ergebnis["Lim-Dul's Vault"]["scryfall_id"] == "id-lim-dûl's-vault"
+    assert ergebnis["Karte 2"]["scryfall_id"] == "id-karte-2"
+    assert ergebnis["Gibt es nicht"] is None
+    assert not scryfall.resolver.ist_unbekannt("Lim-Dul's Vault")
+    assert scryfall.resolver.ist_unbekannt("Gibt es nicht")
+
+
+def test_every_spelling_of_a_name_gets_its_card(scryfall):
+    ergebnis = cs.fetch_card_infos_by_name(["Karte 7", "karte 7", "KARTE 7 ", "Tippfehler",
+                                            "tippfehler"])
+    assert scryfall.bloecke == [2]                          # je Name nur einmal gefragt
+    for name in ("Karte 7", "karte 7", "KARTE 7 "):
+        assert ergebnis[name]["scryfall_id"] == "id-karte-7"
+    assert ergebnis["Tippfehler"] is None and ergebnis["tippfehler"] is None
+
+
+def test_failed_block_keeps_the_other_blocks(scryfall):
+    scryfall.kaputt = {"Karte 100"}
+    namen = [f"Karte {i}" for i in range(160)]
+    ergebnis = cs.fetch_card_infos_by_name(namen)
+    assert ergebnis["Karte 5"]["scryfall_id"] == "id-karte-5"       # Block 1
+    assert ergebnis["Karte 155"]["scryfall_id"] == "id-karte-155"   # Block 3
+    assert ergebnis["Karte 100"] is None                             # Block 2 gescheitert
+    assert not scryfall.resolver.ist_unbekannt("Karte 100")
+
+
+def test_unknown_names_are_remembered(scryfall):
+    assert cs.fetch_card_info_by_name("Tippfehler") is None
+    assert cs.fetch_card_info_by_name("tippfehler") is None
+    cs.fetch_card_infos_by_name(["Tippfehler", "Karte 1"])
+    assert scryfall.aufrufe["/cards/named"] == 1           # nur der erste Versuch
+    assert scryfall.bloecke == [1]                          # nur „Karte 1“
+
+
+def test_session_is_reused(scryfall):
+    for i in range(5):
+        cs.fetch_card_info_by_name(f"Karte {i}")
+    assert scryfall.resolver.session.adapters["http://"].poolmanager.pools
+    assert scryfall.aufrufe["/cards/named"] == 5
+
+
+def test_rate_limit_and_server_errors_are_retried(scryfall):
+    scryfall.stoerungen = [429, 503]
+    assert cs.fetch_card_info_by_name("Karte 7")["scryfall_id"] == "id-karte-7"
+    assert scryfall.aufrufe["/cards/named"] == 3
+
+
+def test_gives_up_after_last_attempt(scryfall, capsys):
+    scryfall.stoerungen = [500, 500, 500]
+    assert cs.fetch_card_info_by_name("Karte 7") is None
+    assert "Fehler beim Abrufen" in capsys.readouterr().out
+    assert not scryfall.resolver.ist_unbekannt("Karte 7")  # Störung ≠ unbekannt
+
+
+def test_requests_keep_minimum_interval(scryfall):
+    import time
+    scryfall.resolver.abstand = 0.05
+    beginn = time.monotonic()
+    for _ in range(4):
+        cs.fetch_card_info("id-karte-1")
+    assert time.monotonic() - beginn >= 0.15
+
+
+def test_autocomplete_and_lookup_by_id(scryfall):
+    assert cs.autocomplete_names("Fire") == ["Fire // Ice"]
+    assert cs.fetch_card_info("id-karte-3")["name"] == "Karte 3"
+    assert cs.fetch_card_info("id-unbekannt") is None
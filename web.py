@@ -13,6 +13,7 @@ from flask import (
     jsonify,
     session,
     Response,
+    send_file,
 )
 import csv
 import io
@@ -33,11 +34,12 @@ from TCGInventory.lager_manager import (
     list_folders,
 )
 from TCGInventory.card_scanner import (
-    fetch_card_info_by_name,
+    fetch_card_infos_by_name,
     autocomplete_names,
     fetch_variants,
     find_variant,
     find_by_identity,
+    image_urls_for_names,
 )
 from TCGInventory.dragonshield import (
     normalize_set_code,
@@ -64,6 +66,7 @@ from TCGInventory import bookkeeping
 from TCGInventory import backup_status
 from TCGInventory import build_card_db
 from TCGInventory import card_scanner
+from TCGInventory import schreiber
 from TCGInventory.api_v1 import api_v1
 from pathlib import Path
 from werkzeug.utils import secure_filename
@@ -706,6 +709,18 @@ def _process_bulk_upload(form_data: dict, json_bytes: bytes | None, csv_bytes: b
         total = len(entries) if entries else 1
         added_any = False
 
+        # Bloße Namen (JSON/Textfeld) vorab gesammelt nachschlagen: was lokal
+        # fehlt, geht gebündelt an Scryfall statt als eine Anfrage je Zeile.
+        names = []
+        for kind, item in entries:
+            if kind == "json":
+                name = item.get("name") if isinstance(item, dict) else item if isinstance(item, str) else None
+                if name:
+                    names.append(name)
+            elif kind == "text":
+                names.append(item)
+        infos = fetch_card_infos_by_name(names) if names else {}
+
         for idx, (kind, item) in enumerate(entries):
             if kind == "json":
                 entry = item
@@ -713,7 +728,7 @@ def _process_bulk_upload(form_data: dict, json_bytes: bytes | None, csv_bytes: b
                 if not name:
                     BULK_PROGRESS = int((idx + 1) / total * 100)
                     continue
-                info = fetch_card_info_by_name(name) or {}
+                info = infos.get(name) or {}
                 UPLOAD_QUEUE.append(
                     {
                         "name": info.get("name", name),
@@ -795,7 +810,7 @@ def _process_bulk_upload(form_data: dict, json_bytes: bytes | None, csv_bytes: b
                 added_any = True
             else:
                 name = item
-                info = fetch_card_info_by_name(name) or {}
+                info = infos.get(name) or {}
                 UPLOAD_QUEUE.append(
                     {
                         "name": info.get("name", name),
@@ -1129,6 +1144,11 @@ def bulk_add_view():
 
                 data = json.load(json_file)
                 if isinstance(data, list):
+                    infos = fetch_card_infos_by_name(
+                        (e.get("name") if isinstance(e, dict) else str(e))
+                        for e in data
+                        if (e.get("name") if isinstance(e, dict) else e)
+                    )
                     for entry in data:
                         if isinstance(entry, dict):
                             name = entry.get("name")
@@ -1153,7 +1173,7 @@ def bulk_add_view():
                             foil_flag = False
                         if not name:
                             continue
-                        info = fetch_card_info_by_name(name)
+                        info = infos.get(name)
                         variant = None
                         if set_row:
                             variant = find_variant(name, set_row, card_no or None)
@@ -1508,10 +1528,13 @@ def sales_export_view():
         "gebuehren": sum(m["gebuehren"] for m in months),
         "auszahlung": sum(m["auszahlung"] for m in months),
     }
+    dims = sales_export.cube_dimensions(request.args.getlist("merkmal"))
+    cube = sales_export.fetch_cube(DB_FILE, start, end, dims)
     return render_template(
         "sales_export.html",
         start=start, end=end, months=months, totals=totals,
         preset=request.args.get("zeitraum", ""),
+        dims=dims, cube=cube, dimensions=sales_export.CUBE_DIMENSIONS,
     )
 
 
@@ -1547,10 +1570,29 @@ def sales_export_positions_csv():
     )
 
 
+@app.route("/auswertung/kennzahlen.csv")
+@login_required
+def sales_export_cube_csv():
+    """CSV: quantity, revenue and orders per chosen combination of dimensions."""
+    start, end = _export_period()
+    dims = sales_export.cube_dimensions(request.args.getlist("merkmal"))
+    rows = sales_export.fetch_cube(DB_FILE, start, end, dims)
+    return _csv_response(
+        sales_export.build_cube_csv(rows, dims),
+        sales_export.export_filename("kennzahlen", start, end),
+    )
+
+
 # ---------------------------------------------------------------------------
 # Buchhaltung (WP3b) — Journal ist append-only, Korrektur nur per Storno.
 # Porto wird ausschliesslich beim Briefmarkenkauf gebucht, nie beim Versand.
 # ---------------------------------------------------------------------------
+#: Buchungen je Seite im chronologischen Journal.
+JOURNAL_JE_SEITE = 100
+#: Bestellungen je Seite in der Ansicht „Nach Bestellung“.
+BESTELLUNGEN_JE_SEITE = 50
+
+
 @app.route("/buchhaltung")
 @login_required
 def bookkeeping_view():
@@ -1559,12 +1601,31 @@ def bookkeeping_view():
     bis = request.args.get("bis", "").strip()
     art = request.args.get("art", "").strip()
     kategorie = request.args.get("kategorie", "").strip()
-    grouped = bookkeeping.journal_by_order()
+    ansicht = request.args.get("ansicht", "bestellungen")
+    # Nur die gewählte Ansicht laden.
+    bookings, vor_nr, weiter_nr = [], None, None
+    grouped = {"orders": [], "sonstige": [], "seite": 1, "seiten": 1, "gesamt": 0}
+    if ansicht == "journal":
+        vor = request.args.get("vor", "").strip()
+        vor_nr = int(vor) if vor.isdigit() else None
+        # Eine Buchung mehr holen: zeigt an, ob es eine ältere Seite gibt.
+        bookings = bookkeeping.list_bookings(limit=JOURNAL_JE_SEITE + 1, von=von, bis=bis,
+                                             art=art, kategorie=kategorie, vor_nr=vor_nr)
+        if len(bookings) > JOURNAL_JE_SEITE:
+            bookings = bookings[:JOURNAL_JE_SEITE]
+            weiter_nr = bookings[-1]["lfd_nr"]
+    else:
+        seite = request.args.get("seite", "").strip()
+        grouped = bookkeeping.journal_by_order(
+            von=von, bis=bis, seite=int(seite) if seite.isdigit() else 1,
+            je_seite=BESTELLUNGEN_JE_SEITE)
     return render_template(
         "bookkeeping.html",
-        bookings=bookkeeping.list_bookings(von=von, bis=bis, art=art, kategorie=kategorie),
+        bookings=bookings,
+        vor_nr=vor_nr, weiter_nr=weiter_nr,
         order_groups=grouped["orders"],
         other_bookings=grouped["sonstige"],
+        seite=grouped["seite"], seiten=grouped["seiten"], order_gesamt=grouped["gesamt"],
         bookable=bookkeeping.bookable_orders(),
         vor_beginn=bookkeeping.count_vor_geschaeftsbeginn(),
         geschaeftsbeginn=bookkeeping.GESCHAEFTSBEGINN,
@@ -1572,7 +1633,7 @@ def bookkeeping_view():
         markenarten=bookkeeping.list_markenarten(only_active=True),
         kategorien=bookkeeping.KATEGORIEN_EINNAHME + bookkeeping.KATEGORIEN_AUSGABE,
         filter_von=von, filter_bis=bis, filter_art=art, filter_kategorie=kategorie,
-        ansicht=request.args.get("ansicht", "bestellungen"),
+        ansicht=ansicht,
         cent_to_de=bookkeeping.cent_to_de,
     )
 
@@ -1625,7 +1686,7 @@ def bookkeeping_take_order(order_id: int):
             if upload and upload.filename:
                 try:
                     beleg_id = bookkeeping.save_receipt(
-                        upload.filename, upload.read(), upload.mimetype or "")
+                        upload.filename, upload.stream, upload.mimetype or "")
                 except ValueError as exc:
                     flash(f"Beleg abgelehnt: {exc}", "error")
             datum = datetime.now().strftime("%Y-%m-%d")
@@ -1641,6 +1702,34 @@ def bookkeeping_take_order(order_id: int):
     return redirect(url_for("bookkeeping_view"))
 
 
+@app.route("/buchhaltung/uebernehmen", methods=["POST"])
+@login_required
+def bookkeeping_take_orders():
+    """Ausgewählte (oder mit ``alle`` sämtliche) offenen Bestellungen in einem
+    Rutsch übernehmen — ohne Frankierung, die bleibt Einzelübernahme."""
+    if request.form.get("alle"):
+        order_ids = None
+    else:
+        order_ids = [int(i) for i in request.form.getlist("order_id") if i.isdigit()]
+        if not order_ids:
+            flash("Keine Bestellung ausgewählt.", "warning")
+            return redirect(url_for("bookkeeping_view"))
+    try:
+        ergebnisse = bookkeeping.book_orders(order_ids)
+    except sqlite3.Error as exc:
+        flash(f"Übernahme nicht möglich: {exc}", "error")
+        return redirect(url_for("bookkeeping_view"))
+    ok = [e for e in ergebnisse if e["ok"]]
+    flash(f"{len(ok)} Bestellung(en) übernommen – "
+          f"{sum(len(e['buchung_ids']) for e in ok)} Buchung(en) erstellt."
+          + (f" {sum(1 for e in ok if e['hinweise'])} davon in der Prüfliste."
+             if any(e["hinweise"] for e in ok) else ""))
+    for e in ergebnisse:
+        if not e["ok"]:
+            flash(f"Bestellung #{e['order_id']}: {e['fehler']}", "warning")
+    return redirect(url_for("bookkeeping_view"))
+
+
 @app.route("/buchhaltung/storno/<int:buchung_id>", methods=["POST"])
 @login_required
 def bookkeeping_storno(buchung_id: int):
@@ -1687,13 +1776,17 @@ def bookkeeping_expense():
         if upload and upload.filename:
             try:
                 beleg_id = bookkeeping.save_receipt(
-                    upload.filename, upload.read(), upload.mimetype or "")
+                    upload.filename, upload.stream, upload.mimetype or "")
             except ValueError as exc:
                 flash(f"Beleg abgelehnt: {exc}", "error")
                 return redirect(url_for("bookkeeping_expense"))
 
-        bookkeeping.add_booking(datum, "ausgabe", kategorie, betrag_cent,
-                                beschreibung, beleg_id=beleg_id)
+        try:
+            bookkeeping.add_booking(datum, "ausgabe", kategorie, betrag_cent,
+                                    beschreibung, beleg_id=beleg_id)
+        except ValueError as exc:
+            flash(f"Ausgabe nicht gebucht: {exc}", "error")
+            return redirect(url_for("bookkeeping_expense"))
         flash("Ausgabe gebucht.")
         return redirect(url_for("bookkeeping_view"))
 
@@ -1703,18 +1796,33 @@ def bookkeeping_expense():
 @app.route("/buchhaltung/beleg/<int:beleg_id>")
 @login_required
 def bookkeeping_receipt(beleg_id: int):
-    """Belegdatei anzeigen (unverändert ausgeliefert)."""
+    """Belegdatei anzeigen (unverändert, direkt von der Platte gestreamt)."""
     info = bookkeeping.get_receipt(beleg_id)
     if not info or not Path(info["pfad"]).exists():
         flash("Beleg nicht gefunden", "error")
         return redirect(url_for("bookkeeping_view"))
-    return Response(
-        Path(info["pfad"]).read_bytes(),
+    return send_file(
+        info["pfad"],
         mimetype=info["mime"] or "application/octet-stream",
-        headers={"Content-Disposition": f'inline; filename="{info["original_name"]}"'},
+        download_name=info["original_name"],
+        conditional=True,
     )
 
 
+@app.route("/buchhaltung/beleg/<int:beleg_id>/vorschau")
+@login_required
+def bookkeeping_receipt_preview(beleg_id: int):
+    """Vorschaubild eines Belegs für Listen (statt des vollen Scans)."""
+    info = bookkeeping.get_receipt(beleg_id)
+    if not info or not info["vorschau_pfad"] or not Path(info["vorschau_pfad"]).exists():
+        return Response("Keine Vorschau", status=404)
+    antwort = send_file(info["vorschau_pfad"], mimetype="image/jpeg", conditional=True)
+    # Inhaltsadressiert: dieselbe URL zeigt nie ein anderes Bild.
+    antwort.cache_control.max_age = 86400
+    antwort.cache_control.private = True
+    return antwort
+
+
 # --- Briefmarken -----------------------------------------------------------
 @app.route("/buchhaltung/briefmarken")
 @login_required
@@ -1749,7 +1857,7 @@ def bookkeeping_stamp_buy():
     if upload and upload.filename:
         try:
             beleg_id = bookkeeping.save_receipt(
-                upload.filename, upload.read(), upload.mimetype or "")
+                upload.filename, upload.stream, upload.mimetype or "")
         except ValueError as exc:
             flash(f"Beleg abgelehnt: {exc}", "error")
             return redirect(url_for("bookkeeping_stamps"))
@@ -1812,10 +1920,26 @@ def bookkeeping_payments():
             flash("Auszahlung erfasst – jetzt Bestellungen zuordnen.")
         return redirect(url_for("bookkeeping_payments"))
 
+    auszahlungen = bookkeeping.list_auszahlungen()
+    orders = bookkeeping.open_payment_orders()
+    # Zuordnungsvorschlag für den noch offenen Teil einer Auszahlung.
+    vorschlag = None
+    gewaehlt = request.args.get("vorschlag", "").strip()
+    ziel = next((a for a in auszahlungen if str(a["id"]) == gewaehlt), None)
+    if ziel:
+        toleranz = bookkeeping.to_cent(request.args.get("toleranz", ""))
+        vorschlag = bookkeeping.suggest_payout_orders(
+            -ziel["differenz_cent"], toleranz_cent=toleranz, orders=orders)
+        vorschlag["auszahlung"] = ziel
+        if not vorschlag["gefunden"]:
+            flash("Keine passende Auswahl offener Bestellungen gefunden"
+                  + ("" if vorschlag["vollstaendig"] else " (Suche abgebrochen)")
+                  + " – bitte von Hand zuordnen.", "warning")
     return render_template(
         "payments.html",
-        auszahlungen=bookkeeping.list_auszahlungen(),
-        orders=bookkeeping.open_payment_orders(),
+        auszahlungen=auszahlungen,
+        orders=orders,
+        vorschlag=vorschlag,
         cent_to_de=bookkeeping.cent_to_de,
     )
 
@@ -1870,10 +1994,29 @@ def bookkeeping_summary_view():
         "bookkeeping_summary.html",
         start=start, end=end,
         result=bookkeeping.summary(start, end),
+        jahre=bookkeeping.jahresuebersicht(),
+        laufendes_jahr=str(datetime.now().year),
         cent_to_de=bookkeeping.cent_to_de,
     )
 
 
+@app.route("/buchhaltung/abschluss", methods=["POST"])
+@login_required
+def bookkeeping_close_year():
+    """Abgelaufenes Geschäftsjahr abschließen (festschreiben)."""
+    jahr = request.form.get("jahr", "").strip()
+    try:
+        abschluss = bookkeeping.close_year(jahr)
+    except ValueError as exc:
+        flash(f"Jahresabschluss nicht möglich: {exc}", "error")
+        return redirect(url_for("bookkeeping_summary_view"))
+    nr = abschluss["lfd_nr"]
+    flash(f"Geschäftsjahr {jahr} abgeschlossen – "
+          + (f"Buchungen #{nr['erste']} bis #{nr['letzte']} sind festgeschrieben."
+             if nr["anzahl"] else "es enthielt keine Buchungen."))
+    return redirect(url_for("bookkeeping_summary_view", jahr=jahr))
+
+
 @app.route("/buchhaltung/auswertung.csv")
 @login_required
 def bookkeeping_summary_csv():
@@ -1983,7 +2126,8 @@ def _kartendaten_info() -> dict:
     """Größe, Kartenzahl und Stand der lokalen Kartendatenbank."""
     pfad = Path(__file__).resolve().parent / "data" / "default-cards.db"
     info = {"vorhanden": pfad.exists(), "pfad": str(pfad),
-            "groesse_mb": 0.0, "anzahl": 0, "stand": None}
+            "groesse_mb": 0.0, "anzahl": 0, "stand": None,
+            "arbeitsmenge": card_scanner.arbeitsmenge_statistik()}
     if not pfad.exists():
         return info
     info["groesse_mb"] = round(pfad.stat().st_size / 1024 / 1024, 1)
@@ -2001,6 +2145,22 @@ def _kartendaten_info() -> dict:
     return info
 
 
+def _lade_arbeitsmenge() -> None:
+    """Kartendaten der Sets im Bestand vorab in den Speicher holen.
+
+    Läuft beim Start im Hintergrund; bis sie fertig ist, beantwortet SQLite
+    die Anfragen wie bisher.
+    """
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            sets = [r[0] for r in conn.execute(
+                "SELECT DISTINCT lower(set_code) FROM cards "
+                "WHERE set_code IS NOT NULL AND set_code != ''")]
+    except sqlite3.Error:
+        return
+    card_scanner.aktiviere_arbeitsmenge(sets)
+
+
 def _aktualisiere_kartendaten(erzwingen: bool) -> None:
     """Hintergrundlauf: Bulkdaten streamen und Datenbank atomar tauschen."""
     def melde(anzahl, text):
@@ -2053,6 +2213,13 @@ def card_data_status():
     return jsonify(CARDDATA_STATUS)
 
 
+@app.route("/system/schreiber/status")
+@login_required
+def writer_status():
+    """Kennzahlen des Datenbank-Schreibers (Warteschlange, Sperrwartezeit)."""
+    return jsonify(schreiber.statistik())
+
+
 @app.route("/upload_database", methods=["GET", "POST"])
 @login_required
 def upload_database():
@@ -2109,7 +2276,8 @@ def upload_database():
                 with sqlite3.connect(str(temp_path)) as conn:
                     cursor = conn.cursor()
                     # Check if it has a cards table
-                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='cards'")
+                    # Aus all_cards gebaute Datenbanken führen ``cards`` als Sicht.
+                    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name='cards'")
                     if not cursor.fetchone():
                         # Remove invalid file
                         temp_path.unlink()
@@ -2122,7 +2290,10 @@ def upload_database():
                 flash(f"Invalid SQLite database file: {e}", "error")
                 return redirect(request.url)
             
-            # Validation passed, replace the actual database file
+            # Validation passed, replace the actual database file. The
+            # read-only connections are opened immutable and would keep
+            # reading the old file, so drop them first.
+            card_scanner.reset_card_database()
             if db_path.exists():
                 db_path.unlink()
             temp_path.rename(db_path)
@@ -2148,7 +2319,7 @@ def list_orders():
     # Calculate cutoff date using configured setting
     # Note: Using datetime.now() for consistency with existing date_received values in the database
     # which were stored using local time. Consider migrating to UTC in the future.
-    cutoff_date = (datetime.now() - timedelta(days=ORDER_CUTOFF_DAYS)).isoformat()
+    cutoff_date = (datetime.now() - timedelta(days=ORDER_CUTOFF_DAYS)).date().isoformat()
     
     with sqlite3.connect(DB_FILE) as conn:
         conn.row_factory = sqlite3.Row
@@ -2161,8 +2332,8 @@ def list_orders():
                    o.amount_versand, o.amount_gesamt, o.quelle, o.verkaufskanal
             FROM orders o
             WHERE o.status = 'open'
-              AND COALESCE(o.email_date, o.date_received) >= ?
-            ORDER BY COALESCE(o.email_date, o.date_received) DESC
+              AND o.order_date >= ?
+            ORDER BY o.order_date DESC, display_date DESC
             """,
             (cutoff_date,)
         )
@@ -2226,7 +2397,9 @@ def list_orders():
     return render_template(
         "orders.html",
         orders=order_details,
-        polling_enabled=polling_enabled
+        polling_enabled=polling_enabled,
+        schedule=service.schedule_status(),
+        today=datetime.now().date(),
     )
 
 
@@ -2272,8 +2445,8 @@ def bestellungen_nachlesen():
 
     Die Buchhaltung bucht nur, was in der Bestellmail steht. Aelteren
     Bestellungen fehlen die Betraege — beim Einlesen wurden sie damals noch
-    nicht erfasst. Die Roh-Mail ist nicht gespeichert, die Gmail-Message-ID
-    aber schon: damit laesst sich dieselbe Quelle ein zweites Mal lesen.
+    nicht erfasst. Ueber die Gmail-Message-ID laesst sich dieselbe Quelle ein
+    zweites Mal lesen: aus dem Mailarchiv, sonst bei Gmail.
 
     Standardmaessig nur Vorschau. Geschrieben wird erst auf ausdruecklichen
     Knopfdruck, und auch dann werden **nur leere** Felder gefuellt.
@@ -2373,7 +2546,7 @@ def verkaufte_bestellungen():
                    COALESCE(o.date_completed, o.email_date, o.date_received) AS abschluss
             FROM orders o
             WHERE {bedingung}
-            ORDER BY abschluss DESC, o.id DESC
+            ORDER BY o.completed_date DESC, abschluss DESC, o.id DESC
             LIMIT ? OFFSET ?
             """,
             werte + [VERKAUFTE_JE_SEITE, (seite - 1) * VERKAUFTE_JE_SEITE],
@@ -2446,7 +2619,8 @@ def _order_item_candidates(cursor, card_name):
 
     Used only to present a manual choice for unresolved/ambiguous positions —
     never to auto-decide. Exact name matches first; if none, a name substring
-    search provides suggestions (the user picks).
+    search provides suggestions (the user picks). Missing images are filled in
+    from the local card database.
     """
     cols = ("id, name, set_code, language, foil, condition, collector_number, "
             "storage_code, image_url, quantity")
@@ -2463,6 +2637,12 @@ def _order_item_candidates(cursor, card_name):
             (f"%{card_name}%",),
         )
         rows = [dict(r) for r in cursor.fetchall()]
+    # Candidates without a stored image get one from the card database.
+    missing = [r["name"] for r in rows if not r["image_url"]]
+    if missing:
+        images = image_urls_for_names(missing)
+        for r in rows:
+            r["image_url"] = r["image_url"] or images.get(r["name"])
     return rows
 
 
@@ -2888,6 +3068,7 @@ def toggle_order_polling():
 
 if __name__ == "__main__":
     init_db()
+    threading.Thread(target=_lade_arbeitsmenge, daemon=True).start()
     
     # Start the order ingestion service
     order_service = get_order_service()